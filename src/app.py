@@ -10,6 +10,11 @@ from validator import Validator
 from forecaster import Forecaster
 import os
 from business_classifier import BusinessClassifier
+from line_items import find_row
+from period_axis import get_period_axis
+from artifact_store import ArtifactStore, LazyArtifacts
+from compute_cache import ComputeCache, artifact_fingerprint
+import pipeline_jobs
 
 # Lấy thư mục gốc ('hvn') thay vì thay đổi CWD toàn cục do dễ làm lỗi Streamlit Watchdog
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -60,42 +65,85 @@ COLORS = {
     'teal': '#43aa8b',
 }
 
-@st.cache_data
-def load_data(_v=8):  # bump _v to invalidate old cache
-    import os
-    import json
-    dfs = {}
-    calc_dir = os.path.join(PROJECT_ROOT, "output/2_calculated")
-    
-    if os.path.exists(calc_dir):
-        for f in os.listdir(calc_dir):
-            name = f.replace('.csv', '').replace('.json', '')
-            if f.endswith('.csv'):
-                dfs[name] = pd.read_csv(os.path.join(calc_dir, f))
-            elif f.endswith('.json'):
-                with open(os.path.join(calc_dir, f), 'r', encoding='utf-8') as file:
-                    dfs[name] = json.load(file)
-    else:
-        # Fallback if pipeline not run yet
-        st.warning("Dữ liệu chưa có sẵn trong output/. Vui lòng bấm 'Chạy Pipeline' ở sidebar.")
-        
-    cls_file = os.path.join(PROJECT_ROOT, "output/3_classification/business_model.json")
-    if os.path.exists(cls_file):
-        with open(cls_file, 'r', encoding='utf-8') as file:
-            dfs['BUSINESS_MODEL'] = json.load(file)
-            
+CALC_DIR = os.path.join(PROJECT_ROOT, "output/2_calculated")
+CLASS_DIR = os.path.join(PROJECT_ROOT, "output/3_classification")
+
+
+@st.cache_resource
+def get_compute_cache():
+    """Cache kết quả tính toán dùng chung cho mọi session (lưu bền ở output/.compute_cache)."""
+    return ComputeCache(os.path.join(PROJECT_ROOT, "output/.compute_cache"))
+
+
+def data_version():
+    """Fingerprint nội dung artifact: đổi khi pipeline ghi dữ liệu mới (thay cho việc bump _v thủ công)."""
+    return artifact_fingerprint([CALC_DIR, CLASS_DIR])
+
+
+@st.cache_resource(max_entries=4)
+def load_data(version):
+    """
+    Registry artifact nạp lười cho một phiên bản dữ liệu: chỉ liệt kê tên file,
+    mỗi bảng được đọc lần đầu tab cần đến rồi ghi nhớ (dùng chung mọi session).
+    """
+    dfs = LazyArtifacts([ArtifactStore(CALC_DIR)])
+    class_store = ArtifactStore(CLASS_DIR)
+    if class_store.exists("business_model"):
+        dfs.register('BUSINESS_MODEL', class_store, "business_model")
     return dfs
 
-@st.cache_data
-def load_forecaster_data(_dfs):
-    f = Forecaster(_dfs)
-    return f.run_all(), f
+def _auto_refresh(func):
+    """Chạy lại riêng khối giao diện mỗi giây (st.fragment) nếu bản Streamlit hỗ trợ."""
+    fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+    return fragment(run_every=1.0)(func) if fragment else func
+
+
+STAGE_ICONS = {'pending': '⏳', 'running': '🔄', 'done': '✅', 'failed': '❌'}
+
+
+@_auto_refresh
+def pipeline_job_panel():
+    """Tiến độ job pipeline nền; khi job xong mới nạp lại dữ liệu (hoán đổi trọn bộ)."""
+    job_id = st.session_state.get('pipeline_job')
+    if not job_id:
+        return
+    info = pipeline_jobs.status(PROJECT_ROOT, job_id)
+    total = info['total'] or 1
+    st.progress(info['done'] / total, text=f"Job `{job_id}` — {info['done']}/{info['total']} stage "
+                                           f"({info['elapsed']:.1f}s)")
+    for s in info['stages']:
+        detail = ''
+        if s['state'] in ('done', 'failed'):
+            detail = ' — cache hit' if s['cached'] else f" — {s['duration']:.2f}s"
+        st.caption(f"{STAGE_ICONS[s['state']]} Stage {s['name']}: {s['title']}{detail}")
+
+    if info['state'] in ('succeeded', 'failed'):
+        old_version = st.session_state.pop('pipeline_job_version', None)
+        st.session_state.pop('pipeline_job', None)
+        if info['state'] == 'succeeded':
+            # Dữ liệu mới có fingerprint mới; bỏ luôn các kết quả của bộ dữ liệu cũ
+            if old_version and data_version() != old_version:
+                get_compute_cache().invalidate(dataset=old_version)
+            st.session_state['pipeline_job_result'] = ('success', f"Cập nhật dữ liệu thành công! ({info['elapsed']:.1f}s)")
+        else:
+            st.session_state['pipeline_job_result'] = ('error', f"Lỗi pipeline: {info['error']} (log: {info['log']})")
+        st.rerun()
+    elif getattr(st, 'fragment', None) is None and getattr(st, 'experimental_fragment', None) is None:
+        st.button("🔄 Cập nhật tiến độ", use_container_width=True)
+
+
+def cached_forecast(dfs, version, method, **params):
+    """Forecaster.<method>(**params) qua ComputeCache — khoá = fingerprint dữ liệu + tham số."""
+    return get_compute_cache().call(
+        version, f'forecaster.{method}',
+        lambda **kw: getattr(Forecaster(dfs), method)(**kw), **params
+    )
 
 def get_row_data(df, pattern):
-    row = df[df['Khoản mục'].str.contains(pattern, case=False, na=False, regex=True)]
-    if not row.empty:
+    row = find_row(df, pattern)
+    if row is not None:
         years = [c for c in df.columns if c != 'Khoản mục']
-        return pd.Series(row.iloc[0][years].values, index=years, dtype=float)
+        return pd.Series(row[years].values, index=years, dtype=float)
     return None
 
 def get_fi_row(fi, pattern):
@@ -124,24 +172,39 @@ def main():
     with st.sidebar:
         st.header("⚙️ Quản lý Dữ liệu")
         st.markdown("Hệ thống hoạt động với kiến trúc File-based Pipeline.")
-        if st.button("🚀 Chạy Pipeline Cập nhật Dữ liệu", use_container_width=True):
-            import subprocess
-            import sys
-            with st.spinner("Đang chạy pipeline... (vui lòng đợi vài giây)"):
-                try:
-                    pipe_script = os.path.join(PROJECT_ROOT, "src", "pipeline_runner.py")
-                    subprocess.run([sys.executable, pipe_script], cwd=PROJECT_ROOT, check=True)
-                    st.success("Cập nhật dữ liệu thành công!")
-                    load_data.clear() # Invalidate cache
-                    load_forecaster_data.clear()
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Lỗi pipeline: {e}")
+        # Pipeline chạy nền (pipeline_jobs): session không bị chặn, dữ liệu chỉ đổi khi job xong
+        active = pipeline_jobs.active_job(PROJECT_ROOT)
+        if st.button("🚀 Chạy Pipeline Cập nhật Dữ liệu", use_container_width=True, disabled=active is not None):
+            try:
+                job_id, created = pipeline_jobs.launch(PROJECT_ROOT)
+                active = job_id
+                if not created:
+                    st.info(f"Pipeline đang chạy (job `{job_id}`) — theo dõi tiến độ bên dưới.")
+            except Exception as e:
+                st.error(f"Lỗi pipeline: {e}")
+        # Job do session khác khởi chạy cũng được theo dõi ở đây
+        if active and st.session_state.get('pipeline_job') != active:
+            st.session_state['pipeline_job'] = active
+            st.session_state['pipeline_job_version'] = data_version()
+        result = st.session_state.pop('pipeline_job_result', None)
+        if result:
+            (st.success if result[0] == 'success' else st.error)(result[1])
+        if st.session_state.get('pipeline_job'):
+            pipeline_job_panel()
+        if st.button("🧹 Xoá cache tính toán", use_container_width=True,
+                     help="Huỷ toàn bộ kết quả Forecaster/Diagnostics đã lưu (RAM + đĩa)"):
+            removed = get_compute_cache().clear()
+            load_data.clear()
+            st.success(f"Đã xoá {removed} kết quả trong cache.")
 
     st.title("Vietnam Airlines (HVN) — Financial Analytics Dashboard")
 
     try:
-        dfs = load_data()
+        version = data_version()
+        if not os.path.exists(CALC_DIR):
+            # Fallback if pipeline not run yet
+            st.warning("Dữ liệu chưa có sẵn trong output/. Vui lòng bấm 'Chạy Pipeline' ở sidebar.")
+        dfs = load_data(version)
         if not dfs:
             return
     except Exception as e:
@@ -156,29 +219,18 @@ def main():
                  "*(Khuyến nghị: Chuyển trọng tâm phân tích từ Định giá Cổ phiếu sang Dòng tiền & Thanh khoản)*")
 
 
+    # Các bảng còn lại được lấy trong từng tab (dfs nạp lười → chỉ đọc khi tab được mở)
     bs = dfs.get('BALANCE SHEET')
-    is_df = dfs.get('INCOME STATEMENT')
-    cf = dfs.get('CASH FLOW STATEMENT')
-    fi = dfs.get('FINANCIAL INDEX')
-    dupont = dfs.get('DUPONT')
-    dupont_impact = dfs.get('DUPONT_IMPACT')
-    dupont_betas = dfs.get('DUPONT_BETAS', {})
-    dupont_roa = dfs.get('DUPONT_ROA')
-    dupont_roic = dfs.get('DUPONT_ROIC')
-    dupont_impact_roa = dfs.get('DUPONT_IMPACT_ROA')
-    dupont_impact_roic = dfs.get('DUPONT_IMPACT_ROIC')
-    dupont_betas_roa = dfs.get('DUPONT_BETAS_ROA', {})
-    dupont_betas_roic = dfs.get('DUPONT_BETAS_ROIC', {})
-    cash_inout = dfs.get('CASH_INOUT')
-    liquidity_cf = dfs.get('LIQUIDITY_CASHFLOW')
-    anomaly_numeric = dfs.get('ANOMALY_NUMERIC', {})
-    years = [c for c in bs.columns if c != 'Khoản mục']
-
-    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs([
+    years = get_period_axis(bs).periods
+
+    # Chỉ tab đang chọn được dựng (st.tabs dựng cả 8 tab ở mọi lần rerun)
+    tab_labels = [
         "📊 Cơ cấu Tài chính", "🔍 Chất lượng BCTC", "💡 Kết luận Mẫu hình",
         "⚡ Hiệu suất Mẫu hình", "🤖 Phân tích Nâng cao", "📁 Bảng dữ liệu", "📄 Báo cáo Tổng hợp",
         "🧪 Kiểm định Thống kê"
-    ])
+    ]
+    active_tab = st.radio("Trang", tab_labels, horizontal=True, key='active_tab', label_visibility='collapsed')
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = [active_tab == label for label in tab_labels]
     
     bm_data = dfs.get('BUSINESS_MODEL', {})
     historical_models = bm_data.get('Lịch sử Mô hình', {})
@@ -194,7 +246,11 @@ def main():
     # ═══════════════════════════════════════════════════════════════════════
     # TAB 1: SURVIVAL DASHBOARD
     # ═══════════════════════════════════════════════════════════════════════
-    with tab1:
+    if tab1:
+        cf = dfs.get('CASH FLOW STATEMENT')
+        fi = dfs.get('FINANCIAL INDEX')
+        cash_inout = dfs.get('CASH_INOUT')
+        liquidity_cf = dfs.get('LIQUIDITY_CASHFLOW')
         st.header("Khả năng sinh tồn (Dòng tiền & Cấu trúc vốn)")
         col1, col2 = st.columns(2)
 
@@ -444,7 +500,7 @@ def main():
     # ═══════════════════════════════════════════════════════════════════════
     # TAB 3: KẾT LUẬN MẪU HÌNH
     # ═══════════════════════════════════════════════════════════════════════
-    with tab3:
+    if tab3:
         st.header("💡 Kết luận Mô hình Cốt lõi (5 năm)")
         
         col_c1, col_c2 = st.columns(2)
@@ -506,7 +562,18 @@ def main():
 
     # TAB 4: HIỆU SUẤT MẪU HÌNH (Operating)
     # ═══════════════════════════════════════════════════════════════════════
-    with tab4:
+    if tab4:
+        is_df = dfs.get('INCOME STATEMENT')
+        cf = dfs.get('CASH FLOW STATEMENT')
+        fi = dfs.get('FINANCIAL INDEX')
+        dupont_impact = dfs.get('DUPONT_IMPACT')
+        dupont_betas = dfs.get('DUPONT_BETAS', {})
+        dupont_roa = dfs.get('DUPONT_ROA')
+        dupont_roic = dfs.get('DUPONT_ROIC')
+        dupont_impact_roa = dfs.get('DUPONT_IMPACT_ROA')
+        dupont_impact_roic = dfs.get('DUPONT_IMPACT_ROIC')
+        dupont_betas_roa = dfs.get('DUPONT_BETAS_ROA', {})
+        dupont_betas_roic = dfs.get('DUPONT_BETAS_ROIC', {})
         st.header(f"Hiệu suất Mẫu hình: {core_model}")
         st.markdown(f"**Minh chứng cốt lõi:** {core_logic}")
         col3, col4 = st.columns(2)
@@ -851,7 +918,20 @@ def main():
         with c4:
             st.info("Khu vực Phân rã 3 nhân tố DuPont ROE đã bị vô hiệu hóa tự động. (Vốn chủ sở hữu âm gây nhiễu).")
 
-        # --- DuPont Impact (OLS Best-fit only — Shapley removed) ---
+        # --- DuPont Impact: Best-fit OLS (artifact của pipeline) hoặc Shapley (tính theo yêu cầu) ---
+        dupont_method = st.radio("Phương pháp phân rã DuPont", ['Best-fit OLS', 'Shapley'], horizontal=True,
+                                 help="Shapley: trung bình ảnh hưởng trên mọi thứ tự thay thế "
+                                      "(tổng các nhân tố đúng bằng Δ thực tế)")
+        if dupont_method == 'Shapley':
+            def _shapley_impacts(method):
+                calc = Calculator({k: dfs.get(k) for k in ('DUPONT_ROA', 'DUPONT_ROIC')})
+                calc.dupont_factor_impact(method=method)
+                return {k: v for k, v in calc.dfs.items() if k.startswith('DUPONT_IMPACT_')}
+            shapley = get_compute_cache().call(version, 'calculator.dupont_factor_impact',
+                                               _shapley_impacts, method='shapley')
+            dupont_impact_roa = shapley.get('DUPONT_IMPACT_ROA')
+            dupont_impact_roic = shapley.get('DUPONT_IMPACT_ROIC')
+
         def _render_dupont_impact(impact_df, betas_dict, metric_label):
             if impact_df is None:
                 st.info(f"Đang tính toán {metric_label} IMPACT...")
@@ -860,7 +940,7 @@ def main():
             best_label = betas_dict.get('best_perm', '?') if betas_dict else '?'
             fig_imp = go.Figure()
             color_cycle = [COLORS['green'], COLORS['cyan'], COLORS['orange'], COLORS['purple'], COLORS['teal']]
-            best_rows = impact_df[impact_df['Khoản mục'].str.startswith('[Best:')]
+            best_rows = impact_df[impact_df['Khoản mục'].str.startswith(('[Best:', '[Shapley]'))]
             for idx, (_, row) in enumerate(best_rows.iterrows()):
                 vals = row[impact_yrs].astype(float).values
                 short_name = row['Khoản mục'].split('] ')[1] if '] ' in row['Khoản mục'] else row['Khoản mục']
@@ -875,16 +955,17 @@ def main():
                     marker=dict(size=10, symbol='diamond')))
             ols_keys = [k for k in betas_dict if k.startswith('ols_')]
             ols_info = ' | '.join([f'{k[4:]}={betas_dict[k]:.3f}' for k in ols_keys])
+            method_txt = 'Shapley' if dupont_method == 'Shapley' else f'Best-fit: {best_label}'
             fig_imp.update_layout(barmode='group', **DARK_TEMPLATE,
-                title=f'Δ{metric_label} · Best-fit: {best_label} · OLS β: {ols_info}',
+                title=f'Δ{metric_label} · {method_txt} · OLS β: {ols_info}',
                 yaxis_title='%pts', legend=dict(orientation='h', y=-0.2, font=dict(size=10)))
             st.plotly_chart(fig_imp, use_container_width=True)
 
         # st.subheader("Phân rã ΔROE (Best-fit OLS)")
         # _render_dupont_impact(dupont_impact, dupont_betas, 'ROE')
-        st.subheader("Phân rã ΔROA — 4 nhân tố (Best-fit OLS)")
+        st.subheader(f"Phân rã ΔROA — 4 nhân tố ({dupont_method})")
         _render_dupont_impact(dupont_impact_roa, dupont_betas_roa, 'ROA')
-        st.subheader("Phân rã ΔROIC — 2 nhân tố (Best-fit OLS)")
+        st.subheader(f"Phân rã ΔROIC — 2 nhân tố ({dupont_method})")
         _render_dupont_impact(dupont_impact_roic, dupont_betas_roic, 'ROIC')
 
         # --- DuPont ROA 4 nhân tố chart ---
@@ -987,7 +1068,8 @@ def main():
     # ═══════════════════════════════════════════════════════════════════════
     # TAB 2: CHẤT LƯỢNG BCTC (Anomaly)
     # ═══════════════════════════════════════════════════════════════════════
-    with tab2:
+    if tab2:
+        anomaly_numeric = dfs.get('ANOMALY_NUMERIC', {})
         st.header("🔍 Chất lượng BCTC (Beneish · Altman · Sloan)")
 
         if anomaly_numeric:
@@ -1203,7 +1285,7 @@ def main():
     # ═══════════════════════════════════════════════════════════════════════
     # TAB 6: DATA TABLES
     # ═══════════════════════════════════════════════════════════════════════
-    with tab6:
+    if tab6:
         st.header("📁 Bảng dữ liệu chi tiết")
         table_choice = st.selectbox("Chọn bảng dữ liệu:", [
             'BS — Tỷ trọng (Vertical)',
@@ -1250,7 +1332,7 @@ def main():
     # ═══════════════════════════════════════════════════════════════════════
     # TAB 5: ĐỊNH GIÁ DOANH NGHIỆP (Enterprise Value)
     # ═══════════════════════════════════════════════════════════════════════
-    with tab5:
+    if tab5:
         st.header("📈 Định giá Doanh nghiệp — Enterprise Value Framework")
         st.markdown("""
 <div class="info-box">
@@ -1274,7 +1356,7 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
             with col_d2:
                 st.info(f"Đang áp dụng mức chiết khấu **{discount_val}%** vào mô hình EV/EBITDA History.")
 
-            f_results = forecaster_obj.run_all(discount=discount)
+            f_results = cached_forecast(dfs, version, 'run_all', discount=discount)
         except Exception as e:
             st.error(f"Lỗi khởi tạo module Forecaster: {e}")
             f_results = {}
@@ -1285,7 +1367,7 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
         stl_options = forecaster_obj.get_stl_series_options()
         sel_series = st.selectbox("Chọn chỉ số để phân rã:", stl_options, key='stl_select')
 
-        stl_result = forecaster_obj.stl_decomposition(sel_series)
+        stl_result = cached_forecast(dfs, version, 'stl_decomposition', series_name=sel_series)
         if stl_result:
             method_tag = stl_result.get('method', '')
             stl_years = list(stl_result['original'].index)
@@ -1375,21 +1457,31 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
             wacc_max = st.slider("WACC tối đa (%)", 12, 20, 16, step=1) / 100
             g_min = st.slider("EBITDA Growth tối thiểu (%)", -5, 3, -2, step=1) / 100
             g_max = st.slider("EBITDA Growth tối đa (%)", 3, 15, 8, step=1) / 100
-
-        dcf_result = forecaster_obj.dcf_sensitivity(
-            wacc_range=(wacc_min, wacc_max, 0.005),
-            ebitda_growth_range=(g_min, g_max, 0.005)
+            dcf_step = st.select_slider("Bước lưới (%)", options=[0.5, 0.25, 0.1, 0.05, 0.02], value=0.5,
+                                        help="Lưới càng dày càng mịn; ma trận được tính vector hoá nên vẫn tức thì") / 100
+            mask_singular = st.checkbox("Che ô kỳ dị (WACC ≤ g)", value=False,
+                                        help="Ẩn các ô mà Gordon Growth không xác định; mức gần kỳ dị được báo trong chú thích")
+
+        dcf_result = cached_forecast(
+            dfs, version, 'dcf_sensitivity',
+            wacc_range=(wacc_min, wacc_max, dcf_step),
+            ebitda_growth_range=(g_min, g_max, dcf_step)
         )
         with col_dcf2:
             if dcf_result and dcf_result['matrix'] is not None:
                 mat = dcf_result['matrix']
+                smap = dcf_result['singularity_map']
+                if mask_singular:
+                    mat = np.where(smap == 2, np.nan, mat)
+                # Lưới dày: bỏ nhãn từng ô (trình duyệt phải vẽ hàng chục nghìn chuỗi)
+                show_text = mat.size <= 2500
                 fig_dcf = go.Figure(go.Heatmap(
                     z=mat,
                     x=dcf_result['g_labels'],
                     y=dcf_result['wacc_labels'],
                     colorscale='RdYlGn',
-                    text=[[f'{v/1e9:.0f}' if not np.isnan(v) else 'N/A' for v in row] for row in mat],
-                    texttemplate='%{text}',
+                    text=[[f'{v/1e9:.0f}' if not np.isnan(v) else 'N/A' for v in row] for row in mat] if show_text else None,
+                    texttemplate='%{text}' if show_text else None,
                     showscale=True,
                     colorbar=dict(title='EV (tỷ VND)')
                 ))
@@ -1401,6 +1493,41 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
                     **DARK_TEMPLATE
                 )
                 st.plotly_chart(fig_dcf, use_container_width=True)
+                cond = dcf_result['condition_number']
+                st.caption(f"Ô kỳ dị (WACC ≤ g): {int((smap == 2).sum())} · Gần kỳ dị (< 0.5%): {int((smap == 1).sum())} · "
+                           f"Condition Number: {'∞' if np.isinf(cond) else f'{cond:,.0f}'}")
+
+        # ---- 5.3a MONTE CARLO VALUATION ----
+        with st.expander("🎲 Phân phối Giá mục tiêu — Monte Carlo (WACC, g, bội số, Oil & FX)"):
+            col_mc1, col_mc2 = st.columns([1, 3])
+            with col_mc1:
+                mc_paths = st.select_slider("Số path", options=[10_000, 50_000, 100_000, 200_000], value=100_000)
+                mc_seed = st.number_input("Seed", value=42, step=1)
+            mc_result = cached_forecast(dfs, version, 'monte_carlo_valuation', n_paths=mc_paths, seed=int(mc_seed))
+            with col_mc2:
+                if mc_result and mc_result['price'] is None:
+                    st.warning("Thiếu Nợ ròng / Số CP lưu hành: không quy đổi được EV sang Giá mục tiêu.")
+                    evs = mc_result['ev_summary']
+                    st.caption(f"EV (tỷ VND) — P5: {evs['p5'] / 1e9:,.0f} · P50: {evs['p50'] / 1e9:,.0f} · "
+                               f"P95: {evs['p95'] / 1e9:,.0f}")
+                elif mc_result:
+                    ps = mc_result['price_summary']
+                    fig_mc = go.Figure(go.Histogram(
+                        x=mc_result['price'], nbinsx=120,
+                        marker_color=COLORS['cyan'], opacity=0.7, name='Giá mục tiêu'
+                    ))
+                    for q, color in [('p5', 'rgba(233,69,96,0.8)'), ('p50', 'white'), ('p95', 'rgba(0,200,83,0.8)')]:
+                        fig_mc.add_vline(x=ps[q], line=dict(color=color, dash='dash'),
+                                         annotation_text=f"{q.upper()}: {ps[q]:,.0f}")
+                    fig_mc.update_layout(
+                        title=f"{mc_paths:,} path · P(VCSH âm) = {mc_result['prob_negative_equity']*100:.1f}%",
+                        xaxis_title='Giá mục tiêu (VND/cp)', yaxis_title='Số path',
+                        **DARK_TEMPLATE, height=320
+                    )
+                    st.plotly_chart(fig_mc, use_container_width=True)
+                    st.caption("Phân phối Oil/FX lấy từ kiểm định Phân phối (Diagnostics) nếu có.")
+                else:
+                    st.info("Không đủ dữ liệu Doanh thu/EBITDA để chạy Monte Carlo.")
 
         st.divider()
 
@@ -1423,16 +1550,23 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
             s_debt_ratio = st.slider("Tỷ lệ Nợ USD/Tổng nợ (%)", 50, 100, 80) / 100
             
             st.divider()
-            sensitivity_mode = st.radio("Chọn chỉ số hiển thị trên Ma trận:", ["Định giá (EV/EBITDA)", "Lợi nhuận ròng (Net Profit)"], index=0)
+            sensitivity_mode = st.radio("Chọn chỉ số hiển thị trên Ma trận:", ["Định giá (EV/EBITDA)", "EBITDA", "Lợi nhuận ròng (Net Profit)"], index=0)
             
             st.caption("Cấu hình dải chạy Ma trận:")
             o_min, o_max = st.slider("Dải giá Dầu ($)", 50, 150, (70, 110))
             f_min, f_max = st.slider("Dải tỷ giá (VND)", 24000, 28000, (25000, 27500), step=100)
+            s_points = st.select_slider("Độ phân giải (điểm/trục)", options=["Chuẩn", 100, 250, 500, 1000], value="Chuẩn",
+                                        help="Chuẩn: bước $5 và 100 VND. Lưới được tính vector hoá nên vẫn tức thì")
 
-        struct_result = forecaster_obj.structural_sensitivity(
+        if s_points == "Chuẩn":
+            struct_axes = dict(oil_range=(o_min, o_max, 5), fx_range=(f_min, f_max, 100))
+        else:
+            struct_axes = dict(oil_vals=np.linspace(o_min, o_max, s_points), fx_vals=np.linspace(f_min, f_max, s_points))
+        struct_result = cached_forecast(
+            dfs, version, 'structural_sensitivity',
             base_oil=s_base_oil, base_fx=s_base_fx,
             fuel_opex_ratio=s_fuel_ratio, usd_debt_ratio=s_debt_ratio,
-            oil_range=(o_min, o_max, 5), fx_range=(f_min, f_max, 100)
+            **struct_axes
         )
         
         with col_str2:
@@ -1471,21 +1605,35 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
                     title_s = 'Định giá EV/EBITDA theo kịch bản Chi phí & Tỷ giá'
                     z_label = 'EV/EBITDA (x)'
                     colorscale = 'RdYlGn_r'
-                    text_vals = [[f'{v:.1f}x' if not np.isnan(v) else 'N/A' for v in row] for row in mat_s]
+                    cell_fmt = '{:.1f}x'
+                elif sensitivity_mode == "EBITDA":
+                    mat_s = struct_result['ebitda_matrix'] / 1e9
+                    title_s = 'EBITDA (Ước tính tỷ VND) theo kịch bản Chi phí & Tỷ giá'
+                    z_label = 'EBITDA (tỷ VND)'
+                    colorscale = 'RdYlGn'
+                    cell_fmt = '{:+.0f}t'
                 else:
                     mat_s = struct_result['ni_matrix'] / 1e9 # Scale to tỷ VND
                     title_s = 'Lợi nhuận ròng (Ước tính tỷ VND) theo biến động vĩ mô'
                     z_label = 'NI (tỷ VND)'
                     colorscale = 'RdYlGn'
-                    text_vals = [[f'{v:+.0f}t' if not np.isnan(v) else 'N/A' for v in row] for row in mat_s]
+                    cell_fmt = '{:+.0f}t'
+                # Lưới dày: bỏ nhãn từng ô, dùng trục số để plotly tự chọn vạch chia
+                show_text = mat_s.size <= 2500
+                if show_text:
+                    text_vals = [[cell_fmt.format(v) if not np.isnan(v) else 'N/A' for v in row] for row in mat_s]
+                    x_s, y_s = struct_result['oil_labels'], struct_result['fx_labels']
+                else:
+                    text_vals = None
+                    x_s, y_s = struct_result['oil_vals'], struct_result['fx_vals']
 
                 fig_struct = go.Figure(go.Heatmap(
                     z=mat_s,
-                    x=struct_result['oil_labels'],
-                    y=struct_result['fx_labels'],
+                    x=x_s,
+                    y=y_s,
                     colorscale=colorscale,
                     text=text_vals,
-                    texttemplate='%{text}',
+                    texttemplate='%{text}' if show_text else None,
                     showscale=True,
                     colorbar=dict(title=z_label)
                 ))
@@ -1513,7 +1661,8 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
             unsafe_allow_html=True
         )
         
-        scenario_data = forecaster_obj.scenario_analysis(
+        scenario_data = cached_forecast(
+            dfs, version, 'scenario_analysis',
             base_oil=s_base_oil, base_fx=s_base_fx,
             fuel_opex_ratio=s_fuel_ratio, usd_debt_ratio=s_debt_ratio
         )
@@ -1652,7 +1801,7 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
     # ═══════════════════════════════════════════════════════════════════════
     # TAB 7: BÁO CÁO TỔNG HỢP
     # ═══════════════════════════════════════════════════════════════════════
-    with tab7:
+    if tab7:
         st.header("📄 Báo cáo Phân tích Tài chính Tổng hợp")
         
         report_path = os.path.join(PROJECT_ROOT, "bao_cao", "BaoCao_PhanTich_HVN.md")
@@ -1716,7 +1865,7 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
     # ═══════════════════════════════════════════════════════════════════════
     # TAB 8: KIỂM ĐỊNH THỐNG KÊ TOÀN DIỆN
     # ═══════════════════════════════════════════════════════════════════════
-    with tab8:
+    if tab8:
         st.header("🧪 Kiểm định Thống kê Toàn diện — Econometric Diagnostics")
         st.markdown(
             '<div class="info-box">'
@@ -1746,17 +1895,13 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
         diag_data = {}
         diag_dir = os.path.join(PROJECT_ROOT, "output/2.5_diagnostics")
         if os.path.exists(diag_dir):
-            import json as _json
-            combined_path = os.path.join(diag_dir, "ALL_DIAGNOSTICS.json")
-            if os.path.exists(combined_path):
-                with open(combined_path, 'r', encoding='utf-8') as _f:
-                    diag_data = _json.load(_f)
+            diag_data = ArtifactStore(diag_dir).load_json("ALL_DIAGNOSTICS") or {}
 
         # Fallback: check dfs keys prefixed with DIAG_
         if not diag_data:
-            for k, v in dfs.items():
+            for k in dfs:
                 if k.startswith('DIAG_'):
-                    diag_data[k.replace('DIAG_', '')] = v
+                    diag_data[k.replace('DIAG_', '')] = dfs[k]
 
         # If still no data, offer to run diagnostics
         if not diag_data:
@@ -1766,7 +1911,12 @@ Phương pháp: <b>EV/EBITDA Mean Reversion</b> + <b>DCF Terminal Value Integrat
                     try:
                         from diagnostics import DiagnosticsEngine
                         diag_engine = DiagnosticsEngine(dfs, alpha=alpha_choice)
-                        diag_data = diag_engine.run_all(alpha=alpha_choice)
+                        diag_engine.results = get_compute_cache().call(
+                            version, 'diagnostics.run_all',
+                            lambda alpha: DiagnosticsEngine(dfs, alpha=alpha).run_all(alpha=alpha),
+                            alpha=alpha_choice
+                        )
+                        diag_data = diag_engine.results
                         diag_engine.save_outputs(diag_dir)
                         st.success("✅ Hoàn thành kiểm định!")
                         st.rerun()
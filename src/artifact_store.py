@@ -0,0 +1,227 @@
+"""
+artifact_store.py — Kho lưu trữ artifact trung gian giữa các Stage
+===================================================================
+Thay cho việc mỗi stage tự ghi/đọc CSV + JSON:
+  - DataFrame  → Parquet / Feather (giữ nguyên dtype, cột 'Khoản mục', index)
+                 hoặc CSV (định dạng cũ, vẫn dùng được để export)
+  - dict       → JSON
+
+Định dạng mặc định là Parquet nếu có pyarrow, ngược lại CSV.
+Khi đọc, store tự dò định dạng theo thứ tự ưu tiên parquet → feather → csv,
+nên thư mục output cũ (chỉ có CSV) vẫn đọc được bình thường.
+"""
+
+import json
+import os
+import threading
+from collections.abc import Mapping
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+FRAME_FORMATS = ('parquet', 'feather', 'csv')
+DEFAULT_FORMAT = 'parquet' if PYARROW_AVAILABLE else 'csv'
+
+
+class ArtifactStore:
+    """Đọc/ghi artifact của một thư mục stage (vd: output/2_calculated)."""
+
+    def __init__(self, root, fmt=None, export_csv=False):
+        fmt = fmt or DEFAULT_FORMAT
+        if fmt not in FRAME_FORMATS:
+            raise ValueError(f"Định dạng không hỗ trợ: {fmt} (chọn trong {FRAME_FORMATS})")
+        if fmt != 'csv' and not PYARROW_AVAILABLE:
+            print(f"Lưu ý: Thiếu pyarrow, chuyển định dạng '{fmt}' sang 'csv'.")
+            fmt = 'csv'
+        self.root = root
+        self.fmt = fmt
+        self.export_csv = export_csv
+
+    # =====================================================================
+    # PATH HELPERS
+    # =====================================================================
+    def _path(self, name, ext):
+        return os.path.join(self.root, f"{name}.{ext}")
+
+    def _ensure_root(self):
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+
+    def _frame_path(self, name):
+        """File DataFrame hiện có cho name theo thứ tự ưu tiên, hoặc None."""
+        for ext in FRAME_FORMATS:
+            path = self._path(name, ext)
+            if os.path.exists(path):
+                return path, ext
+        return None, None
+
+    # =====================================================================
+    # WRITE
+    # =====================================================================
+    def save_frame(self, name, df, index=False):
+        self._ensure_root()
+        fmt = self.fmt
+        path = self._path(name, fmt)
+        try:
+            if fmt == 'parquet':
+                df.to_parquet(path, index=None if index else False)
+            elif fmt == 'feather':
+                # Feather không lưu index tuỳ biến → đưa index thành cột
+                (df.reset_index() if index else df.reset_index(drop=True)).to_feather(path)
+            else:
+                df.to_csv(path, index=index)
+        except Exception as e:
+            # Cột object trộn số/chuỗi (vd: dòng tiêu đề '') không ghi được dạng cột → dùng CSV
+            if fmt == 'csv':
+                raise
+            print(f"Lưu ý: Không ghi được {name} dạng {fmt} ({e}), dùng CSV.")
+            fmt = 'csv'
+            path = self._path(name, fmt)
+            df.to_csv(path, index=index)
+
+        # Xoá bản nhị phân cũ ở định dạng khác để lần đọc sau không lấy nhầm
+        for ext in FRAME_FORMATS:
+            if ext not in (fmt, 'csv') and os.path.exists(self._path(name, ext)):
+                os.remove(self._path(name, ext))
+        if fmt != 'csv' and self.export_csv:
+            df.to_csv(self._path(name, 'csv'), index=index)
+        print(f"Saved: {path}")
+        return path
+
+    def save_json(self, name, data, **json_kwargs):
+        self._ensure_root()
+        path = self._path(name, 'json')
+        json_kwargs.setdefault('ensure_ascii', False)
+        json_kwargs.setdefault('indent', 4)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **json_kwargs)
+        print(f"Saved: {path}")
+        return path
+
+    def save(self, name, data):
+        """Ghi DataFrame hoặc dict; các kiểu khác bị bỏ qua (giống save_outputs cũ)."""
+        if hasattr(data, 'to_csv'):
+            return self.save_frame(name, data)
+        if isinstance(data, dict):
+            return self.save_json(name, data)
+        return None
+
+    def save_all(self, items):
+        for name, data in items.items():
+            self.save(name, data)
+
+    # =====================================================================
+    # READ
+    # =====================================================================
+    def exists(self, name):
+        return self._frame_path(name)[0] is not None or os.path.exists(self._path(name, 'json'))
+
+    def load_frame(self, name, index_col=None):
+        path, ext = self._frame_path(name)
+        if path is None:
+            return None
+        if ext == 'csv':
+            return pd.read_csv(path, index_col=index_col)
+
+        df = pd.read_parquet(path) if ext == 'parquet' else pd.read_feather(path)
+        if index_col is not None and isinstance(df.index, pd.RangeIndex):
+            col = df.columns[index_col] if isinstance(index_col, int) else index_col
+            df = df.set_index(col)
+        return df
+
+    def load_json(self, name):
+        path = self._path(name, 'json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def load(self, name, index_col=None):
+        df = self.load_frame(name, index_col=index_col)
+        if df is not None:
+            return df
+        return self.load_json(name)
+
+    def names(self, include_json=True):
+        """Tên các artifact trong thư mục (mỗi tên một lần dù có nhiều định dạng)."""
+        if not os.path.exists(self.root):
+            return []
+        exts = FRAME_FORMATS + (('json',) if include_json else ())
+        found = []
+        for f in sorted(os.listdir(self.root)):
+            name, _, ext = f.rpartition('.')
+            if ext in exts and name not in found:
+                found.append(name)
+        return found
+
+    def load_all(self, include_json=True):
+        """Nạp toàn bộ artifact thành dict name → DataFrame/dict."""
+        data = {}
+        for name in self.names(include_json=include_json):
+            df = self.load_frame(name)
+            if df is not None:
+                data[name] = df
+            elif include_json:
+                data[name] = self.load_json(name)
+        return data
+
+    def export_csv_all(self, out_dir=None):
+        """Xuất mọi DataFrame trong store ra CSV (mặc định ngay cạnh file gốc)."""
+        out_dir = out_dir or self.root
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        for name in self.names(include_json=False):
+            df = self.load_frame(name)
+            df.to_csv(os.path.join(out_dir, f"{name}.csv"), index=not isinstance(df.index, pd.RangeIndex))
+
+
+class LazyArtifacts(Mapping):
+    """
+    Registry artifact nạp lười, dùng như dict name → DataFrame/dict.
+    Khởi tạo chỉ liệt kê tên file; mỗi artifact được đọc lần đầu có nơi truy cập
+    (dfs['X'], dfs.get('X')) rồi ghi nhớ, nên chi phí mở Dashboard không tăng theo
+    số output của pipeline. `in` / len / duyệt tên không đọc file.
+    """
+
+    def __init__(self, stores=()):
+        self._sources = {}   # name → (store, tên artifact trong store)
+        self._loaded = {}
+        self._lock = threading.Lock()
+        for store in stores:
+            for name in store.names():
+                self._sources.setdefault(name, (store, name))
+
+    def register(self, name, store, artifact=None):
+        """Thêm một artifact dưới tên khác (vd: 3_classification/business_model → BUSINESS_MODEL)."""
+        self._sources[name] = (store, artifact or name)
+        self._loaded.pop(name, None)
+
+    def __getitem__(self, name):
+        if name in self._loaded:
+            return self._loaded[name]
+        if name not in self._sources:
+            raise KeyError(name)
+        # Nhiều session Streamlit dùng chung một registry → mỗi file chỉ đọc một lần
+        with self._lock:
+            if name not in self._loaded:
+                store, artifact = self._sources[name]
+                self._loaded[name] = store.load(artifact)
+        return self._loaded[name]
+
+    def __contains__(self, name):
+        return name in self._sources
+
+    def __iter__(self):
+        return iter(list(self._sources))
+
+    def __len__(self):
+        return len(self._sources)
+
+    def loaded(self):
+        """Tên các artifact đã thực sự được đọc."""
+        return list(self._loaded)
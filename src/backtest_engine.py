@@ -0,0 +1,95 @@
+"""
+backtest_engine.py — Backtest OLS cập nhật tăng dần (normal equations)
+======================================================================
+Thay vì fit lại mô hình từ đầu ở mỗi năm kiểm tra, ma trận chuẩn tắc
+G = Σ zzᵀ và b = Σ z·y được cộng dồn từng năm (cập nhật hạng một):
+  - Expanding window : G[0:e]  = tổng tích luỹ tới e
+  - Rolling window   : G[s:e]  = G[0:e] − G[0:s]  (bỏ năm cũ = trừ hạng một)
+  - Đa bước (horizon h): huấn luyện tới e, dự báo năm e + h − 1
+Mọi bước (và mọi chuỗi nếu truyền thêm trục đầu, vd: nhiều mã / chuỗi quý)
+được giải cùng lúc bằng pinv theo lô, không tạo đối tượng sklearn nào.
+
+Với mô hình Log-Log FWL: phần dư Oil|Q, FX|Q là biến đổi tuyến tính khả nghịch của
+[1, ln Q, ln Oil, ln FX], nên dự báo của hồi quy chính trùng với OLS trực tiếp trên
+design_matrix(...) (có hệ số chặn) — không cần chạy lại hai hồi quy phụ ở mỗi bước.
+"""
+
+import numpy as np
+
+
+def design_matrix(ln_Q, ln_oil, ln_fx, covid=None):
+    """Biến giải thích [ln Q, ln Oil, ln FX (, Covid)] theo trục năm (hằng số do engine tự thêm)."""
+    cols = [ln_Q, ln_oil, ln_fx]
+    if covid is not None:
+        cols.append(np.broadcast_to(np.asarray(covid, dtype=float), np.shape(ln_Q)))
+    return np.stack(cols, axis=-1)
+
+
+def backtest_windows(n, min_train=7, window=None, horizon=1):
+    """(năm kiểm tra, đầu cửa sổ train, cuối cửa sổ train — không gồm) cho mọi bước."""
+    test_idx = np.arange(min_train + horizon - 1, n)
+    train_end = test_idx - horizon + 1
+    train_start = np.zeros_like(train_end) if window is None else np.maximum(train_end - window, 0)
+    return test_idx, train_start, train_end
+
+
+def _prefix(a, axis):
+    """Tổng tích luỹ có thêm phần tử 0 ở đầu: out[t] = Σ_{i<t} a[i]."""
+    pad = [(0, 0)] * a.ndim
+    pad[axis] = (1, 0)
+    return np.pad(np.cumsum(a, axis=axis), pad)
+
+
+def ols_backtest(X, y, min_train=7, window=None, horizon=1, rcond=1e-10):
+    """
+    OLS có hệ số chặn trên từng cửa sổ train, dự báo năm kiểm tra tương ứng.
+    X: (..., n, k) biến giải thích; y: (..., n).
+    Trả về dict test_idx, train_start, train_end (m,) và predicted (..., m).
+
+    Giống LinearRegression của sklearn: dữ liệu được trừ trung bình của chính cửa sổ
+    (tính từ các tổng luỹ kế), biến không đổi trong cửa sổ (vd: Covid toàn 0) nhận hệ số 0.
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = X.shape[-2]
+    test_idx, train_start, train_end = backtest_windows(n, min_train, window, horizon)
+    if len(test_idx) == 0:
+        return {'test_idx': test_idx, 'train_start': train_start, 'train_end': train_end,
+                'predicted': np.zeros(X.shape[:-2] + (0,))}
+
+    # Dời gốc về trung bình toàn mẫu (hằng số cố định) để các tổng luỹ kế không mất chữ số
+    shift_x = X.mean(axis=-2, keepdims=True)
+    shift_y = y.mean(axis=-1, keepdims=True)
+    Xs = X - shift_x
+    ys = y - shift_y
+
+    # Cộng dồn các cập nhật hạng một zzᵀ, z·y cùng tổng bậc nhất
+    cum_xx = _prefix(Xs[..., :, :, None] * Xs[..., :, None, :], axis=-3)
+    cum_xy = _prefix(Xs * ys[..., None], axis=-2)
+    cum_x = _prefix(Xs, axis=-2)
+    cum_y = _prefix(ys, axis=-1)
+
+    def window_sum(cum, axis_len):
+        idx = (Ellipsis, train_end) + (slice(None),) * axis_len
+        idx0 = (Ellipsis, train_start) + (slice(None),) * axis_len
+        return cum[idx] - cum[idx0]
+
+    n_w = (train_end - train_start).astype(float)
+    s_xx = window_sum(cum_xx, 2)
+    s_xy = window_sum(cum_xy, 1)
+    mean_x = window_sum(cum_x, 1) / n_w[:, None]
+    mean_y = window_sum(cum_y, 0) / n_w
+
+    # Ma trận chuẩn tắc đã trừ trung bình cửa sổ
+    G = s_xx - n_w[:, None, None] * mean_x[..., :, None] * mean_x[..., None, :]
+    b = s_xy - n_w[:, None] * mean_x * mean_y[..., None]
+    beta = np.einsum('...ij,...j->...i', np.linalg.pinv(G, rcond=rcond, hermitian=True), b)
+
+    x_test = Xs[..., test_idx, :]
+    predicted = mean_y + np.einsum('...i,...i->...', x_test - mean_x, beta) + shift_y
+    return {
+        'test_idx': test_idx,
+        'train_start': train_start,
+        'train_end': train_end,
+        'predicted': predicted,
+    }
@@ -0,0 +1,208 @@
+"""
+batch_runner.py — Chạy Pipeline cho nhiều mã cổ phiếu cùng lúc
+===============================================================
+Quét một thư mục dữ liệu, nhận diện từng mã CK và chạy chuỗi
+Processor → Calculator → Diagnostics → Classifier → Forecaster cho mỗi mã
+trên một process pool (mỗi mã một tiến trình con).
+
+Nguồn dữ liệu được nhận diện:
+  - File export gốc của SSI: SSI_<MÃ>_Financial_..._<ddmmyyyy>.xlsx
+    (Balance_Sheet / Cash_Flow / Income_Statement / Ratio; lấy bản mới nhất)
+  - Workbook đã gộp sẵn 4 sheet bs/cf/is/fi: <mã>.xlsx (vd: hvn.xlsx) — ưu tiên nếu có cả hai
+
+Output tách riêng theo mã: output/tickers/<MÃ>/1_processed, 2_calculated, ...
+kèm log pipeline.log. Mã nào lỗi chỉ được ghi nhận, không dừng cả lô.
+Cuối lô: bảng tổng kết + throughput (mã/giây), batch_summary.json và
+anomaly_screen.csv (Beneish / Altman / Sloan của mọi mã chấm trong một lần gọi).
+
+Cách dùng:
+    python src/batch_runner.py [data_dir] [--out output/tickers] [--workers N]
+                               [--tickers HVN,VJC] [--no-cache]
+(đường dẫn tương đối tính từ thư mục gốc dự án, giống pipeline_runner)
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+# Tự động xác định Project Root để các đường dẫn tương đối hoạt động đúng
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "src"))
+
+from artifact_store import ArtifactStore
+from calculator import anomaly_screen
+from data_processor import SSI_EXPORT_KINDS
+
+# Stage 5 (báo cáo Markdown) viết riêng cho HVN nên không chạy theo lô
+BATCH_STAGES = ['2.5', '3', '4.1']
+
+_SSI_RE = re.compile(r'^SSI_([A-Za-z0-9]+)_Financial_(.+)_(\d{8})\.xlsx$', re.IGNORECASE)
+_WORKBOOK_RE = re.compile(r'^([A-Za-z0-9]{3,5})\.xlsx$')
+
+
+def _export_kind(label):
+    label = label.lower()
+    for sheet, kind in SSI_EXPORT_KINDS.items():
+        if label.endswith(kind):
+            return sheet
+    return None
+
+
+def discover_tickers(data_dir):
+    """
+    Trả về dict MÃ → nguồn dữ liệu: đường dẫn workbook gộp, hoặc dict sheet → file SSI.
+    """
+    workbooks = {}
+    exports = {}   # MÃ → sheet → (ngày trích xuất, đường dẫn)
+    for fname in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, fname)
+        m = _SSI_RE.match(fname)
+        if m:
+            ticker, label, stamp = m.group(1).upper(), m.group(2), m.group(3)
+            sheet = _export_kind(label)
+            if sheet is None:
+                continue
+            try:
+                extracted = datetime.strptime(stamp, "%d%m%Y")
+            except ValueError:
+                continue
+            current = exports.setdefault(ticker, {}).get(sheet)
+            if current is None or extracted > current[0]:
+                exports[ticker][sheet] = (extracted, path)
+            continue
+        m = _WORKBOOK_RE.match(fname)
+        if m:
+            workbooks[m.group(1).upper()] = path
+
+    sources = {t: {sheet: p for sheet, (_, p) in files.items()} for t, files in exports.items()}
+    sources.update(workbooks)
+    return dict(sorted(sources.items()))
+
+
+def run_ticker(ticker, source, out_root, macro_path, discount=0.4, alpha=0.05, use_cache=True):
+    """Chạy pipeline cho một mã trong tiến trình con. Không bao giờ raise: lỗi nằm trong kết quả."""
+    from pipeline_runner import PipelineContext, run_pipeline
+
+    ticker_dir = os.path.join(out_root, ticker)
+    os.makedirs(ticker_dir, exist_ok=True)
+    result = {'ticker': ticker, 'status': 'ok', 'error': None, 'warnings': [], 'elapsed': 0.0}
+    start = time.time()
+    with open(os.path.join(ticker_dir, "pipeline.log"), 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            ctx = PipelineContext(excel_path=source, macro_path=macro_path, out_root=ticker_dir,
+                                  report_dir=ticker_dir, discount=discount, alpha=alpha, ticker=ticker)
+            # Mỗi mã đã chiếm một tiến trình của pool → các stage bên trong chạy tuần tự
+            run_pipeline(context=ctx, parallel=False, use_cache=use_cache, stages=BATCH_STAGES)
+            for name, st in ctx.schedule.items():
+                if st['error'] is not None:
+                    result['warnings'].append(f"Stage {name}: {st['error']}")
+            if result['warnings']:
+                result['status'] = 'partial'
+            result['business_model'] = ctx.business_model.get('Mô hình cốt lõi')
+        except Exception as e:
+            traceback.print_exc(file=log)
+            result['status'] = 'failed'
+            result['error'] = f"{type(e).__name__}: {e}"
+    result['elapsed'] = time.time() - start
+    return result
+
+
+def run_batch(data_dir="data", out_root="output/tickers", macro_path="data/oil&exchange_rate.xlsx",
+              tickers=None, max_workers=None, discount=0.4, alpha=0.05, use_cache=True):
+    sources = discover_tickers(data_dir)
+    if tickers:
+        wanted = [t.upper() for t in tickers]
+        missing = [t for t in wanted if t not in sources]
+        if missing:
+            print(f"Lưu ý: Không tìm thấy dữ liệu cho: {', '.join(missing)}")
+        sources = {t: sources[t] for t in wanted if t in sources}
+
+    print("=" * 40)
+    print(f" BATCH PIPELINE: {len(sources)} mã từ {data_dir}")
+    print("=" * 40)
+    if not sources:
+        return []
+
+    results = []
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(run_ticker, t, src, out_root, macro_path, discount, alpha, use_cache): t
+            for t, src in sources.items()
+        }
+        for done, fut in enumerate(as_completed(futures), 1):
+            ticker = futures[fut]
+            try:
+                res = fut.result()
+            except Exception as e:
+                # Tiến trình con chết hẳn (vd: hết bộ nhớ) — vẫn không dừng cả lô
+                res = {'ticker': ticker, 'status': 'failed', 'error': f"{type(e).__name__}: {e}",
+                       'warnings': [], 'elapsed': 0.0}
+            results.append(res)
+            note = res['error'] or '; '.join(res['warnings'])
+            print(f"[{done}/{len(futures)}] {ticker:<6} {res['status']:<8} {res['elapsed']:6.2f}s  {note}")
+    elapsed = time.time() - start
+
+    results.sort(key=lambda r: r['ticker'])
+    counts = {s: sum(r['status'] == s for r in results) for s in ('ok', 'partial', 'failed')}
+    throughput = len(results) / elapsed if elapsed > 0 else 0.0
+
+    print("\n" + "=" * 40)
+    print(f" BATCH HOÀN TẤT: {len(results)} mã trong {elapsed:.2f}s ({throughput:.2f} mã/giây)")
+    print(f" OK: {counts['ok']} | Thiếu stage: {counts['partial']} | Lỗi: {counts['failed']}")
+    for r in results:
+        if r['status'] == 'failed':
+            print(f"  ✗ {r['ticker']}: {r['error']}")
+    print("=" * 40)
+
+    os.makedirs(out_root, exist_ok=True)
+    summary = {
+        'data_dir': data_dir,
+        'elapsed': elapsed,
+        'tickers_per_sec': throughput,
+        'counts': counts,
+        'results': results,
+    }
+    with open(os.path.join(out_root, "batch_summary.json"), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=4, default=str)
+
+    screen = screen_anomalies(out_root, [r['ticker'] for r in results if r['status'] != 'failed'])
+    if not screen.empty:
+        screen.to_csv(os.path.join(out_root, "anomaly_screen.csv"), index=False, encoding='utf-8-sig')
+        print(f"Sàng lọc bất thường: {screen['Mã'].nunique()} mã → {os.path.join(out_root, 'anomaly_screen.csv')}")
+    return results
+
+
+def screen_anomalies(out_root, tickers):
+    """Chấm Beneish / Altman / Sloan cho cả lát cắt ngang từ 1_processed của từng mã."""
+    dfs_by_ticker = {}
+    for t in tickers:
+        in_dir = os.path.join(out_root, t, "1_processed")
+        if os.path.isdir(in_dir):
+            dfs_by_ticker[t] = ArtifactStore(in_dir).load_all(include_json=False)
+    return anomaly_screen(dfs_by_ticker)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy pipeline phân tích cho nhiều mã CK")
+    parser.add_argument("data_dir", nargs="?", default="data")
+    parser.add_argument("--out", default="output/tickers")
+    parser.add_argument("--macro", default="data/oil&exchange_rate.xlsx")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--tickers", default=None, help="Danh sách mã, cách nhau bởi dấu phẩy")
+    parser.add_argument("--discount", type=float, default=0.4)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    run_batch(args.data_dir, out_root=args.out, macro_path=args.macro,
+              tickers=args.tickers.split(",") if args.tickers else None,
+              max_workers=args.workers, discount=args.discount, use_cache=not args.no_cache)
@@ -0,0 +1,438 @@
+"""
+benchmark.py — Đo hiệu năng Pipeline trên báo cáo tài chính tổng hợp quy mô lớn
+==============================================================================
+Sinh workbook giả lập đúng khuôn SSI (4 sheet bs/cf/is/fi, cùng nhãn 'Khoản mục'
+với data/hvn.xlsx) ở kích thước tuỳ chọn:
+  - years    : số năm (tính lùi từ năm cuối của hvn.xlsx)
+  - quarterly: cột quý 'Q1/2020'... thay cho cột năm
+  - items    : số Khoản mục bổ sung cho mỗi sheet BS/IS/CF
+  - tickers  : số mã giả lập (mỗi mã một workbook, chuỗi số liệu khác nhau)
+Giá trị được nhân từ số liệu HVN theo một đường tăng trưởng chung của doanh
+nghiệp (+ nhiễu riêng từng dòng) nên các chỉ số phái sinh vẫn có nghĩa.
+
+Đo (`repeats` lần chạy, mili giây; so sánh theo trung vị):
+  - stage:<tên>  : wall time từng Stage (run_pipeline tuần tự, không cache, không ghi đĩa)
+  - fn:<tên>     : hàm nóng load_and_normalize, _generic_factor_impact,
+                   dcf_sensitivity, test_backtesting
+So với baseline lưu trong data/benchmark_baseline.json: chỉ số chậm hơn quá
+ngưỡng (mặc định +25% và > 10 ms) bị đánh dấu REGRESSION. Kịch bản có REGRESSION
+được đo lại với gấp đôi số lần lặp; script chỉ thoát mã 1 nếu chỉ số vẫn chậm ở lần đo lại.
+Thời gian được quy đổi theo phép đo hiệu chuẩn (calibration) để so được giữa các
+máy khác nhau: tải cố định ~0.2 s, đo xen kẽ trước/sau từng kịch bản, lấy trung vị.
+
+Cách dùng:
+    python src/benchmark.py                       # mọi kịch bản mặc định, so với baseline
+    python src/benchmark.py --scenario long --repeats 5
+    python src/benchmark.py --years 30 --items 300 --tickers 2 [--quarterly]
+    python src/benchmark.py --save-baseline       # ghi kết quả hiện tại làm baseline
+(đường dẫn tương đối tính từ thư mục gốc dự án, giống pipeline_runner)
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+import warnings
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Tự động xác định Project Root để các đường dẫn tương đối hoạt động đúng
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "src"))
+
+TEMPLATE_PATH = "data/hvn.xlsx"
+MACRO_PATH = "data/oil&exchange_rate.xlsx"
+BASELINE_PATH = "data/benchmark_baseline.json"
+BENCH_DIR = os.path.join("output", ".bench")
+
+SHEETS = ['bs', 'is', 'cf', 'fi']
+FLOW_SHEETS = ('is', 'cf')      # số phát sinh trong kỳ → chia đều cho quý
+PADDED_SHEETS = ('bs', 'is', 'cf')
+
+# Kịch bản mặc định: years=None → đúng số năm của hvn.xlsx
+SCENARIOS = {
+    'hvn': {'years': None, 'quarterly': False, 'items': 0, 'tickers': 1},
+    'long': {'years': 40, 'quarterly': False, 'items': 300, 'tickers': 1},
+    'quarterly': {'years': 12, 'quarterly': True, 'items': 0, 'tickers': 1},
+    'multi': {'years': None, 'quarterly': False, 'items': 0, 'tickers': 3},
+}
+
+# Nhân tố ROA giống Calculator.dupont_factor_impact
+ROA_FACTORS = [(r'^Tax Burden', 'TaxB', False), (r'^Interest Burden', 'IntB', False),
+               (r'^EBIT Margin', 'EBIT_M', True), (r'^Asset Turnover', 'AT', False)]
+
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MIN_MS = 10.0
+# Đổi khi sửa tải calibrate(): baseline cũ không còn quy đổi được theo calibration_ms
+CALIBRATION_VERSION = 2
+
+
+# =============================================================================
+# SINH DỮ LIỆU GIẢ LẬP
+# =============================================================================
+def _read_template(path=TEMPLATE_PATH):
+    """{sheet: (ô tiêu đề cột đầu, nhãn, ma trận giá trị, các năm)} của workbook mẫu."""
+    out = {}
+    with pd.ExcelFile(path) as xls:
+        for sheet in SHEETS:
+            raw = pd.read_excel(xls, sheet_name=sheet, header=None)
+            years = [int(float(v)) for v in raw.iloc[0, 1:]]
+            values = raw.iloc[1:, 1:].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+            out[sheet] = (raw.iloc[0, 0], raw.iloc[1:, 0].tolist(), values, years)
+    return out
+
+
+def _anchor(values):
+    """Giá trị hữu hạn gần nhất của từng dòng (NaN nếu cả dòng trống)."""
+    anchor = np.full(len(values), np.nan)
+    for i, row in enumerate(values):
+        finite = row[np.isfinite(row)]
+        if len(finite):
+            anchor[i] = finite[-1]
+    return anchor
+
+
+def synthetic_workbook(path, ticker, template, years=None, quarterly=False, items=0, seed=0,
+                       template_ticker='HVN'):
+    """Ghi một workbook 4 sheet cùng khuôn hvn.xlsx; trả về danh sách nhãn kỳ."""
+    rng = np.random.default_rng(seed)
+    last_year = template['bs'][3][-1]
+    n_years = years or len(template['bs'][3])
+    first_year = last_year - n_years + 1
+    if quarterly:
+        header = [f"Q{q}/{y}" for y in range(first_year, last_year + 1) for q in range(1, 5)]
+        per_year = 4
+    else:
+        header = list(range(first_year, last_year + 1))
+        per_year = 1
+    n = len(header)
+
+    # Đường tăng trưởng chung của doanh nghiệp: drift 6%/năm, độ biến động 15%/năm; chuẩn hoá về kỳ cuối
+    steps = rng.normal(0.06 / per_year, 0.15 / np.sqrt(per_year), n)
+    growth = np.exp(np.cumsum(steps) - np.cumsum(steps)[-1])
+    scale = np.exp(rng.normal(0.0, 0.5))
+
+    with pd.ExcelWriter(path) as writer:
+        for sheet in SHEETS:
+            first_cell, labels, values, _ = template[sheet]
+            anchor = _anchor(values)
+            labels = [ticker if lab == template_ticker else lab for lab in labels]
+            if sheet in PADDED_SHEETS and items:
+                labels = labels + [f"Khoản mục bổ sung {i + 1}" for i in range(items)]
+                extra = np.abs(anchor[np.isfinite(anchor) & (anchor != 0)])
+                picks = rng.choice(extra, items) * rng.choice([-1.0, 1.0], items)
+                anchor = np.concatenate([anchor, picks])
+
+            noise = rng.normal(0.0, 0.05, (len(anchor), n))
+            if sheet == 'fi':
+                # Chỉ số / tỷ lệ: dao động quanh mức hiện tại, không tăng theo quy mô
+                body = anchor[:, None] * np.exp(noise * 2)
+            else:
+                base = anchor * scale / (per_year if sheet in FLOW_SHEETS else 1)
+                body = base[:, None] * growth[None, :] * np.exp(noise)
+
+            frame = pd.DataFrame(body, columns=header)
+            frame.insert(0, first_cell, labels)
+            frame.to_excel(writer, sheet_name=sheet, index=False)
+    return header
+
+
+def build_scenario(name, spec, template, work_dir, seed=0):
+    """Sinh workbook cho mọi mã của kịch bản; trả về dict mã → đường dẫn."""
+    out = {}
+    for i in range(spec['tickers']):
+        ticker = f"SYN{i + 1:02d}"
+        path = os.path.join(work_dir, f"{name}_{ticker}.xlsx")
+        synthetic_workbook(path, ticker, template, years=spec['years'], quarterly=spec['quarterly'],
+                           items=spec['items'], seed=seed + i)
+        out[ticker] = path
+    return out
+
+
+# =============================================================================
+# ĐO THỜI GIAN
+# =============================================================================
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000
+
+
+def calibrate(repeats=3):
+    """Mẫu thời gian (ms) của một tải cố định numpy + Python thuần — mốc quy đổi giữa các máy."""
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=(200, 200))
+
+    def workload():
+        for _ in range(100):
+            np.linalg.solve(a @ a.T + np.eye(200), a[:, 0])
+        sum(i * i for i in range(1_500_000))
+
+    return [_timed(workload) for _ in range(repeats)]
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Tắt log stage và cảnh báo thư viện (statsmodels, sklearn...) trong lúc đo."""
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def _frames_only(dfs):
+    return {k: v for k, v in dfs.items() if isinstance(v, pd.DataFrame)}
+
+
+def bench_ticker(ticker, path, repeats, work_dir):
+    """Mẫu thời gian (ms) theo chỉ số cho một workbook: các Stage và các hàm nóng."""
+    from calculator import Calculator
+    from data_processor import DataProcessor
+    from diagnostics import DiagnosticsEngine
+    from forecaster import Forecaster
+    from pipeline_runner import PipelineContext, run_pipeline
+
+    samples, errors = {}, []
+
+    def add(metric, ms):
+        samples.setdefault(metric, []).append(ms)
+
+    ctx = None
+    for _ in range(repeats):
+        ctx = PipelineContext(excel_path=path, macro_path=MACRO_PATH, out_root=work_dir,
+                              report_dir=work_dir, ticker=ticker)
+        start = time.perf_counter()
+        with _quiet():
+            run_pipeline(persist=False, context=ctx, parallel=False, use_cache=False)
+        add('pipeline:total', (time.perf_counter() - start) * 1000)
+        for name, st in ctx.schedule.items():
+            if st['error'] is not None:
+                errors.append(f"{ticker} Stage {name}: {st['error']}")
+            else:
+                add(f'stage:{name}', st['duration'] * 1000)
+
+    calculated = ctx.calculated
+    frames = _frames_only(calculated)
+    hot = {
+        'fn:load_and_normalize': lambda: DataProcessor(path, ticker=ticker).load_and_normalize(),
+        'fn:_generic_factor_impact': lambda: Calculator(dict(frames))._generic_factor_impact(
+            frames.get('DUPONT_ROA'), ROA_FACTORS, r'ROA'),
+        'fn:dcf_sensitivity': lambda: Forecaster(dict(frames)).dcf_sensitivity(),
+        'fn:test_backtesting': lambda: DiagnosticsEngine(calculated).test_backtesting(),
+    }
+    for metric, fn in hot.items():
+        for _ in range(repeats):
+            try:
+                with _quiet():
+                    add(metric, _timed(fn))
+            except Exception as e:
+                errors.append(f"{ticker} {metric}: {type(e).__name__}: {e}")
+                break
+    return samples, errors
+
+
+def run_scenario(name, spec, repeats=5, seed=0):
+    """Chạy một kịch bản; trả về {'spec', 'metrics': {chỉ số: {median_ms, min_ms, runs}}, 'errors'}."""
+    template = _read_template()
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{name}_", dir=_bench_dir())
+    samples, errors = {}, []
+    try:
+        paths = build_scenario(name, spec, template, work_dir, seed=seed)
+        for ticker, path in paths.items():
+            try:
+                got, errs = bench_ticker(ticker, path, repeats, work_dir)
+            except Exception as e:
+                traceback.print_exc()
+                errors.append(f"{ticker}: {type(e).__name__}: {e}")
+                continue
+            errors.extend(errs)
+            for metric, values in got.items():
+                samples.setdefault(metric, []).extend(values)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    metrics = {
+        metric: {'median_ms': round(statistics.median(v), 3), 'min_ms': round(min(v), 3), 'runs': len(v)}
+        for metric, v in sorted(samples.items())
+    }
+    return {'spec': spec, 'metrics': metrics, 'errors': sorted(set(errors))}
+
+
+def _bench_dir():
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    return BENCH_DIR
+
+
+# =============================================================================
+# SO SÁNH VỚI BASELINE
+# =============================================================================
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD, min_ms=DEFAULT_MIN_MS):
+    """
+    Danh sách dòng so sánh (kịch bản, chỉ số, baseline ms, hiện tại ms, tỷ lệ, trạng thái).
+    So theo median_ms; thời gian baseline được quy đổi theo tỷ lệ calibration hai máy trước khi so
+    (chỉ khi baseline đo bằng cùng tải calibrate()).
+    """
+    same_calibration = baseline.get('calibration_version') == current.get('calibration_version')
+    machine = 1.0
+    if same_calibration and baseline.get('calibration_ms'):
+        machine = current['calibration_ms'] / baseline['calibration_ms']
+    rows = []
+    for scen, result in current['scenarios'].items():
+        base_scen = baseline.get('scenarios', {}).get(scen)
+        if base_scen is None:
+            continue
+        if base_scen.get('spec') != result['spec']:
+            rows.append((scen, '*', None, None, None, 'SPEC CHANGED'))
+            continue
+        for metric, cur in result['metrics'].items():
+            base = base_scen['metrics'].get(metric)
+            if base is None:
+                rows.append((scen, metric, None, cur['median_ms'], None, 'NEW'))
+                continue
+            expected = base['median_ms'] * machine
+            ratio = cur['median_ms'] / expected if expected > 0 else float('inf')
+            if ratio > 1 + threshold and cur['median_ms'] - expected > min_ms:
+                status = 'REGRESSION'
+            elif ratio < 1 / (1 + threshold) and expected - cur['median_ms'] > min_ms:
+                status = 'FASTER'
+            else:
+                status = 'ok'
+            rows.append((scen, metric, expected, cur['median_ms'], ratio, status))
+        for metric in base_scen['metrics']:
+            if metric not in result['metrics']:
+                rows.append((scen, metric, base_scen['metrics'][metric]['median_ms'] * machine, None, None,
+                             'MISSING'))
+    return rows
+
+
+def print_results(current):
+    for scen, result in current['scenarios'].items():
+        spec = result['spec']
+        shape = f"{spec['years'] or 'hvn'} năm{' (quý)' if spec['quarterly'] else ''}, " \
+                f"+{spec['items']} khoản mục, {spec['tickers']} mã"
+        print(f"\n[{scen}] {shape}")
+        print(f"  {'Chỉ số':<30} {'median ms':>12} {'min ms':>12} {'runs':>5}")
+        for metric, m in result['metrics'].items():
+            print(f"  {metric:<30} {m['median_ms']:>12.1f} {m['min_ms']:>12.1f} {m['runs']:>5}")
+        for err in result['errors']:
+            print(f"  ✗ {err}")
+
+
+def print_comparison(rows, threshold):
+    if not rows:
+        print("\nKhông có kịch bản chung với baseline để so sánh.")
+        return
+    print(f"\nSO VỚI BASELINE (median ms, ngưỡng +{threshold:.0%}, đã quy đổi theo calibration)")
+    print(f"  {'Kịch bản':<10} {'Chỉ số':<30} {'baseline':>10} {'hiện tại':>10} {'tỷ lệ':>7}  Trạng thái")
+    for scen, metric, expected, cur, ratio, status in rows:
+        exp_txt = '' if expected is None else f"{expected:.1f}"
+        cur_txt = '' if cur is None else f"{cur:.1f}"
+        ratio_txt = '' if ratio is None else f"{ratio:.2f}x"
+        print(f"  {scen:<10} {metric:<30} {exp_txt:>10} {cur_txt:>10} {ratio_txt:>7}  {status}")
+
+
+def run_benchmarks(scenarios, repeats=5, seed=0):
+    calibration = calibrate()
+    current = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.platform(),
+        'repeats': repeats,
+        'seed': seed,
+        'calibration_version': CALIBRATION_VERSION,
+        'calibration_ms': None,
+        'scenarios': {},
+    }
+    for name, spec in scenarios.items():
+        print(f"Đang đo kịch bản '{name}'...")
+        start = time.time()
+        current['scenarios'][name] = run_scenario(name, spec, repeats=repeats, seed=seed)
+        # Calibration xen kẽ giữa các kịch bản: một lần đo nhiễu không kéo lệch mọi mốc quy đổi
+        calibration.extend(calibrate())
+        print(f"  → xong sau {time.time() - start:.1f}s")
+    current['calibration_ms'] = round(statistics.median(calibration), 3)
+    return current
+
+
+def confirm_regressions(current, baseline, rows, repeats, seed, threshold, min_ms):
+    """
+    Đo lại (gấp đôi số lần lặp) các kịch bản có REGRESSION; trả về các dòng vẫn REGRESSION
+    ở lần đo lại — chỉ những dòng này mới làm script thoát mã 1.
+    """
+    flagged = {(r[0], r[1]) for r in rows if r[-1] == 'REGRESSION'}
+    scenarios = {scen: current['scenarios'][scen]['spec'] for scen, _ in flagged}
+    if not scenarios:
+        return []
+    print(f"\nĐo lại {len(scenarios)} kịch bản có REGRESSION ({repeats * 2} lần lặp)...")
+    retry = run_benchmarks(scenarios, repeats=repeats * 2, seed=seed)
+    return [r for r in compare(retry, baseline, threshold=threshold, min_ms=min_ms)
+            if r[-1] == 'REGRESSION' and (r[0], r[1]) in flagged]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipeline trên dữ liệu tài chính giả lập")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="kịch bản có sẵn (lặp lại được); mặc định chạy tất cả")
+    parser.add_argument("--years", type=int, help="kịch bản tuỳ chỉnh: số năm")
+    parser.add_argument("--quarterly", action="store_true", help="kịch bản tuỳ chỉnh: số liệu quý")
+    parser.add_argument("--items", type=int, default=0, help="kịch bản tuỳ chỉnh: số Khoản mục bổ sung")
+    parser.add_argument("--tickers", type=int, default=1, help="kịch bản tuỳ chỉnh: số mã giả lập")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="ghi kết quả làm baseline mới")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="tỷ lệ chậm hơn tối đa cho phép (0.25 = +25%%)")
+    parser.add_argument("--min-ms", type=float, default=DEFAULT_MIN_MS,
+                        help="bỏ qua chênh lệch tuyệt đối nhỏ hơn ngưỡng này (ms)")
+    args = parser.parse_args()
+
+    custom = args.years is not None or args.quarterly or args.items or args.tickers != 1
+    if custom:
+        selected = {'custom': {'years': args.years, 'quarterly': args.quarterly,
+                               'items': args.items, 'tickers': args.tickers}}
+    else:
+        selected = {name: SCENARIOS[name] for name in (args.scenario or SCENARIOS)}
+
+    current = run_benchmarks(selected, repeats=args.repeats, seed=args.seed)
+    print_results(current)
+
+    result_path = os.path.join(_bench_dir(), f"bench_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"\nKết quả: {result_path}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"Đã ghi baseline: {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"Chưa có baseline ({args.baseline}) — chạy lại với --save-baseline để tạo.")
+        sys.exit(0)
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, threshold=args.threshold, min_ms=args.min_ms)
+    print_comparison(rows, args.threshold)
+    if baseline.get('calibration_version') != CALIBRATION_VERSION:
+        print("  (baseline đo bằng tải calibration khác — so trực tiếp, không quy đổi; nên --save-baseline lại)")
+    regressions = confirm_regressions(current, baseline, rows, args.repeats, args.seed,
+                                      args.threshold, args.min_ms)
+    if regressions:
+        print_comparison(regressions, args.threshold)
+        print(f"\n✗ {len(regressions)} chỉ số chậm hơn baseline quá ngưỡng.")
+        sys.exit(1)
+    print("\n✓ Không có regression so với baseline.")
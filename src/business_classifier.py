@@ -1,6 +1,10 @@
-import pandas as pd
 import numpy as np
+from line_items import find_row
+from period_axis import get_period_axis
+from artifact_store import ArtifactStore
+from instrumentation import traced_class
 
+@traced_class('classifier')
 class BusinessClassifier:
     """
     Phân loại doanh nghiệp tự động dựa trên Ma trận định lượng tỷ số tài chính.
@@ -8,24 +12,16 @@ class BusinessClassifier:
     """
     def __init__(self, dfs_dict=None, in_dir=None):
         import os
-        import pandas as pd
         if in_dir and os.path.exists(in_dir):
-            self.dfs = {}
-            for f in os.listdir(in_dir):
-                if f.endswith('.csv'):
-                    name = f.replace('.csv', '')
-                    self.dfs[name] = pd.read_csv(os.path.join(in_dir, f))
+            self.dfs = ArtifactStore(in_dir).load_all(include_json=False)
         else:
             self.dfs = dfs_dict or {}
 
     def _get_row(self, df, pattern):
-        row = df[df['Khoản mục'].str.contains(pattern, case=False, na=False, regex=True)]
-        if not row.empty:
-            return row.iloc[0]
-        return None
+        return find_row(df, pattern)
 
     def _get_years(self, df):
-        return [col for col in df.columns if col != 'Khoản mục']
+        return get_period_axis(df).periods
 
     def classify(self):
         bs_df = self.dfs.get('BALANCE SHEET')
@@ -35,7 +31,8 @@ class BusinessClassifier:
         if bs_df is None or is_df is None:
             return None
 
-        years = self._get_years(bs_df)
+        axis = get_period_axis(bs_df)
+        years = axis.periods
         if not years:
             return None
 
@@ -113,7 +110,7 @@ class BusinessClassifier:
         # LUẬT ĐA SỐ 5 KỲ (Tie-breaker rules)
         import collections
 
-        last_5 = years[-5:]
+        last_5 = axis.last(5)
         models_5 = [historical_models[y]['Mô hình'] for y in last_5]
         counter_5 = collections.Counter(models_5)
         
@@ -122,7 +119,7 @@ class BusinessClassifier:
             core_model = most_common_5[0][0]
         else:
             if len(years) > 5:
-                prev_5 = years[-10:-5]
+                prev_5 = axis.last(5, skip=5)
                 models_10 = [historical_models[y]['Mô hình'] for y in (prev_5 + last_5)]
                 counter_10 = collections.Counter(models_10)
                 most_common_10 = counter_10.most_common()
@@ -194,17 +191,12 @@ class BusinessClassifier:
 
     def save_outputs(self, out_dir="output/3_classification"):
         import os
-        import json
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
+        store = ArtifactStore(out_dir)
         
         if 'BUSINESS_MODEL' in self.dfs:
             result = self.dfs['BUSINESS_MODEL']
             # Save JSON
-            json_path = os.path.join(out_dir, "business_model.json")
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=4)
-            print(f"Saved: {json_path}")
+            store.save_json("business_model", result)
             
             md_path = os.path.join(out_dir, "business_model_report.md")
             with open(md_path, 'w', encoding='utf-8') as f:
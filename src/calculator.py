@@ -1,5 +1,11 @@
 import pandas as pd
 import numpy as np
+from line_items import find_row
+from period_axis import get_period_axis
+from artifact_store import ArtifactStore
+from loglog_model import build_loglog_data, loglog_frame
+from ttm import ttm_frames, ttm_ratios
+from instrumentation import traced_class
 try:
     from sklearn.linear_model import ElasticNetCV, LinearRegression
     from sklearn.preprocessing import StandardScaler
@@ -23,30 +29,254 @@ BS_HIERARCHY = {
     }
 }
 
+# =============================================================================
+# ANOMALY SCORES (BENEISH / ALTMAN / SLOAN) DẠNG MẢNG
+# =============================================================================
+# (khoá, sheet, pattern) — mỗi khoản mục là một hàng của ma trận (khoản mục × năm)
+ANOMALY_ITEMS = [
+    ('rev', 'INCOME STATEMENT', r'^Doanh số thuần$'),
+    ('cogs', 'INCOME STATEMENT', r'^Giá vốn hàng bán$'),
+    ('recv', 'BALANCE SHEET', r'^Các khoản phải thu$'),
+    ('ta', 'BALANCE SHEET', r'^TỔNG TÀI SẢN$'),
+    ('ca', 'BALANCE SHEET', r'^TÀI SẢN NGẮN HẠN$'),
+    ('ppe', 'BALANCE SHEET', r'^Tài sản cố định$'),
+    ('depr', 'CASH FLOW STATEMENT', r'^Khấu hao TSCĐ$'),
+    ('sell', 'INCOME STATEMENT', r'^Chi phí bán hàng$'),
+    ('admin', 'INCOME STATEMENT', r'^Chi phí quản lý'),
+    ('ni', 'INCOME STATEMENT', r'^Lãi/\(lỗ\) thuần sau thuế$'),
+    ('ocf', 'CASH FLOW STATEMENT', r'^Lưu chuyển tiền thuần từ các hoạt động sản xuất'),
+    ('npt', 'BALANCE SHEET', r'^NỢ PHẢI TRẢ$'),
+    ('nnh', 'BALANCE SHEET', r'^Nợ ngắn hạn$'),
+    ('ndh', 'BALANCE SHEET', r'^Nợ dài hạn$'),
+    ('vcsh', 'BALANCE SHEET', r'^VỐN CHỦ SỞ HỮU$'),
+    ('ebit', 'INCOME STATEMENT', r'^EBIT$'),
+    ('icf', 'CASH FLOW STATEMENT', r'^Lưu chuyển tiền tệ ròng từ hoạt động đầu tư$'),
+]
+BENEISH_KEYS = ['DSRI', 'GMI', 'AQI', 'SGI', 'DEPI', 'SGAI', 'TATA', 'LVGI', 'M-Score']
+ALTMAN_KEYS = ['X1', 'X2', 'X3', 'X4', 'Z-Score']
+
+
+def anomaly_matrix(dfs, years):
+    """Ma trận (khoản mục × năm) theo ANOMALY_ITEMS; khoản mục không có → 0, năm thiếu → NaN."""
+    mat = np.zeros((len(ANOMALY_ITEMS), len(years)))
+    for i, (_, sheet, pattern) in enumerate(ANOMALY_ITEMS):
+        row = find_row(dfs.get(sheet), pattern)
+        if row is not None:
+            mat[i] = pd.to_numeric(row.reindex(years), errors='coerce').to_numpy(dtype=float)
+    return mat
+
+
+def _safe_div(num, den, default):
+    """num / den, trả default khi den == 0 (NaN vẫn lan truyền như phép chia thường)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den != 0, num / den, default)
+
+
+def anomaly_scores(mat):
+    """
+    Beneish M-Score, Altman Z''-Score (EM, non-manufacturing), Sloan Accruals cho mọi năm cùng lúc.
+    mat: (..., khoản mục, năm) — thêm trục đầu (vd: mã CK) để chấm cả lát cắt ngang.
+    Trả về {'beneish': {thành phần: (..., năm-1)}, 'altman': {...}, 'sloan': (..., năm-1) %}.
+    """
+    item = {key: mat[..., i, :] for i, (key, _, _) in enumerate(ANOMALY_ITEMS)}
+    c = {k: v[..., 1:] for k, v in item.items()}    # năm t
+    p = {k: v[..., :-1] for k, v in item.items()}   # năm t-1
+    for side in (c, p):
+        side['cogs'] = np.abs(side['cogs'])
+        side['depr'] = np.abs(side['depr'])
+        side['sga'] = np.abs(side['sell']) + np.abs(side['admin'])
+
+    # --- BENEISH M-SCORE ---
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dsri = np.where((c['rev'] != 0) & (p['rev'] != 0) & (p['recv'] != 0),
+                        (c['recv'] / c['rev']) / (p['recv'] / p['rev']), 1.0)
+    gm_p = _safe_div(p['rev'] - p['cogs'], p['rev'], 0)
+    gm_c = _safe_div(c['rev'] - c['cogs'], c['rev'], 0)
+    gmi = _safe_div(gm_p, gm_c, 1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aq_c = np.where(c['ta'] != 0, 1 - (c['ca'] + c['ppe']) / c['ta'], 0)
+        aq_p = np.where(p['ta'] != 0, 1 - (p['ca'] + p['ppe']) / p['ta'], 0)
+    aqi = _safe_div(aq_c, aq_p, 1.0)
+    sgi = _safe_div(c['rev'], p['rev'], 1.0)
+    dep_p = _safe_div(p['depr'], p['ppe'] + p['depr'], 0)
+    dep_c = _safe_div(c['depr'], c['ppe'] + c['depr'], 0)
+    depi = _safe_div(dep_p, dep_c, 1.0)
+    sgai = _safe_div(_safe_div(c['sga'], c['rev'], 0), _safe_div(p['sga'], p['rev'], 0), 1.0)
+    tata = _safe_div(c['ni'] - c['ocf'], c['ta'], 0)
+    lev_c = _safe_div(c['nnh'] + c['ndh'], c['ta'], 0)
+    lev_p = _safe_div(p['nnh'] + p['ndh'], p['ta'], 0)
+    lvgi = _safe_div(lev_c, lev_p, 1.0)
+
+    m_score = (-4.84 + 0.92*dsri + 0.528*gmi + 0.404*aqi + 0.892*sgi
+               + 0.115*depi - 0.172*sgai + 4.679*tata - 0.327*lvgi)
+
+    # --- ALTMAN Z''-SCORE ---
+    x1 = _safe_div(c['ca'] - c['nnh'], c['ta'], 0)
+    x2 = _safe_div(c['vcsh'], c['ta'], 0)  # VCSH proxy for RE/TA
+    x3 = _safe_div(c['ebit'], c['ta'], 0)
+    x4 = _safe_div(c['vcsh'], c['npt'], 0)
+    z_score = 3.25 + 6.56*x1 + 3.26*x2 + 6.72*x3 + 1.05*x4
+
+    # --- SLOAN ACCRUALS ---
+    sloan = _safe_div(c['ni'] - c['ocf'] - c['icf'], c['ta'], 0)
+
+    beneish = dict(zip(BENEISH_KEYS, [dsri, gmi, aqi, sgi, depi, sgai, tata, lvgi, m_score]))
+    altman = dict(zip(ALTMAN_KEYS, [x1, x2, x3, x4, z_score]))
+    return {
+        'beneish': {k: np.round(v, 4) for k, v in beneish.items()},
+        'altman': {k: np.round(v, 4) for k, v in altman.items()},
+        'sloan': np.round(sloan * 100, 2),  # percent
+    }
+
+
+def anomaly_screen(dfs_by_ticker, years=None):
+    """
+    Chấm điểm bất thường cho cả lát cắt ngang mã CK trong một lần gọi (sàng lọc).
+    dfs_by_ticker: {mã: dict sheet → DataFrame}. years mặc định = hợp các năm BS của mọi mã.
+    Trả về DataFrame dài: mã, năm, M-Score, Z-Score, Sloan (%) cùng các thành phần.
+    """
+    tickers = [t for t, dfs in dfs_by_ticker.items() if dfs.get('BALANCE SHEET') is not None]
+    if years is None:
+        years = sorted({col for t in tickers for col in dfs_by_ticker[t]['BALANCE SHEET'].columns
+                        if col != 'Khoản mục'})
+    if not tickers or len(years) < 2:
+        return pd.DataFrame()
+
+    scores = anomaly_scores(np.stack([anomaly_matrix(dfs_by_ticker[t], years) for t in tickers]))
+    n_y = len(years) - 1
+    out = pd.DataFrame({'Mã': np.repeat(tickers, n_y), 'Năm': np.tile(years[1:], len(tickers))})
+    for k, v in {**scores['beneish'], **scores['altman']}.items():
+        out[k] = v.ravel()
+    out['Sloan (%)'] = scores['sloan'].ravel()
+    return out
+
+
+def _anomaly_display(numeric):
+    """Bảng hiển thị ANOMALY_SCORES (có hàng tiêu đề/ngưỡng) dựng từ kết quả số."""
+    impact_years = numeric['years']
+    blank = {y: np.nan for y in impact_years}   # giữ cột năm kiểu số để lưu được parquet
+    rows = [{'Khoản mục': '── BENEISH M-SCORE ──', **blank}]
+    for k in BENEISH_KEYS:
+        rows.append({'Khoản mục': f'  {k}', **dict(zip(impact_years, numeric['beneish_components'][k]))})
+    rows.append({'Khoản mục': '  Ngưỡng: M > −2.22 → Nghi ngờ', **blank})
+
+    rows.append({'Khoản mục': '── ALTMAN Z\'\'-SCORE ──', **blank})
+    for k in ALTMAN_KEYS:
+        rows.append({'Khoản mục': f'  {k}', **dict(zip(impact_years, numeric['altman_components'][k]))})
+    rows.append({'Khoản mục': '  Ngưỡng: Z<1.1 Nguy hiểm; 1.1-2.6 Xám; >2.6 An toàn', **blank})
+
+    rows.append({'Khoản mục': '── SLOAN ACCRUALS (%) ──', **blank})
+    rows.append({'Khoản mục': '  Sloan Ratio (%)', **dict(zip(impact_years, numeric['sloan']))})
+    rows.append({'Khoản mục': '  Ngưỡng: |Sloan|>10% Cảnh báo; >25% Nghiêm trọng', **blank})
+    return pd.DataFrame(rows)
+
+
+# =============================================================================
+# PHÂN RÃ NHÂN TỐ (CHAIN SUBSTITUTION) THEO TẬP CON
+# =============================================================================
+# Với mọi thứ tự thay thế, ảnh hưởng của nhân tố f chỉ phụ thuộc TẬP S các nhân tố đã
+# thay trước nó: E[f, S] = P(S ∪ {f}) − P(S), với P(S) = Π_k (v1_k nếu k ∈ S, ngược lại v0_k).
+# → K·2^K giá trị thay cho K! thứ tự × K² phép nhân.
+MAX_ENUM_FACTORS = 8   # tới 8! = 40320 thứ tự vẫn duyệt hết bằng mảng; lớn hơn → quy hoạch động
+
+
+def _subset_effects(v0, v1):
+    """v0, v1: (T, K). Trả về effects (K, 2^K, T); ô có f ∈ S bằng 0."""
+    n_t, n_fac = v0.shape
+    masks = np.arange(1 << n_fac)
+    prod = np.ones((1 << n_fac, n_t))
+    # Nhân tuần tự theo thứ tự nhân tố, giống hệt phép nhân lại của chain substitution
+    for k in range(n_fac):
+        in_s = ((masks >> k) & 1).astype(bool)[:, None]
+        prod = prod * np.where(in_s, v1[None, :, k], v0[None, :, k])
+    return np.stack([prod[masks | (1 << f)] - prod for f in range(n_fac)])
+
+
+def _order_masks(order):
+    """Tập (bitmask) các nhân tố đứng trước từng nhân tố trong một thứ tự thay thế."""
+    before = np.zeros(len(order), dtype=int)
+    seen = 0
+    for f in order:
+        before[f] = seen
+        seen |= 1 << f
+    return before
+
+
+def _shapley_effects(effects):
+    """Trung bình ảnh hưởng trên mọi thứ tự, dạng đóng: trọng số |S|!(K−|S|−1)!/K!."""
+    from math import factorial
+    n_fac = effects.shape[0]
+    # Tập đầy đủ không bao giờ loại trừ f → trọng số 0
+    sizes = [bin(m).count('1') for m in range(1 << n_fac)]
+    weights = np.array([factorial(s) * factorial(n_fac - s - 1) if s < n_fac else 0 for s in sizes],
+                       dtype=float) / factorial(n_fac)
+    out = np.zeros((n_fac, effects.shape[2]))
+    for f in range(n_fac):
+        excl = ((np.arange(1 << n_fac) >> f) & 1) == 0
+        out[f] = weights[excl] @ effects[f, excl]
+    return out
+
+
+def _best_fit_order(eff_betas, ols_betas):
+    """
+    Thứ tự thay thế có ||β hiệu dụng − OLS β|| nhỏ nhất. eff_betas: (K, 2^K) theo (f, S).
+    K ≤ MAX_ENUM_FACTORS: duyệt mọi hoán vị (thứ tự từ điển, lấy hoán vị đầu tiên khi bằng nhau);
+    lớn hơn: quy hoạch động trên tập con, O(2^K·K).
+    """
+    from itertools import permutations
+    n_fac = len(ols_betas)
+    if n_fac <= MAX_ENUM_FACTORS:
+        perms = np.array(list(permutations(range(n_fac))))
+        bits = 1 << perms
+        prefix = np.cumsum(bits, axis=1) - bits
+        before = np.empty_like(perms)
+        before[np.arange(len(perms))[:, None], perms] = prefix
+        chosen = eff_betas[np.arange(n_fac)[None, :], before]
+        scores = np.linalg.norm(chosen - ols_betas, axis=1)
+        scores = np.where(np.isnan(scores), np.inf, scores)
+        return [int(f) for f in perms[int(np.argmin(scores))]]
+
+    cost = (eff_betas - np.asarray(ols_betas)[:, None]) ** 2
+    cost = np.where(np.isnan(cost), np.inf, cost)
+    full = (1 << n_fac) - 1
+    best = np.full(1 << n_fac, np.inf)
+    best[0] = 0.0
+    last = np.full(1 << n_fac, -1)
+    for mask in range(full):
+        for f in range(n_fac):
+            if mask >> f & 1:
+                continue
+            nxt = mask | (1 << f)
+            score = best[mask] + cost[f, mask]
+            if score < best[nxt] or last[nxt] < 0:
+                best[nxt] = score
+                last[nxt] = f
+    order, mask = [], full
+    while mask:
+        f = int(last[mask])
+        order.append(f)
+        mask &= ~(1 << f)
+    return order[::-1]
+
+
+@traced_class('calculator')
 class Calculator:
     def __init__(self, dfs_dict=None, in_dir=None):
         """
-        Input: Dictionary of DataFrames or directory path containing CSVs from stage 1.
+        Input: Dictionary of DataFrames or directory path containing artifacts from stage 1.
         """
         import os
         if in_dir and os.path.exists(in_dir):
-            self.dfs = {}
-            for f in os.listdir(in_dir):
-                if f.endswith('.csv'):
-                    name = f.replace('.csv', '')
-                    self.dfs[name] = pd.read_csv(os.path.join(in_dir, f))
+            self.dfs = ArtifactStore(in_dir).load_all(include_json=False)
         else:
             self.dfs = dfs_dict or {}
 
     def _get_row(self, df, pattern):
-        """Helper to get a row by regex pattern."""
-        row = df[df['Khoản mục'].str.contains(pattern, case=False, na=False, regex=True)]
-        if not row.empty:
-            return row.iloc[0]
-        return None
+        """Helper to get a row by regex pattern (qua chỉ mục Khoản mục dùng chung)."""
+        return find_row(df, pattern)
 
     def _get_years(self, df):
-        return [col for col in df.columns if col != 'Khoản mục']
+        return get_period_axis(df).periods
 
     def _average_balance(self, df, pattern, years):
         row = self._get_row(df, pattern)
@@ -245,19 +475,16 @@ class Calculator:
 
         self.dfs['BS_VERTICAL'] = pd.DataFrame(rows)
 
-        # --- IS Common-Size ---
+        # --- IS Common-Size --- (cả bảng chia cho dòng Doanh thu, broadcast theo năm)
         revenue_row = self._get_row(is_df, r'^Doanh số thuần$')
         if revenue_row is not None:
-            rev_vals = revenue_row[years].astype(float)
-            cs_rows = []
-            for _, r in is_df.iterrows():
-                item = r['Khoản mục']
-                vals = r[years].astype(float)
+            rev_vals = revenue_row[years].to_numpy(dtype=float)
+            vals = is_df[years].to_numpy(dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
                 pct = np.where(rev_vals != 0, vals / rev_vals * 100, 0)
-                row = {'Khoản mục': item}
-                row.update(dict(zip(years, pct)))
-                cs_rows.append(row)
-            self.dfs['IS_VERTICAL'] = pd.DataFrame(cs_rows)
+            cs = pd.DataFrame(pct, columns=years)
+            cs.insert(0, 'Khoản mục', is_df['Khoản mục'].to_numpy())
+            self.dfs['IS_VERTICAL'] = cs
 
     # =========================================================================
     # METHOD 3: Horizontal Analysis (YoY% cho BS, IS, CF)
@@ -270,25 +497,42 @@ class Calculator:
             if df is None:
                 continue
 
-            years = self._get_years(df)
-            if len(years) < 2:
+            axis = get_period_axis(df)
+            years = axis.periods
+            # Ghép mỗi kỳ với CÙNG kỳ năm trước theo khoá (năm, quý), không theo vị trí cột:
+            # chuỗi quý thiếu một quý không làm so sánh lệch sang quý khác. Kỳ không có cặp → bỏ qua.
+            position = {key: i for i, key in enumerate(axis.keys)}
+            pairs = [(i, position[(y - 1, q)]) for i, (y, q) in enumerate(axis.keys) if (y - 1, q) in position]
+            if not pairs:
                 continue
+            curr_idx, prev_idx = (np.array(idx) for idx in zip(*pairs))
 
-            yoy_rows = []
-            for _, r in df.iterrows():
-                item = r['Khoản mục']
-                row = {'Khoản mục': item}
-                for i in range(1, len(years)):
-                    prev_val = float(r[years[i - 1]])
-                    curr_val = float(r[years[i]])
-                    if abs(prev_val) > 0:
-                        yoy = (curr_val - prev_val) / abs(prev_val) * 100
-                    else:
-                        yoy = 0.0
-                    row[f'{years[i]} YoY%'] = round(yoy, 2)
-                yoy_rows.append(row)
-
-            self.dfs[suffix] = pd.DataFrame(yoy_rows)
+            # So sánh từng cặp kỳ cách nhau một năm trên cả ma trận; kỳ trước bằng 0/NaN → 0
+            vals = df[years].to_numpy(dtype=float)
+            prev, curr = vals[:, prev_idx], vals[:, curr_idx]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                yoy = np.where(np.abs(prev) > 0, (curr - prev) / np.abs(prev) * 100, 0.0)
+
+            yoy_df = pd.DataFrame(np.round(yoy, 2), columns=[f'{years[i]} YoY%' for i in curr_idx])
+            yoy_df.insert(0, 'Khoản mục', df['Khoản mục'].to_numpy())
+            self.dfs[suffix] = yoy_df
+
+    # =========================================================================
+    # METHOD 3b: TTM (Trailing Twelve Months) cho số liệu quý
+    # =========================================================================
+    def calculate_ttm(self):
+        """
+        Báo cáo quý → IS_TTM, CF_TTM (tổng 4 quý), BS_TTM_AVG (bình quân 4 quý) và TTM_RATIOS.
+        Mỗi bảng chỉ chạy cửa sổ trượt một lần trên cả ma trận (ghi nhớ trong ttm.py);
+        số liệu năm → bỏ qua.
+        """
+        ttm = ttm_frames(self.dfs)
+        if not ttm:
+            return
+        self.dfs.update(ttm)
+        ratios = ttm_ratios(ttm)
+        if ratios is not None:
+            self.dfs['TTM_RATIOS'] = ratios
 
     # =========================================================================
     # METHOD 4: DPO & Cash Conversion Cycle
@@ -496,141 +740,27 @@ class Calculator:
     # =========================================================================
     def calculate_anomaly_scores(self):
         """Tính Beneish M-Score, Altman Z''-Score, Sloan Accruals."""
-        is_df = self.dfs.get('INCOME STATEMENT')
-        bs_df = self.dfs.get('BALANCE SHEET')
-        cf_df = self.dfs.get('CASH FLOW STATEMENT')
-        if is_df is None or bs_df is None or cf_df is None:
+        if any(self.dfs.get(sheet) is None for sheet in ('INCOME STATEMENT', 'BALANCE SHEET', 'CASH FLOW STATEMENT')):
             return
 
-        years = self._get_years(bs_df)
+        years = self._get_years(self.dfs['BALANCE SHEET'])
         if len(years) < 2:
             return
 
-        def _v(row, yr):
-            return float(row[yr]) if row is not None else 0.0
-
-        # Fetch all needed rows
-        rev_row = self._get_row(is_df, r'^Doanh số thuần$')
-        cogs_row = self._get_row(is_df, r'^Giá vốn hàng bán$')
-        recv_row = self._get_row(bs_df, r'^Các khoản phải thu$')
-        ta_row = self._get_row(bs_df, r'^TỔNG TÀI SẢN$')
-        ca_row = self._get_row(bs_df, r'^TÀI SẢN NGẮN HẠN$')
-        ppe_row = self._get_row(bs_df, r'^Tài sản cố định$')
-        depr_row = self._get_row(cf_df, r'^Khấu hao TSCĐ$')
-        sell_row = self._get_row(is_df, r'^Chi phí bán hàng$')
-        admin_row = self._get_row(is_df, r'^Chi phí quản lý')
-        ni_row = self._get_row(is_df, r'^Lãi/\(lỗ\) thuần sau thuế$')
-        ocf_row = self._get_row(cf_df, r'^Lưu chuyển tiền thuần từ các hoạt động sản xuất')
-        npt_row = self._get_row(bs_df, r'^NỢ PHẢI TRẢ$')
-        nnh_row = self._get_row(bs_df, r'^Nợ ngắn hạn$')
-        ndh_row = self._get_row(bs_df, r'^Nợ dài hạn$')
-        vcsh_row = self._get_row(bs_df, r'^VỐN CHỦ SỞ HỮU$')
-        ebit_row = self._get_row(is_df, r'^EBIT$')
-        icf_row = self._get_row(cf_df, r'^Lưu chuyển tiền tệ ròng từ hoạt động đầu tư$')
-
-        score_rows = []
-        beneish_components = {k: [] for k in ['DSRI','GMI','AQI','SGI','DEPI','SGAI','TATA','LVGI','M-Score']}
-        altman_components = {k: [] for k in ['X1','X2','X3','X4','Z-Score']}
-        sloan_vals = []
+        scores = anomaly_scores(anomaly_matrix(self.dfs, years))
         impact_years = years[1:]  # Beneish cần t-1
 
-        for i in range(1, len(years)):
-            yp, yc = years[i-1], years[i]
-
-            # --- BENEISH M-SCORE ---
-            rev_c = _v(rev_row, yc); rev_p = _v(rev_row, yp)
-            recv_c = _v(recv_row, yc); recv_p = _v(recv_row, yp)
-            cogs_c = abs(_v(cogs_row, yc)); cogs_p = abs(_v(cogs_row, yp))
-            ta_c = _v(ta_row, yc); ta_p = _v(ta_row, yp)
-            ca_c = _v(ca_row, yc); ca_p = _v(ca_row, yp)
-            ppe_c = _v(ppe_row, yc); ppe_p = _v(ppe_row, yp)
-            depr_c = abs(_v(depr_row, yc)); depr_p = abs(_v(depr_row, yp))
-            sga_c = abs(_v(sell_row, yc)) + abs(_v(admin_row, yc))
-            sga_p = abs(_v(sell_row, yp)) + abs(_v(admin_row, yp))
-            ni_c = _v(ni_row, yc)
-            ocf_c = _v(ocf_row, yc)
-            nnh_c = _v(nnh_row, yc); nnh_p = _v(nnh_row, yp)
-            ndh_c = _v(ndh_row, yc); ndh_p = _v(ndh_row, yp)
-
-            # DSRI
-            dsri = ((recv_c / rev_c) / (recv_p / rev_p)) if rev_c != 0 and rev_p != 0 and recv_p != 0 else 1.0
-            # GMI
-            gm_p = (rev_p - cogs_p) / rev_p if rev_p != 0 else 0
-            gm_c = (rev_c - cogs_c) / rev_c if rev_c != 0 else 0
-            gmi = gm_p / gm_c if gm_c != 0 else 1.0
-            # AQI
-            aq_c = 1 - (ca_c + ppe_c) / ta_c if ta_c != 0 else 0
-            aq_p = 1 - (ca_p + ppe_p) / ta_p if ta_p != 0 else 0
-            aqi = aq_c / aq_p if aq_p != 0 else 1.0
-            # SGI
-            sgi = rev_c / rev_p if rev_p != 0 else 1.0
-            # DEPI
-            dep_p = depr_p / (ppe_p + depr_p) if (ppe_p + depr_p) != 0 else 0
-            dep_c = depr_c / (ppe_c + depr_c) if (ppe_c + depr_c) != 0 else 0
-            depi = dep_p / dep_c if dep_c != 0 else 1.0
-            # SGAI
-            sga_ratio_c = sga_c / rev_c if rev_c != 0 else 0
-            sga_ratio_p = sga_p / rev_p if rev_p != 0 else 0
-            sgai = sga_ratio_c / sga_ratio_p if sga_ratio_p != 0 else 1.0
-            # TATA
-            tata = (ni_c - ocf_c) / ta_c if ta_c != 0 else 0
-            # LVGI
-            lev_c = (nnh_c + ndh_c) / ta_c if ta_c != 0 else 0
-            lev_p = (nnh_p + ndh_p) / ta_p if ta_p != 0 else 0
-            lvgi = lev_c / lev_p if lev_p != 0 else 1.0
-
-            m_score = (-4.84 + 0.92*dsri + 0.528*gmi + 0.404*aqi + 0.892*sgi
-                       + 0.115*depi - 0.172*sgai + 4.679*tata - 0.327*lvgi)
-
-            for k, v in [('DSRI',dsri),('GMI',gmi),('AQI',aqi),('SGI',sgi),
-                         ('DEPI',depi),('SGAI',sgai),('TATA',tata),('LVGI',lvgi),('M-Score',m_score)]:
-                beneish_components[k].append(round(v, 4))
-
-            # --- ALTMAN Z''-SCORE (EM, non-manufacturing) ---
-            wc = ca_c - nnh_c
-            x1 = wc / ta_c if ta_c != 0 else 0
-            x2 = _v(vcsh_row, yc) / ta_c if ta_c != 0 else 0  # VCSH proxy for RE/TA
-            x3 = _v(ebit_row, yc) / ta_c if ta_c != 0 else 0
-            npt_c = _v(npt_row, yc)
-            x4 = _v(vcsh_row, yc) / npt_c if npt_c != 0 else 0
-
-            z_score = 3.25 + 6.56*x1 + 3.26*x2 + 6.72*x3 + 1.05*x4
-
-            for k, v in [('X1',x1),('X2',x2),('X3',x3),('X4',x4),('Z-Score',z_score)]:
-                altman_components[k].append(round(v, 4))
-
-            # --- SLOAN ACCRUALS ---
-            icf_c = _v(icf_row, yc)
-            sloan = (ni_c - ocf_c - icf_c) / ta_c if ta_c != 0 else 0
-            sloan_vals.append(round(sloan * 100, 2))  # percent
-
-        # Build output DataFrame
-        anomaly_rows = []
-        anomaly_rows.append({'Khoản mục': '── BENEISH M-SCORE ──', **{y: '' for y in impact_years}})
-        for k in ['DSRI','GMI','AQI','SGI','DEPI','SGAI','TATA','LVGI','M-Score']:
-            anomaly_rows.append({'Khoản mục': f'  {k}', **dict(zip(impact_years, beneish_components[k]))})
-        anomaly_rows.append({'Khoản mục': '  Ngưỡng: M > −2.22 → Nghi ngờ', **{y: '' for y in impact_years}})
-
-        anomaly_rows.append({'Khoản mục': '── ALTMAN Z\'\'-SCORE ──', **{y: '' for y in impact_years}})
-        for k in ['X1','X2','X3','X4','Z-Score']:
-            anomaly_rows.append({'Khoản mục': f'  {k}', **dict(zip(impact_years, altman_components[k]))})
-        anomaly_rows.append({'Khoản mục': '  Ngưỡng: Z<1.1 Nguy hiểm; 1.1-2.6 Xám; >2.6 An toàn', **{y: '' for y in impact_years}})
-
-        anomaly_rows.append({'Khoản mục': '── SLOAN ACCRUALS (%) ──', **{y: '' for y in impact_years}})
-        anomaly_rows.append({'Khoản mục': '  Sloan Ratio (%)', **dict(zip(impact_years, sloan_vals))})
-        anomaly_rows.append({'Khoản mục': '  Ngưỡng: |Sloan|>10% Cảnh báo; >25% Nghiêm trọng', **{y: '' for y in impact_years}})
-
-        self.dfs['ANOMALY_SCORES'] = pd.DataFrame(anomaly_rows)
-
         # Store numeric values separately for charting
-        self.dfs['ANOMALY_NUMERIC'] = {
+        numeric = {
             'years': impact_years,
-            'beneish': beneish_components['M-Score'],
-            'altman': altman_components['Z-Score'],
-            'sloan': sloan_vals,
-            'beneish_components': beneish_components,
-            'altman_components': altman_components,
+            'beneish': scores['beneish']['M-Score'].tolist(),
+            'altman': scores['altman']['Z-Score'].tolist(),
+            'sloan': scores['sloan'].tolist(),
+            'beneish_components': {k: v.tolist() for k, v in scores['beneish'].items()},
+            'altman_components': {k: v.tolist() for k, v in scores['altman'].items()},
         }
+        self.dfs['ANOMALY_NUMERIC'] = numeric
+        self.dfs['ANOMALY_SCORES'] = _anomaly_display(numeric)
 
     # =========================================================================
     # METHOD 7: Dupont 3 bước (ROE) + ROA 4 nhân tố + ROIC 2 nhân tố
@@ -729,17 +859,18 @@ class Calculator:
             self.dfs['DUPONT_ROIC'] = pd.DataFrame(roic_rows)
 
     # =========================================================================
-    # METHOD 8: Dupont Factor Impact — OLS Best-fit only (Shapley removed)
+    # METHOD 8: Dupont Factor Impact — OLS Best-fit (mặc định) hoặc Shapley dạng đóng
     #           Applies to ROE (3 factors), ROA (4 factors), ROIC (2 factors)
     # =========================================================================
-    def _generic_factor_impact(self, dupont_df, factors, metric_name):
-        """Generic OLS best-fit chain substitution for any DuPont decomposition.
-        
+    def _generic_factor_impact(self, dupont_df, factors, metric_name, method='best_fit'):
+        """Generic chain substitution for any DuPont decomposition.
+
         factors: list of (row_pattern, factor_label, is_pct) tuples
+        method : 'best_fit' — thứ tự thay thế có β hiệu dụng gần OLS β nhất
+                 'shapley'  — trung bình trên mọi thứ tự (tổng đúng bằng Δ thực tế)
+        Mọi thứ tự được tính cùng lúc qua ảnh hưởng theo tập con (_subset_effects).
         Returns (impact_df, betas_dict) or (None, None)
         """
-        from itertools import permutations as _permutations
-
         if dupont_df is None:
             return None, None
 
@@ -750,90 +881,71 @@ class Calculator:
         # Get factor rows and metric row
         fac_data = {}
         for pattern, label, is_pct in factors:
-            row = dupont_df[dupont_df['Khoản mục'].str.contains(pattern, regex=True)]
-            if row.empty:
+            row = find_row(dupont_df, pattern, case=True)
+            if row is None:
                 return None, None
-            vals = row.iloc[0][dp_years].astype(float)
+            vals = row[dp_years].astype(float)
             fac_data[label] = vals / 100 if is_pct else vals
 
         # Get the metric (ROE/ROA/ROIC)
-        metric_row = dupont_df[dupont_df['Khoản mục'].str.contains(metric_name, regex=True)]
-        if metric_row.empty:
+        metric_row = find_row(dupont_df, metric_name, case=True)
+        if metric_row is None:
             return None, None
-        metric_vals = metric_row.iloc[0][dp_years].astype(float) / 100
+        metric_vals = metric_row[dp_years].astype(float) / 100
 
         impact_years = dp_years[1:]
         fac_labels = [f[1] for f in factors]
-        ALL_PERMS = list(_permutations(fac_labels))
-
-        def _chain_sub(v0, v1, order):
-            cur = dict(v0)
-            effects = {}
-            for fac in order:
-                prod_old = 1.0
-                for k in fac_labels:
-                    prod_old *= cur[k]
-                cur[fac] = v1[fac]
-                prod_new = 1.0
-                for k in fac_labels:
-                    prod_new *= cur[k]
-                effects[fac] = prod_new - prod_old
-            return effects
-
-        perm_effects = {p: [] for p in ALL_PERMS}
-        delta_actual = []
-        deltas_by_fac = {f: [] for f in fac_labels}
-
-        for i in range(1, len(dp_years)):
-            yp, yc = dp_years[i-1], dp_years[i]
-            v0 = {f: fac_data[f][yp] for f in fac_labels}
-            v1 = {f: fac_data[f][yc] for f in fac_labels}
-            for perm in ALL_PERMS:
-                perm_effects[perm].append(_chain_sub(v0, v1, perm))
-            delta_actual.append((metric_vals[yc] - metric_vals[yp]) * 100)
-            for f in fac_labels:
-                deltas_by_fac[f].append(fac_data[f][yc] - fac_data[f][yp])
-
         n_t = len(impact_years)
 
+        # Ma trận (năm, nhân tố): v0 = năm trước, v1 = năm hiện tại
+        values = np.column_stack([fac_data[f].to_numpy(dtype=float) for f in fac_labels])
+        v0, v1 = values[:-1], values[1:]
+        deltas = v1 - v0
+        metric_arr = metric_vals.to_numpy(dtype=float)
+        delta_actual = list((metric_arr[1:] - metric_arr[:-1]) * 100)
+
+        # effects[f, S, t]: ảnh hưởng của f khi tập S đã được thay trước
+        effects = _subset_effects(v0, v1)
+
         # OLS β
-        X_ols = np.column_stack([deltas_by_fac[f] for f in fac_labels])
-        y_ols = np.array(delta_actual)
         try:
-            ols_betas, _, _, _ = np.linalg.lstsq(X_ols, y_ols, rcond=None)
+            ols_betas, _, _, _ = np.linalg.lstsq(deltas, np.array(delta_actual), rcond=None)
         except Exception:
             ols_betas = np.ones(len(fac_labels))
 
-        # Best-fit permutation
-        best_perm = ALL_PERMS[0]
-        best_score = np.inf
-        for perm in ALL_PERMS:
-            eff_betas = []
-            for idx, fac in enumerate(fac_labels):
-                eff = np.array([perm_effects[perm][t][fac] * 100 for t in range(n_t)])
-                d = np.array(deltas_by_fac[fac])
-                var_d = np.var(d)
-                eff_beta = float(np.cov(eff, d)[0, 1] / var_d) if var_d > 1e-12 else 0.0
-                eff_betas.append(eff_beta)
-            score = float(np.linalg.norm(np.array(eff_betas) - ols_betas))
-            if score < best_score:
-                best_score = score
-                best_perm = perm
-
-        best_label = ' → '.join(best_perm)
+        # Best-fit order: β hiệu dụng của f chỉ phụ thuộc (f, S) → bảng K × 2^K thay vì K! lần.
+        # β[f, S] = cov(effects[f, S]·100, Δf) / var(Δf), tính một lượt cho mọi ô (cov ddof=1 như np.cov)
+        n_fac = len(fac_labels)
+        eff = effects * 100
+        eff_c = eff - eff.mean(axis=-1, keepdims=True)
+        d_c = deltas - deltas.mean(axis=0)
+        cov = np.einsum('fst,tf->fs', eff_c, d_c) / max(n_t - 1, 1)
+        var_d = deltas.var(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            eff_betas = np.where(var_d[:, None] > 1e-12, cov / var_d[:, None], 0.0)
+        in_s = (np.arange(1 << n_fac)[None, :] >> np.arange(n_fac)[:, None]) & 1
+        eff_betas[in_s.astype(bool)] = np.nan
+        best_order = _best_fit_order(eff_betas, ols_betas)
+
+        best_label = ' → '.join(fac_labels[f] for f in best_order)
         ols_parts = ' | '.join([f'{f}={ols_betas[i]:.3f}' for i, f in enumerate(fac_labels)])
         ols_str = f"OLS β: {ols_parts} | Best-fit: {best_label}"
 
-        # Build impact rows - Best-fit only (no Shapley)
-        bf = {fac: [perm_effects[best_perm][t][fac] * 100 for t in range(n_t)]
-              for fac in fac_labels}
-
         impact_rows = []
-        for fac in fac_labels:
-            impact_rows.append({
-                'Khoản mục': f'[Best: {best_label}] {fac} (%pts)',
-                **dict(zip(impact_years, bf[fac]))
-            })
+        if method == 'shapley':
+            shapley = _shapley_effects(effects) * 100
+            for i, fac in enumerate(fac_labels):
+                impact_rows.append({
+                    'Khoản mục': f'[Shapley] {fac} (%pts)',
+                    **dict(zip(impact_years, shapley[i].tolist()))
+                })
+        else:
+            before = _order_masks(best_order)
+            for i, fac in enumerate(fac_labels):
+                impact_rows.append({
+                    'Khoản mục': f'[Best: {best_label}] {fac} (%pts)',
+                    **dict(zip(impact_years, (effects[i, before[i]] * 100).tolist()))
+                })
         impact_rows.append({
             'Khoản mục': f'Δ{metric_name.replace("(Dupont)", "").strip()} Thực tế (%)',
             **dict(zip(impact_years, delta_actual))
@@ -849,8 +961,11 @@ class Calculator:
 
         return pd.DataFrame(impact_rows), betas
 
-    def dupont_factor_impact(self):
-        """Phân rã ảnh hưởng nhân tố cho ROE, ROA, ROIC — chỉ Best-fit OLS."""
+    def dupont_factor_impact(self, method='best_fit'):
+        """
+        Phân rã ảnh hưởng nhân tố cho ROA, ROIC (ROE đã tắt).
+        method: 'best_fit' (mặc định, ghi vào artifact) hoặc 'shapley' (Dashboard tính theo yêu cầu).
+        """
 
         # MỚI: Đã vô hiệu hóa phân rã ROE do yếu tố nhiễu Vốn chủ sở hữu âm
         # roe_impact, roe_betas = self._generic_factor_impact(...)
@@ -863,7 +978,7 @@ class Calculator:
             self.dfs.get('DUPONT_ROA'),
             [(r'^Tax Burden', 'TaxB', False), (r'^Interest Burden', 'IntB', False),
              (r'^EBIT Margin', 'EBIT_M', True), (r'^Asset Turnover', 'AT', False)],
-            r'ROA'
+            r'ROA', method=method
         )
         if roa_impact is not None:
             self.dfs['DUPONT_IMPACT_ROA'] = roa_impact
@@ -873,7 +988,7 @@ class Calculator:
         roic_impact, roic_betas = self._generic_factor_impact(
             self.dfs.get('DUPONT_ROIC'),
             [(r'^NOPAT Margin', 'NOPAT_M', True), (r'^IC Turnover', 'IC_T', False)],
-            r'ROIC'
+            r'ROIC', method=method
         )
         if roic_impact is not None:
             self.dfs['DUPONT_IMPACT_ROIC'] = roic_impact
@@ -893,7 +1008,8 @@ class Calculator:
         is_df = self.dfs.get('INCOME STATEMENT')
         if is_df is None: return
 
-        years = self._get_years(is_df)
+        # Báo cáo quý → hồi quy trên số liệu TTM (kỳ đủ 4 quý liên tiếp)
+        is_df, years = loglog_frame(is_df)
         if len(years) < 5: return
 
         rev_row = self._get_row(is_df, r'^Doanh số thuần$')
@@ -908,71 +1024,28 @@ class Calculator:
         for i in range(len(int_vals)):
             if int_vals[i] < 0: int_vals[i] = -int_vals[i]
             
-        tc_vals = rev_vals - ebit_vals
-
-        # Chống log(số âm) - Ép giá trị dương trước khi tính Logarit
-        tc_vals_safe = np.maximum(tc_vals, 1.0)
-        rev_vals_safe = np.maximum(rev_vals, 1.0)
-
-        macro_fx = {}
-        macro_oil = {}
-        
-        # Read from pipeline MACRO_DATA
         df_macro = self.dfs.get('MACRO_DATA')
-        if df_macro is not None and not df_macro.empty:
-            for _, row in df_macro.iterrows():
-                try:
-                    yr = str(int(row['Year']))
-                    if pd.notna(row['Oil_Price']): 
-                        macro_oil[yr] = float(row['Oil_Price'])
-                    if pd.notna(row['FX_Rate']): 
-                        macro_fx[yr] = float(row['FX_Rate'])
-                except Exception:
-                    pass
-        else:
+        if df_macro is None or df_macro.empty:
             print("Lưu ý: Không tìm thấy MACRO_DATA trong pipeline, sử dụng dữ liệu fallback.")
 
-        fx_arr = np.array([macro_fx.get(str(y), 24000) for y in years])
-        oil_arr = np.array([macro_oil.get(str(y), 90) for y in years])
-        
-        # Dummy Covid (2020-2022 = 1, else 0)
-        covid_dummy = np.array([1 if str(y) in ['2020', '2021', '2022'] else 0 for y in years])
-
-        # =====================================================================
-        # Bước 1: Log-transform
-        # =====================================================================
-        ln_TC  = np.log(tc_vals_safe)
-        ln_Q   = np.log(rev_vals_safe)
-        ln_oil = np.log(oil_arr)
-        ln_fx  = np.log(fx_arr)
-
-        from sklearn.linear_model import LinearRegression
-
         # =====================================================================
-        # Bước 2: TRỰC GIAO HÓA FRISCH-WAUGH-LOVELL (FWL)
+        # Bước 1 + 2: Log-transform & TRỰC GIAO HÓA FRISCH-WAUGH-LOVELL (FWL)
         # Giải phẫu đa cộng tuyến bằng cách loại bỏ xu hướng chung giữa
-        # ln(FX), ln(Oil) và ln(Revenue) trước khi hồi quy chính thức.
+        # ln(FX), ln(Oil) và ln(Revenue) trước khi hồi quy chính thức:
+        #   resid_fx / resid_oil = cú sốc tỷ giá / giá dầu thuần túy (phần dư của FX~Q, Oil~Q)
+        #   ln(TC) = α + β_Q·ln(Q) + ε_oil·resid(Oil|Q) + ε_fx·resid(FX|Q) + γ·Covid
+        # Mô hình dùng chung (và chỉ fit một lần) với các kiểm định của DiagnosticsEngine.
         # =====================================================================
-
-        # ── Bước 2a: Hồi quy phụ — Trích xuất phần dư (Residuals) ──
-        # Mục đích: Loại bỏ phần biến động FX/Oil mà "đi cùng" với Revenue trend
-        # Kết quả: resid_fx = cú sốc tỷ giá thuần túy (exogenous FX shock)
-        #          resid_oil = cú sốc giá dầu thuần túy (exogenous Oil shock)
-
-        # FX ~ Revenue: Phần FX tương quan với chu kỳ doanh thu
-        reg_fx_aux = LinearRegression().fit(ln_Q.reshape(-1, 1), ln_fx)
-        resid_fx = ln_fx - reg_fx_aux.predict(ln_Q.reshape(-1, 1))  # Pure FX shocks
-
-        # Oil ~ Revenue: Phần Oil tương quan với chu kỳ doanh thu
-        reg_oil_aux = LinearRegression().fit(ln_Q.reshape(-1, 1), ln_oil)
-        resid_oil = ln_oil - reg_oil_aux.predict(ln_Q.reshape(-1, 1))  # Pure Oil shocks
-
-        # ── Bước 2b: Mô hình chính với biến đã trực giao hóa ──
-        # ln(TC) = α + β_Q·ln(Q) + ε_oil·resid(Oil|Q) + ε_fx·resid(FX|Q) + γ·Covid
-        X_fwl = np.column_stack((ln_Q, resid_oil, resid_fx, covid_dummy))
-        y_fwl = ln_TC
-
-        reg_main = LinearRegression(fit_intercept=True).fit(X_fwl, y_fwl)
+        loglog = build_loglog_data(is_df, df_macro, years)
+        if loglog is None: return
+        tc_vals = loglog['tc_vals']
+        oil_arr, fx_arr = loglog['oil_arr'], loglog['fx_arr']
+        covid_dummy = loglog['covid_dummy']
+        ln_Q = loglog['ln_Q']
+        resid_oil, resid_fx = loglog['resid_oil'], loglog['resid_fx']
+        X_fwl, y_fwl = loglog['X_fwl'], loglog['y_fwl']
+
+        reg_main = loglog['reg_main']
         elasticity_q   = float(reg_main.coef_[0])
         elasticity_oil = float(reg_main.coef_[1])
         elasticity_fx  = float(reg_main.coef_[2])
@@ -1038,6 +1111,8 @@ class Calculator:
         # =====================================================================
         try:
             cf_df = self.dfs.get('CASH FLOW STATEMENT')
+            if cf_df is not None and get_period_axis(cf_df).is_quarterly:
+                cf_df = loglog_frame(cf_df)[0]
             
             # Tính FC, VC, BEP, EBIT Margin lịch sử cho từng năm
             depr_row = self._get_row(cf_df, r'^Khấu hao TSCĐ$') if cf_df is not None else None
@@ -1137,6 +1212,7 @@ class Calculator:
         Output: Dictionary containing all processed DataFrames
         """
         self.calculate_missing_variables()
+        self.calculate_ttm()
         self.vertical_analysis()
         self.horizontal_analysis()
         self.calculate_dpo_ccc()
@@ -1282,23 +1358,8 @@ class Calculator:
         
         self.dfs['LIQUIDITY_CASHFLOW'] = pd.DataFrame(rows)
 
-    def save_outputs(self, out_dir="output/2_calculated"):
-        import os
-        import json
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-        for name, data in self.dfs.items():
-            if hasattr(data, 'to_csv'):
-                filename = f"{name}.csv"
-                filepath = os.path.join(out_dir, filename)
-                data.to_csv(filepath, index=False)
-                print(f"Saved: {filepath}")
-            elif isinstance(data, dict):
-                filename = f"{name}.json"
-                filepath = os.path.join(out_dir, filename)
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=4)
-                print(f"Saved: {filepath}")
+    def save_outputs(self, out_dir="output/2_calculated", fmt=None, export_csv=False):
+        ArtifactStore(out_dir, fmt=fmt, export_csv=export_csv).save_all(self.dfs)
 
 if __name__ == "__main__":
     from data_processor import DataProcessor
@@ -0,0 +1,224 @@
+"""
+compute_cache.py — Bộ nhớ đệm kết quả tính toán cho Dashboard (bền vững, LRU)
+=============================================================================
+Độc lập với st.cache_*: kết quả Forecaster / Diagnostics / Calculator được lưu
+theo khoá = SHA-256 của
+  - phiên bản mã nguồn (stage_cache.code_version: sửa src/ → khoá mới)
+  - fingerprint bộ dữ liệu (băm NỘI DUNG artifact hoặc DataFrame)
+  - tên phép tính + tham số (mảng numpy / DataFrame được băm theo nội dung)
+
+Hai tầng:
+  - RAM  : OrderedDict LRU (memory_entries phần tử) cho các lần rerun trong tiến trình
+  - Đĩa  : output/.compute_cache/*.pkl, giới hạn số entry và tổng dung lượng,
+           loại bỏ entry dùng lâu nhất trước (mtime được cập nhật mỗi lần trúng)
+nên cache còn nguyên qua các session và khi khởi động lại server.
+
+Huỷ hiệu lực tường minh: invalidate(dataset=..., name=...) hoặc clear().
+Giá trị trả về được dùng chung giữa các lần gọi — nơi dùng không sửa tại chỗ.
+Một instance được chia sẻ giữa các session Streamlit (st.cache_resource): tầng RAM
+được khoá bằng threading.Lock; phép tính fn chạy ngoài khoá.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from stage_cache import _file_digest, code_version
+
+DEFAULT_ROOT = "output/.compute_cache"
+
+_DIGESTS = {}   # (path, size, mtime_ns) → sha256 nội dung file
+
+
+# =============================================================================
+# FINGERPRINT
+# =============================================================================
+def artifact_fingerprint(dirs):
+    """
+    Fingerprint nội dung các thư mục artifact (vd: output/2_calculated).
+    Mỗi file chỉ băm lại khi kích thước/mtime đổi, nên gọi ở mỗi lần rerun vẫn rẻ.
+    """
+    h = hashlib.sha256()
+    for d in dirs:
+        if not os.path.isdir(d):
+            continue
+        for name in sorted(os.listdir(d)):
+            path = os.path.join(d, name)
+            if not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            token = (path, st.st_size, st.st_mtime_ns)
+            if token not in _DIGESTS:
+                _DIGESTS[token] = _file_digest(path)
+            h.update(f"{os.path.basename(d)}/{name}:{_DIGESTS[token]}\n".encode('utf-8'))
+    return h.hexdigest()
+
+
+def _hash_value(h, value):
+    if isinstance(value, pd.DataFrame):
+        h.update(repr(list(value.columns)).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        arr = np.ascontiguousarray(value)
+        h.update(f"{arr.dtype}{arr.shape}".encode('ascii'))
+        h.update(arr.tobytes())
+    elif isinstance(value, dict):
+        for k in sorted(value, key=str):
+            h.update(str(k).encode('utf-8'))
+            _hash_value(h, value[k])
+    elif isinstance(value, (list, tuple)):
+        h.update(f"{type(value).__name__}{len(value)}".encode('ascii'))
+        for v in value:
+            _hash_value(h, v)
+    else:
+        h.update(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+def dataset_fingerprint(dfs):
+    """Fingerprint nội dung một dict DataFrame/dict (dùng khi dữ liệu không đến từ thư mục artifact)."""
+    h = hashlib.sha256()
+    _hash_value(h, dfs)
+    return h.hexdigest()
+
+
+# =============================================================================
+# CACHE
+# =============================================================================
+class ComputeCache:
+    """Cache LRU có khoá, lưu bền trên đĩa cho kết quả tính toán của Dashboard."""
+
+    def __init__(self, root=DEFAULT_ROOT, max_entries=256, max_bytes=512 * 1024 * 1024, memory_entries=32):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.version = code_version()
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()   # _memory + bộ đếm dùng chung giữa các session
+        self.hits = 0
+        self.misses = 0
+
+    # -------------------------------------------------------------------------
+    def key(self, dataset, name, params):
+        h = hashlib.sha256()
+        h.update(f"{self.version}|{dataset}|{name}|".encode('utf-8'))
+        _hash_value(h, params)
+        return h.hexdigest()
+
+    def _path(self, dataset, name, key):
+        # dataset + tên phép tính nằm trong tên file để invalidate theo tiền tố
+        safe = re.sub(r'[^0-9A-Za-z_.-]', '_', name)
+        return os.path.join(self.root, f"{dataset[:16]}__{safe}__{key[:32]}.pkl")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def call(self, dataset, name, fn, **params):
+        """fn(**params) nếu chưa có trong cache, ngược lại trả kết quả đã lưu."""
+        key = self.key(dataset, name, params)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        path = self._path(dataset, name, key)
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+                os.utime(path)   # đánh dấu vừa dùng cho LRU trên đĩa
+                self._remember(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+            except Exception as e:
+                print(f"Lưu ý: Cache tính toán hỏng ({os.path.basename(path)}: {e}), tính lại.")
+
+        with self._lock:
+            self.misses += 1
+        value = fn(**params)
+        self._remember(key, value)
+        self._save(path, value)
+        return value
+
+    def _save(self, path, value):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception as e:
+            # Kết quả không pickle được → chỉ giữ ở tầng RAM
+            print(f"Lưu ý: Không ghi được cache tính toán ({e}).")
+            return
+        self._evict()
+
+    def _entries(self):
+        if not os.path.isdir(self.root):
+            return []
+        out = []
+        for f in os.listdir(self.root):
+            if f.endswith('.pkl'):
+                path = os.path.join(self.root, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                out.append((st.st_mtime_ns, st.st_size, path))
+        return sorted(out)
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            total -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # -------------------------------------------------------------------------
+    def invalidate(self, dataset=None, name=None):
+        """Xoá các entry của một bộ dữ liệu và/hoặc một phép tính (None = mọi giá trị)."""
+        with self._lock:
+            self._memory.clear()
+        safe = re.sub(r'[^0-9A-Za-z_.-]', '_', name) if name else None
+        removed = 0
+        for _, _, path in self._entries():
+            ds, op, _ = os.path.basename(path).split('__', 2)
+            if (dataset is None or ds == dataset[:16]) and (safe is None or op == safe):
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def clear(self):
+        return self.invalidate()
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            memory_entries, hits, misses = len(self._memory), self.hits, self.misses
+        return {
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'memory_entries': memory_entries,
+            'hits': hits,
+            'misses': misses,
+        }
@@ -2,14 +2,30 @@ import pandas as pd
 import numpy as np
 import os
 
+from artifact_store import ArtifactStore
+from period_axis import PeriodAxis, attach_period_axis, parse_period, period_label
+
+# Từ khoá trong tên file export của SSI → sheet chuẩn
+# (vd: SSI_HVN_Financial_Statement_Balance_Sheet_26032026.xlsx)
+SSI_EXPORT_KINDS = {
+    'BALANCE SHEET': 'balance_sheet',
+    'CASH FLOW STATEMENT': 'cash_flow',
+    'INCOME STATEMENT': 'income_statement',
+    'FINANCIAL INDEX': 'ratio',
+}
+
 class DataProcessor:
-    def __init__(self, file_path):
+    def __init__(self, file_path, ticker='HVN'):
         self.file_path = file_path
+        self.ticker = ticker
         self.sheets = ['BALANCE SHEET', 'CASH FLOW STATEMENT', 'INCOME STATEMENT', 'FINANCIAL INDEX']
         self.dataframes = {}
 
     def load_and_normalize(self):
         """Loads the excel file and normalizes columns and NaN values."""
+        if isinstance(self.file_path, dict):
+            return self.load_ssi_exports(self.file_path)
+
         if not os.path.exists(self.file_path):
             raise FileNotFoundError(f"File không tồn tại: {self.file_path}")
             
@@ -35,67 +51,113 @@ class DataProcessor:
                 continue
                 
             df = pd.read_excel(xls, sheet_name=actual_sheet)
-            
-            # Collapse interleaved rows (Title row followed by 'HVN' value row)
-            # Pattern: Row N has 'Doanh thu', Row N+1 has 'HVN'
-            cleaned_rows = []
-            skip_next = False
-            
-            # Rename first column to a standard name for processing
-            first_col = df.columns[0]
-            df.rename(columns={first_col: 'Khoản mục'}, inplace=True)
-            df['Khoản mục'] = df['Khoản mục'].astype(str).str.strip()
-
-            for i in range(len(df)):
-                if skip_next:
-                    skip_next = False
-                    continue
-                
-                name = df.iloc[i]['Khoản mục']
-                # If next row is 'HVN', it contains the values for current name
-                if i < len(df) - 1:
-                    next_item = str(df.iloc[i+1]['Khoản mục']).strip()
-                    if next_item == 'HVN' and name != 'HVN':
-                        # Use current name but next row's values
-                        combined_row = df.iloc[i+1].copy()
-                        combined_row['Khoản mục'] = name
-                        cleaned_rows.append(combined_row)
-                        skip_next = True
-                        continue
-                
-                # If this is a normal row (not a header-value pair), keep it unless it's a standalone HVN
-                if name != 'HVN':
-                    cleaned_rows.append(df.iloc[i])
-            
-            df = pd.DataFrame(cleaned_rows)
-            
-            # Sanitization: Clean column names (strip spaces, newlines)
-            new_column_names = {col: str(col).strip() for col in df.columns}
-            df.rename(columns=new_column_names, inplace=True)
-            
-            # Sort columns: 'Khoản mục' first, then years chronologically
-            year_cols = [c for c in df.columns if c != 'Khoản mục']
-            # Attempt to sort numerically
-            try:
-                sorted_years = sorted(year_cols, key=lambda x: int(str(x).split('.')[0]))
-                df = df[['Khoản mục'] + sorted_years]
-            except:
-                # Fallback to alphanumeric sort if int conversion fails
-                sorted_years = sorted(year_cols)
-                df = df[['Khoản mục'] + sorted_years]
-
-            # Strip whitespace in item names again to be safe
-            df['Khoản mục'] = df['Khoản mục'].astype(str).str.strip()
-            
-            # Fill NaN values with 0.0 for numeric columns
-            for col in df.columns:
-                if col != 'Khoản mục':
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
-                    
-            self.dataframes[canonical_name] = df
+            self.dataframes[canonical_name] = self._normalize_sheet(df)
             
         return self.dataframes
 
+    def load_ssi_exports(self, files):
+        """
+        Đọc trực tiếp bộ file export gốc của SSI (mỗi báo cáo một file, có vài dòng
+        tiêu đề 'Data Title' / 'Date Of Extract' phía trên bảng).
+        files: dict sheet chuẩn → đường dẫn file.
+        """
+        for canonical_name in self.sheets:
+            path = files.get(canonical_name)
+            if not path:
+                print(f"Lưu ý: Thiếu file export SSI cho '{canonical_name}'")
+                continue
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"File không tồn tại: {path}")
+
+            raw = pd.read_excel(path, header=None)
+            header_pos = self._find_year_header(raw)
+            if header_pos is None:
+                print(f"Lưu ý: Không tìm thấy dòng tiêu đề năm trong {os.path.basename(path)}")
+                continue
+
+            header = raw.iloc[header_pos]
+            columns = ['Khoản mục'] + [
+                str(int(v)) if isinstance(v, (int, float, np.integer, np.floating)) and not pd.isna(v) else str(v)
+                for v in header.iloc[1:]
+            ]
+            body = raw.iloc[header_pos + 1:]
+            # Bảng kết thúc ở dòng trống đầu tiên; phía dưới là chú thích nguồn (FiinTrade)
+            blank = body.isna().all(axis=1).to_numpy()
+            if blank.any():
+                body = body.iloc[:int(blank.argmax())]
+            df = body.copy()
+            df.columns = columns
+            df = df[df['Khoản mục'].notna()].reset_index(drop=True)
+            self.dataframes[canonical_name] = self._normalize_sheet(df)
+
+        return self.dataframes
+
+    @staticmethod
+    def _find_year_header(raw):
+        """Vị trí dòng đầu tiên mà các ô sau cột đầu đều là năm (vd: 2011, 2012.0) hoặc quý (vd: Q1/2020)."""
+        for pos in range(len(raw)):
+            cells = raw.iloc[pos, 1:].dropna()
+            if not len(cells):
+                continue
+            keys = [parse_period(int(v) if isinstance(v, (float, np.floating)) and float(v).is_integer() else v)
+                    for v in cells]
+            if all(k is not None and 1900 <= k[0] <= 2100 for k in keys):
+                return pos
+        return None
+
+    @staticmethod
+    def _column_label(col):
+        """Tiêu đề cột đã strip; cột quý đưa về nhãn chuẩn 'Q1/2020' (cột năm giữ nguyên)."""
+        label = str(col).strip()
+        key = parse_period(label)
+        if key is not None and key[1]:
+            return period_label(*key)
+        return label
+
+    def _normalize_sheet(self, df):
+        # Rename first column to a standard name for processing
+        first_col = df.columns[0]
+        df.rename(columns={first_col: 'Khoản mục'}, inplace=True)
+        df['Khoản mục'] = df['Khoản mục'].astype(str).str.strip()
+
+        # Collapse interleaved rows (Title row followed by ticker value row, vd: 'HVN')
+        # Pattern: Row N has 'Doanh thu', Row N+1 has 'HVN' -> giữ tên dòng N, giá trị dòng N+1.
+        # Mọi dòng mã CK (đã ghép hoặc đứng lẻ) đều bị loại.
+        names = df['Khoản mục']
+        is_ticker = (names == self.ticker).to_numpy()
+        next_is_ticker = np.append(is_ticker[1:], False)
+        keep = ~is_ticker
+        src_pos = (np.arange(len(df)) + (keep & next_is_ticker))[keep]
+
+        collapsed = df.iloc[src_pos].copy()
+        collapsed['Khoản mục'] = names.to_numpy()[keep]
+        df = collapsed
+        
+        # Sanitization: Clean column names (strip spaces, newlines)
+        new_column_names = {col: self._column_label(col) for col in df.columns}
+        df.rename(columns=new_column_names, inplace=True)
+        
+        # Sort columns: 'Khoản mục' first, then periods chronologically (năm hoặc quý)
+        year_cols = [c for c in df.columns if c != 'Khoản mục']
+        axis = PeriodAxis.from_columns(year_cols)
+        if len(axis) == len(year_cols):
+            sorted_years = axis.periods
+        else:
+            # Fallback to alphanumeric sort if some header is not a period
+            sorted_years = sorted(year_cols)
+        df = df[['Khoản mục'] + sorted_years]
+
+        # Strip whitespace in item names again to be safe
+        df['Khoản mục'] = df['Khoản mục'].astype(str).str.strip()
+        
+        # Fill NaN values with 0.0 for numeric columns
+        value_cols = [c for c in df.columns if c != 'Khoản mục']
+        df[value_cols] = df[value_cols].apply(pd.to_numeric, errors='coerce').fillna(0.0)
+
+        # Gắn trục kỳ một lần tại đây; các stage sau chỉ đọc lại (period_axis.get_period_axis)
+        attach_period_axis(df)
+        return df
+
     def load_macro_data(self, macro_path):
         if not os.path.exists(macro_path):
             print(f"Lưu ý: Không tìm thấy file vĩ mô {macro_path}")
@@ -134,15 +196,10 @@ class DataProcessor:
             print(f"Lỗi đọc file macro excel: {e}")
 
 
-    def save_outputs(self, out_dir="output/1_processed"):
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
-            
+    def save_outputs(self, out_dir="output/1_processed", fmt=None, export_csv=False):
+        store = ArtifactStore(out_dir, fmt=fmt, export_csv=export_csv)
         for name, df in self.dataframes.items():
-            filename = f"{name}.csv"
-            filepath = os.path.join(out_dir, filename)
-            df.to_csv(filepath, index=False)
-            print(f"Saved: {filepath}")
+            store.save_frame(name, df)
 
 if __name__ == "__main__":
     # Test read
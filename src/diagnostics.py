@@ -6,7 +6,7 @@ Bao gồm 8 nhóm kiểm định kinh tế lượng:
   2. Phương sai sai số thay đổi (Breusch-Pagan)
   3. Tự tương quan (Durbin-Watson + Ljung-Box)
   4. Phân phối chuẩn phần dư (Jarque-Bera)
-  5. Sai số Dự báo (Expanding Window Backtesting + COVID Dummy)
+  5. Sai số Dự báo (Backtesting Expanding/Rolling Window + COVID Dummy)
   6. Cấu trúc Phân phối Oil & FX (KS, Shapiro-Wilk)
   7. Điểm kỳ dị toán học WACC-g (Singularity Detection)
   8. Nội sinh Cấu trúc Vốn (Granger Causality + Auto-lag AIC/BIC)
@@ -14,8 +14,19 @@ Bao gồm 8 nhóm kiểm định kinh tế lượng:
 
 import numpy as np
 import pandas as pd
-import json
-import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from line_items import find_row
+from period_axis import get_period_axis
+from artifact_store import ArtifactStore
+import instrumentation
+from instrumentation import traced_class
+# Backtest giải bằng backtest_engine; sklearn chỉ còn cần cho dữ liệu Log-Log (loglog_model)
+from loglog_model import SKLEARN_AVAILABLE, build_loglog_data, loglog_frame
+from backtest_engine import design_matrix, ols_backtest
+from singularity import (SINGULAR, NEAR_SINGULAR, wacc_g_gap, singularity_map, singular_cells,
+                         gordon_matrix, condition_number, stability_label)
 
 try:
     from statsmodels.tsa.stattools import adfuller, coint, grangercausalitytests
@@ -33,13 +44,8 @@ try:
 except ImportError:
     SCIPY_AVAILABLE = False
 
-try:
-    from sklearn.linear_model import LinearRegression
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    SKLEARN_AVAILABLE = False
-
 
+@traced_class('diagnostics')
 class DiagnosticsEngine:
     """
     Engine kiểm định thống kê cho mô hình tài chính HVN.
@@ -50,118 +56,52 @@ class DiagnosticsEngine:
         self.dfs = dfs_dict or {}
         self.alpha = alpha  # Mức ý nghĩa mặc định
         self.results = {}   # Dict lưu kết quả tất cả kiểm định
+        self.timings = {}   # Thời gian từng nhóm kiểm định (giây) — tách khỏi results để artifact tất định
+        self._loglog = {}   # (bảng KQKD, MACRO_DATA, cờ Covid) → dữ liệu Log-Log
+        self._fwl_fit = {}  # id(X_fwl) → OLS statsmodels đã fit
 
     # =====================================================================
     # HELPER METHODS
     # =====================================================================
     def _get_row(self, df, pattern):
-        if df is None or df.empty:
-            return None
-        row = df[df['Khoản mục'].str.contains(pattern, case=False, na=False, regex=True)]
-        if not row.empty:
-            return row.iloc[0]
-        return None
+        return find_row(df, pattern)
 
     def _get_years(self, df):
-        if df is None:
-            return []
-        years = []
-        for c in df.columns:
-            if c != 'Khoản mục':
-                try:
-                    int(str(c).split('.')[0])
-                    years.append(c)
-                except ValueError:
-                    continue
-        return sorted(years, key=lambda x: int(str(x).split('.')[0]))
-
-    def _build_loglog_data(self):
+        # Trục kỳ đã sắp theo thời gian (gắn lúc nạp bởi DataProcessor) → years[-1] là kỳ mới nhất
+        return get_period_axis(df).periods
+
+    def _build_loglog_data(self, use_covid_dummy=True):
         """
-        Tái tạo dữ liệu Log-Log regression từ Calculator.
-        Trả về (X_fwl, y_fwl, residuals, ln_Q, ln_TC, ln_oil, ln_fx, years, covid_dummy)
-        hoặc None nếu thiếu dữ liệu.
+        Dữ liệu Log-Log regression dùng chung với Calculator (loglog_model).
+        Trả về dict X_fwl, y_fwl, residuals, ln_Q, ln_TC, ln_oil, ln_fx, years, covid_dummy...
+        hoặc None nếu thiếu dữ liệu. Ghi nhớ trên engine theo bảng đầu vào + cờ Covid dummy,
+        nên mọi kiểm định trong run_all dùng cùng một lần fit.
         """
-        if not SKLEARN_AVAILABLE:
-            return None
-
         is_df = self.dfs.get('INCOME STATEMENT')
-        if is_df is None:
-            return None
-
-        years = self._get_years(is_df)
-        if len(years) < 5:
-            return None
-
-        rev_row = self._get_row(is_df, r'^Doanh số thuần$')
-        ebit_row = self._get_row(is_df, r'^EBIT$')
-
-        if rev_row is None or ebit_row is None:
-            return None
-
-        rev_vals = rev_row[years].astype(float).values
-        ebit_vals = ebit_row[years].astype(float).values
-        tc_vals = rev_vals - ebit_vals
-
-        tc_vals_safe = np.maximum(tc_vals, 1.0)
-        rev_vals_safe = np.maximum(rev_vals, 1.0)
-
-        # Macro data
         df_macro = self.dfs.get('MACRO_DATA')
-        macro_fx, macro_oil = {}, {}
-        if df_macro is not None and not df_macro.empty:
-            for _, row in df_macro.iterrows():
-                try:
-                    yr = str(int(row['Year']))
-                    if pd.notna(row.get('Oil_Price')):
-                        macro_oil[yr] = float(row['Oil_Price'])
-                    if pd.notna(row.get('FX_Rate')):
-                        macro_fx[yr] = float(row['FX_Rate'])
-                except Exception:
-                    pass
-
-        fx_arr = np.array([macro_fx.get(str(y), 24000) for y in years])
-        oil_arr = np.array([macro_oil.get(str(y), 90) for y in years])
-        covid_dummy = np.array([1 if str(y) in ['2020', '2021', '2022'] else 0 for y in years])
-
-        ln_TC = np.log(tc_vals_safe)
-        ln_Q = np.log(rev_vals_safe)
-        ln_oil = np.log(oil_arr)
-        ln_fx = np.log(fx_arr)
-
-        # FWL orthogonalization
-        reg_fx_aux = LinearRegression().fit(ln_Q.reshape(-1, 1), ln_fx)
-        resid_fx = ln_fx - reg_fx_aux.predict(ln_Q.reshape(-1, 1))
-
-        reg_oil_aux = LinearRegression().fit(ln_Q.reshape(-1, 1), ln_oil)
-        resid_oil = ln_oil - reg_oil_aux.predict(ln_Q.reshape(-1, 1))
-
-        X_fwl = np.column_stack((ln_Q, resid_oil, resid_fx, covid_dummy))
-        y_fwl = ln_TC
-
-        reg_main = LinearRegression(fit_intercept=True).fit(X_fwl, y_fwl)
-        residuals = y_fwl - reg_main.predict(X_fwl)
-
-        # Lấy thêm EBITDA
-        ebitda_row = self._get_row(is_df, r'^EBITDA$')
-        ebitda_vals = ebitda_row[years].astype(float).values if ebitda_row is not None else None
-
-        return {
-            'X_fwl': X_fwl,
-            'y_fwl': y_fwl,
-            'residuals': residuals,
-            'ln_Q': ln_Q,
-            'ln_TC': ln_TC,
-            'ln_oil': ln_oil,
-            'ln_fx': ln_fx,
-            'oil_arr': oil_arr,
-            'fx_arr': fx_arr,
-            'years': years,
-            'covid_dummy': covid_dummy,
-            'rev_vals': rev_vals,
-            'ebit_vals': ebit_vals,
-            'tc_vals': tc_vals,
-            'ebitda_vals': ebitda_vals,
-        }
+        key = (id(is_df), id(df_macro), use_covid_dummy)
+        if key not in self._loglog:
+            # Báo cáo quý → bảng TTM (cùng nguồn với Calculator.calculate_macro_regression_leverage)
+            source, years = loglog_frame(is_df)
+            data = build_loglog_data(source, df_macro, years, use_covid_dummy=use_covid_dummy)
+            if data is not None:
+                # Lấy thêm EBITDA
+                ebitda_row = self._get_row(source, r'^EBITDA$')
+                data['ebitda_vals'] = ebitda_row[years].astype(float).values if ebitda_row is not None else None
+            # Giữ tham chiếu tới bảng để id() không bị tái sử dụng
+            self._loglog[key] = (is_df, df_macro, data)
+        data = self._loglog[key][2]
+        return dict(data) if data is not None else None
+
+    def _fwl_ols(self, loglog):
+        """OLS (statsmodels) của mô hình FWL chính — fit một lần cho Breusch-Pagan / DW / Jarque-Bera."""
+        X = loglog['X_fwl']
+        cached = self._fwl_fit.get(id(X))
+        if cached is None or cached[0] is not X:
+            X_const = add_constant(X)
+            cached = (X, X_const, OLS(loglog['y_fwl'], X_const).fit())
+            self._fwl_fit[id(X)] = cached
+        return cached[1], cached[2]
 
     # =====================================================================
     # TEST 1: STATIONARITY (ADF) + COINTEGRATION (Engle-Granger)
@@ -304,8 +244,7 @@ class DiagnosticsEngine:
             return
 
         try:
-            X_const = add_constant(loglog['X_fwl'])
-            model = OLS(loglog['y_fwl'], X_const).fit()
+            X_const, model = self._fwl_ols(loglog)
             resid = model.resid
 
             lm_stat, lm_pval, f_stat, f_pval = het_breuschpagan(resid, X_const)
@@ -342,8 +281,7 @@ class DiagnosticsEngine:
             return
 
         try:
-            X_const = add_constant(loglog['X_fwl'])
-            model = OLS(loglog['y_fwl'], X_const).fit()
+            X_const, model = self._fwl_ols(loglog)
             resid = model.resid
 
             # Durbin-Watson
@@ -408,8 +346,7 @@ class DiagnosticsEngine:
             return
 
         try:
-            X_const = add_constant(loglog['X_fwl'])
-            model = OLS(loglog['y_fwl'], X_const).fit()
+            X_const, model = self._fwl_ols(loglog)
             resid = model.resid
 
             jb_stat, jb_pval, skew, kurtosis = jarque_bera(resid)
@@ -451,12 +388,14 @@ class DiagnosticsEngine:
             self.results['NORMALITY'] = {'error': str(e)}
 
     # =====================================================================
-    # TEST 5: BACKTESTING (Expanding Window + COVID Dummy)
+    # TEST 5: BACKTESTING (Expanding / Rolling Window + COVID Dummy)
     # =====================================================================
-    def test_backtesting(self, use_covid_dummy=True, alpha=None):
+    def test_backtesting(self, use_covid_dummy=True, alpha=None, window=None, horizon=1):
         """
-        Expanding Window Backtesting cho mô hình Log-Log.
-        Rolling forward từ năm thứ 8. Hỗ trợ COVID Dummy toggle.
+        Backtesting cho mô hình Log-Log, rolling forward từ năm thứ 8.
+        window=None: Expanding Window; window=w: Rolling Window w năm gần nhất.
+        horizon=h: train tới năm t, dự báo năm t + h − 1. Hỗ trợ COVID Dummy toggle.
+        Mọi bước được giải một lần qua ma trận chuẩn tắc cộng dồn (backtest_engine).
         """
         if not SKLEARN_AVAILABLE:
             self.results['BACKTESTING'] = {'error': 'sklearn not available'}
@@ -472,52 +411,19 @@ class DiagnosticsEngine:
         n = len(years)
         min_train = 7  # Bắt đầu test từ năm thứ 8 (index 7)
 
-        if n <= min_train:
-            self.results['BACKTESTING'] = {'error': f'Cần ít nhất {min_train + 1} năm dữ liệu'}
+        if n <= min_train + horizon - 1:
+            self.results['BACKTESTING'] = {'error': f'Cần ít nhất {min_train + horizon} năm dữ liệu'}
             return
 
-        ln_Q = loglog['ln_Q']
         ln_TC = loglog['ln_TC']
-        ln_oil = loglog['ln_oil']
-        ln_fx = loglog['ln_fx']
-        covid = loglog['covid_dummy']
+        X = design_matrix(loglog['ln_Q'], loglog['ln_oil'], loglog['ln_fx'],
+                          loglog['covid_dummy'] if use_covid_dummy else None)
+        bt = ols_backtest(X, ln_TC, min_train=min_train, window=window, horizon=horizon)
 
         backtest_results = []
-
-        for test_idx in range(min_train, n):
-            # Training data: 0 to test_idx-1
-            train_end = test_idx
-
-            ln_Q_train = ln_Q[:train_end]
-            ln_TC_train = ln_TC[:train_end]
-            ln_oil_train = ln_oil[:train_end]
-            ln_fx_train = ln_fx[:train_end]
-            covid_train = covid[:train_end]
-
-            # FWL on training set
-            reg_fx_aux = LinearRegression().fit(ln_Q_train.reshape(-1, 1), ln_fx_train)
-            resid_fx_train = ln_fx_train - reg_fx_aux.predict(ln_Q_train.reshape(-1, 1))
-
-            reg_oil_aux = LinearRegression().fit(ln_Q_train.reshape(-1, 1), ln_oil_train)
-            resid_oil_train = ln_oil_train - reg_oil_aux.predict(ln_Q_train.reshape(-1, 1))
-
-            if use_covid_dummy:
-                X_train = np.column_stack((ln_Q_train, resid_oil_train, resid_fx_train, covid_train))
-            else:
-                X_train = np.column_stack((ln_Q_train, resid_oil_train, resid_fx_train))
-
-            reg = LinearRegression(fit_intercept=True).fit(X_train, ln_TC_train)
-
-            # Predict test point
-            resid_fx_test = ln_fx[test_idx] - reg_fx_aux.predict(ln_Q[test_idx].reshape(1, -1))[0]
-            resid_oil_test = ln_oil[test_idx] - reg_oil_aux.predict(ln_Q[test_idx].reshape(1, -1))[0]
-
-            if use_covid_dummy:
-                X_test = np.array([[ln_Q[test_idx], resid_oil_test, resid_fx_test, covid[test_idx]]])
-            else:
-                X_test = np.array([[ln_Q[test_idx], resid_oil_test, resid_fx_test]])
-
-            predicted_ln_tc = float(reg.predict(X_test)[0])
+        for test_idx, start, train_end, predicted_ln_tc in zip(
+                bt['test_idx'], bt['train_start'], bt['train_end'], bt['predicted']):
+            predicted_ln_tc = float(predicted_ln_tc)
             actual_ln_tc = float(ln_TC[test_idx])
 
             # Convert back to original scale
@@ -528,7 +434,7 @@ class DiagnosticsEngine:
 
             backtest_results.append({
                 'year': str(years[test_idx]),
-                'train_size': train_end,
+                'train_size': int(train_end - start),
                 'actual_ln_tc': round(actual_ln_tc, 4),
                 'predicted_ln_tc': round(predicted_ln_tc, 4),
                 'actual_tc': round(float(actual_tc), 2),
@@ -556,7 +462,11 @@ class DiagnosticsEngine:
             'config': {
                 'min_train_size': min_train,
                 'use_covid_dummy': use_covid_dummy,
-                'method': 'Expanding Window (Rolling Forward từ năm thứ 8)',
+                'method': (f'Rolling Window {window} năm' if window else 'Expanding Window')
+                          + (f', dự báo {horizon} bước' if horizon > 1 else '')
+                          + ' (Rolling Forward từ năm thứ 8)',
+                'window': window,
+                'horizon': horizon,
             },
             'alpha': alpha,
         }
@@ -654,10 +564,11 @@ class DiagnosticsEngine:
     # =====================================================================
     # TEST 7: SINGULARITY DETECTION (WACC-g Matrix)
     # =====================================================================
-    def test_singularity(self):
+    def test_singularity(self, step=0.005):
         """
         Phát hiện điểm kỳ dị toán học trong ma trận DCF khi WACC ≤ g.
         Tính Condition Number cho numerical stability.
+        step: bước lưới WACC / g (mặc định 0.5%; 0.001 cho lưới 0.1%).
         """
         # Tái tạo ma trận WACC-g tương tự forecaster.dcf_sensitivity()
         is_df = self.dfs.get('INCOME STATEMENT')
@@ -679,71 +590,30 @@ class DiagnosticsEngine:
             fcff_base = 1000.0
 
         # WACC and g ranges
-        wacc_vals = np.arange(0.06, 0.20 + 0.005, 0.005)
-        g_vals = np.arange(-0.02, 0.10 + 0.005, 0.005)
-
-        singularity_map = np.zeros((len(wacc_vals), len(g_vals)), dtype=int)
-        near_singularity_map = np.zeros((len(wacc_vals), len(g_vals)), dtype=float)
-        singular_cells = []
-
-        for i, wacc in enumerate(wacc_vals):
-            for j, g in enumerate(g_vals):
-                gap = wacc - g
-                near_singularity_map[i, j] = round(gap * 100, 2)  # percentage points
-
-                if gap <= 0:
-                    singularity_map[i, j] = 2  # True singularity
-                    singular_cells.append({
-                        'wacc': f'{wacc*100:.1f}%',
-                        'g': f'{g*100:.1f}%',
-                        'type': 'Kỳ dị (WACC ≤ g)',
-                        'gap': round(gap * 100, 2),
-                    })
-                elif gap < 0.005:  # < 0.5%
-                    singularity_map[i, j] = 1  # Near-singularity
-                    singular_cells.append({
-                        'wacc': f'{wacc*100:.1f}%',
-                        'g': f'{g*100:.1f}%',
-                        'type': 'Gần kỳ dị (WACC - g < 0.5%)',
-                        'gap': round(gap * 100, 2),
-                    })
-
-        # Condition number of the matrix
-        try:
-            # Build a representative DCF matrix
-            dcf_matrix = np.zeros((len(wacc_vals), len(g_vals)))
-            for i, wacc in enumerate(wacc_vals):
-                for j, g in enumerate(g_vals):
-                    if wacc > g:
-                        dcf_matrix[i, j] = fcff_base * (1 + g) / (wacc - g)
-                    else:
-                        dcf_matrix[i, j] = np.nan
-
-            valid_matrix = dcf_matrix[~np.isnan(dcf_matrix).any(axis=1)]
-            if len(valid_matrix) > 1:
-                cond_number = float(np.linalg.cond(valid_matrix[:min(len(valid_matrix), 10), :min(valid_matrix.shape[1], 10)]))
-            else:
-                cond_number = float('inf')
-        except Exception:
-            cond_number = float('inf')
+        wacc_vals = np.arange(0.06, 0.20 + step, step)
+        g_vals = np.arange(-0.02, 0.10 + step, step)
+
+        # Bản đồ khoảng cách WACC - g (điểm %) và mức kỳ dị trên toàn lưới
+        gap = wacc_g_gap(wacc_vals, g_vals)
+        gap_map = np.round(gap * 100, 2)
+        smap = singularity_map(gap)
+        singular_cells_all = singular_cells(wacc_vals, g_vals, smap, gap_map, limit=20)
+
+        # Condition number of a representative DCF matrix
+        cond_number = condition_number(gordon_matrix(wacc_vals, g_vals, fcff_base))
 
         # Stability assessment
-        if cond_number < 100:
-            stability = 'Ổn định (Well-conditioned)'
-        elif cond_number < 1000:
-            stability = 'Chấp nhận được (Moderate conditioning)'
-        else:
-            stability = 'Không ổn định (Ill-conditioned)'
+        stability = stability_label(cond_number)
 
-        n_singular = sum(1 for c in singular_cells if c['type'].startswith('Kỳ dị'))
-        n_near = sum(1 for c in singular_cells if c['type'].startswith('Gần'))
+        n_singular = int(np.count_nonzero(smap == SINGULAR))
+        n_near = int(np.count_nonzero(smap == NEAR_SINGULAR))
 
         self.results['SINGULARITY'] = {
-            'singularity_map': singularity_map.tolist(),
-            'gap_map': near_singularity_map.tolist(),
+            'singularity_map': smap.tolist(),
+            'gap_map': gap_map.tolist(),
             'wacc_labels': [f'{w*100:.1f}%' for w in wacc_vals],
             'g_labels': [f'{g*100:.1f}%' for g in g_vals],
-            'singular_cells': singular_cells[:20],  # Limit for display
+            'singular_cells': singular_cells_all,  # Limit for display
             'n_singular': n_singular,
             'n_near_singular': n_near,
             'condition_number': round(cond_number, 2) if not np.isinf(cond_number) else 'Infinity',
@@ -929,47 +799,108 @@ class DiagnosticsEngine:
     # =====================================================================
     # RUN ALL
     # =====================================================================
-    def run_all(self, alpha=None, use_covid_dummy=True):
-        """Chạy tất cả 8 nhóm kiểm định."""
+    def _run_group(self, method, kwargs):
+        """Chạy một nhóm kiểm định; trả về (các khoá results nó sinh ra, thời gian chạy)."""
+        before = set(self.results)
+        start = time.time()
+        getattr(self, method)(**kwargs)
+        duration = time.time() - start
+        return {k: v for k, v in self.results.items() if k not in before}, duration
+
+    def run_all(self, alpha=None, use_covid_dummy=True, parallel=False, max_workers=None, max_lag=2):
+        """
+        Chạy tất cả 8 nhóm kiểm định.
+        parallel=True: các nhóm chỉ đọc chung dfs nên được gửi lên process pool;
+        kết quả luôn được ghép vào self.results theo đúng thứ tự DIAG_TEST_GROUPS.
+        Thời gian từng nhóm (giây) nằm trong self.timings (không ghi vào results/artifact).
+        """
         alpha = alpha or self.alpha
-        print("  [Diag 1/8] Stationarity (ADF + Cointegration)...")
-        self.test_stationarity(alpha)
-        print("  [Diag 2/8] Heteroskedasticity (Breusch-Pagan)...")
-        self.test_heteroskedasticity(alpha)
-        print("  [Diag 3/8] Autocorrelation (Durbin-Watson + Ljung-Box)...")
-        self.test_autocorrelation(alpha)
-        print("  [Diag 4/8] Normality (Jarque-Bera)...")
-        self.test_normality(alpha)
-        print("  [Diag 5/8] Backtesting (Expanding Window)...")
-        self.test_backtesting(use_covid_dummy=use_covid_dummy, alpha=alpha)
-        print("  [Diag 6/8] Distributional Assumptions (Oil & FX)...")
-        self.test_distributional(alpha)
-        print("  [Diag 7/8] Singularity Detection (WACC-g)...")
-        self.test_singularity()
-        print("  [Diag 8/8] Endogeneity (Granger Causality)...")
-        self.test_endogeneity(alpha=alpha)
+        extra = {'test_backtesting': {'use_covid_dummy': use_covid_dummy},
+                 'test_endogeneity': {'max_lag': max_lag}}
+        groups = []
+        for label, method, kwargs in DIAG_TEST_GROUPS:
+            kwargs = dict(kwargs, **extra.get(method, {}))
+            if method != 'test_singularity':  # test_singularity không nhận alpha
+                kwargs['alpha'] = alpha
+            groups.append((label, method, kwargs))
+
+        outputs = {}
+        executor = _make_diag_executor(self.dfs, self.alpha, max_workers) if parallel else None
+        if executor is None:
+            for i, (label, method, kwargs) in enumerate(groups, 1):
+                print(f"  [Diag {i}/{len(groups)}] {label}...")
+                outputs[method] = self._run_group(method, kwargs)
+        else:
+            with executor:
+                futures = {executor.submit(_run_diag_group, method, kwargs): (label, method)
+                           for label, method, kwargs in groups}
+                for done, fut in enumerate(as_completed(futures), 1):
+                    label, method = futures[fut]
+                    try:
+                        outputs[method], spans = fut.result()
+                        instrumentation.merge(spans)
+                    except Exception as e:
+                        outputs[method] = ({}, 0.0)
+                        print(f"  → Lỗi nhóm {label}: {e}")
+                        continue
+                    print(f"  [Diag {done}/{len(groups)}] {label} ({outputs[method][1]:.2f}s)")
+
+        # Ghép theo thứ tự khai báo → results giống hệt khi chạy tuần tự
+        self.timings = {}
+        for _, method, _ in groups:
+            produced, duration = outputs[method]
+            self.results.update(produced)
+            self.timings[method] = round(duration, 4)
         print("  → Hoàn thành tất cả kiểm định.")
         return self.results
 
     def save_outputs(self, out_dir="output/2.5_diagnostics"):
         """Lưu kết quả kiểm định ra JSON files."""
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
+        store = ArtifactStore(out_dir)
 
         for key, data in self.results.items():
-            filepath = os.path.join(out_dir, f"{key}.json")
             try:
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=4, default=str)
-                print(f"  Saved: {filepath}")
+                store.save_json(key, data, default=str)
             except Exception as e:
                 print(f"  Error saving {key}: {e}")
 
         # Also save combined results
-        combined_path = os.path.join(out_dir, "ALL_DIAGNOSTICS.json")
         try:
-            with open(combined_path, 'w', encoding='utf-8') as f:
-                json.dump(self.results, f, ensure_ascii=False, indent=4, default=str)
-            print(f"  Saved combined: {combined_path}")
+            store.save_json("ALL_DIAGNOSTICS", self.results, default=str)
         except Exception as e:
             print(f"  Error saving combined: {e}")
+
+
+# Thứ tự khai báo = thứ tự ghép kết quả (label, method, kwargs cố định)
+DIAG_TEST_GROUPS = [
+    ("Stationarity (ADF + Cointegration)", 'test_stationarity', {}),
+    ("Heteroskedasticity (Breusch-Pagan)", 'test_heteroskedasticity', {}),
+    ("Autocorrelation (Durbin-Watson + Ljung-Box)", 'test_autocorrelation', {}),
+    ("Normality (Jarque-Bera)", 'test_normality', {}),
+    ("Backtesting (Expanding Window)", 'test_backtesting', {}),
+    ("Distributional Assumptions (Oil & FX)", 'test_distributional', {}),
+    ("Singularity Detection (WACC-g)", 'test_singularity', {}),
+    ("Endogeneity (Granger Causality)", 'test_endogeneity', {}),
+]
+
+# Engine riêng của mỗi process con (dfs chỉ được gửi một lần khi khởi tạo worker)
+_WORKER_ENGINE = None
+
+
+def _init_diag_worker(dfs, alpha):
+    global _WORKER_ENGINE
+    _WORKER_ENGINE = DiagnosticsEngine(dfs, alpha=alpha)
+
+
+def _run_diag_group(method, kwargs):
+    # Kèm các span đo đạc của process con để ghép vào trace của process chính
+    return _WORKER_ENGINE._run_group(method, kwargs), instrumentation.drain()
+
+
+def _make_diag_executor(dfs, alpha, max_workers):
+    try:
+        return ProcessPoolExecutor(max_workers=max_workers or len(DIAG_TEST_GROUPS),
+                                   initializer=_init_diag_worker, initargs=(dfs, alpha))
+    except (OSError, NotImplementedError, ImportError) as e:
+        print(f"  → Cảnh báo: Không tạo được process pool ({e}), chạy tuần tự.")
+        return None
@@ -5,6 +5,7 @@ Bao gồm:
   - STL Decomposition (Trend / Seasonal / Residual)
   - Valuation Bands (mean ± 1σ, ±2σ)
   - DCF Sensitivity Heatmap (WACC × g)
+  - Monte Carlo Valuation (phân phối EV & Giá mục tiêu)
   - What-if ROE Simulator (3 kịch bản)
 
 Triết lý: Không dự báo điểm. Tập trung vào bóc tách cấu trúc
@@ -14,6 +15,13 @@ và mô phỏng kịch bản để giải thích "tại sao".
 import numpy as np
 import pandas as pd
 
+from line_items import find_row
+from period_axis import get_period_axis
+from ttm import TTM_SHEETS, ttm_frame
+from artifact_store import ArtifactStore
+from instrumentation import traced_class
+from singularity import SINGULAR, wacc_g_gap, singularity_map, condition_number
+
 try:
     from statsmodels.tsa.seasonal import STL, seasonal_decompose
     STATSMODELS_AVAILABLE = True
@@ -21,38 +29,71 @@ except ImportError:
     STATSMODELS_AVAILABLE = False
 
 
+def _mc_draw(rng, spec, size):
+    """Rút mẫu theo đặc tả phân phối dạng tuple (tên, tham số...)."""
+    kind, *params = spec
+    if kind == 'normal':
+        mu, sd = params
+        return rng.normal(mu, sd, size) if sd > 0 else np.full(size, float(mu))
+    if kind == 'lognormal':
+        mu, sd = params
+        return rng.lognormal(mu, sd, size)
+    if kind == 'uniform':
+        return rng.uniform(params[0], params[1], size)
+    if kind == 'triangular':
+        lo, mode, hi = params
+        return rng.triangular(lo, mode, hi, size) if hi > lo else np.full(size, float(mode))
+    if kind == 't':
+        df, loc, scale = params
+        return loc + scale * rng.standard_t(df, size)
+    if kind == 'fixed':
+        return np.full(size, float(params[0]))
+    raise ValueError(f"Phân phối không hỗ trợ: {kind}")
+
+
+@traced_class('forecaster')
 class Forecaster:
     def __init__(self, dfs_dict=None, in_dir=None):
         import os
-        import pandas as pd
         if in_dir and os.path.exists(in_dir):
-            self.dfs = {}
-            for f in os.listdir(in_dir):
-                if f.endswith('.csv'):
-                    name = f.replace('.csv', '')
-                    self.dfs[name] = pd.read_csv(os.path.join(in_dir, f))
+            self.dfs = ArtifactStore(in_dir).load_all(include_json=False)
         else:
             self.dfs = dfs_dict or {}
 
     def _get_row(self, df, pattern):
-        row = df[df['Khoản mục'].str.contains(pattern, case=False, na=False, regex=True)]
-        if not row.empty:
-            return row.iloc[0]
-        return None
+        return find_row(df, pattern)
 
     def _get_years(self, df):
-        if df is None: return []
-        # Filter: Only keep columns that can be cast to int (numeric years)
-        years = []
-        for c in df.columns:
-            if c != 'Khoản mục':
-                try:
-                    int(str(c).split('.')[0])
-                    years.append(c)
-                except ValueError:
-                    continue
-        # Sort years numerically to ensure years[-1] is the latest
-        return sorted(years, key=lambda x: int(str(x).split('.')[0]))
+        # Trục kỳ đã sắp theo thời gian (gắn lúc nạp bởi DataProcessor) → years[-1] là kỳ mới nhất
+        return get_period_axis(df).periods
+
+    def _flow_frame(self, sheet):
+        """
+        Bảng để đọc số liệu dòng chảy (KQKD / LCTT) làm gốc năm cho định giá.
+        Báo cáo quý → bảng TTM (tổng 4 quý gần nhất, do Calculator.calculate_ttm tính sẵn),
+        để không lấy một quý đơn lẻ làm EBITDA / FCFF của cả năm.
+        """
+        df = self.dfs.get(sheet)
+        if df is None or not get_period_axis(df).is_quarterly:
+            return df
+        name, how = TTM_SHEETS[sheet]
+        ttm = self.dfs.get(name)
+        return ttm if ttm is not None else ttm_frame(df, how)
+
+    def _ttm_ev_ebitda(self, fi):
+        """
+        Báo cáo quý: EV cuối quý / EBITDA TTM theo từng kỳ của fi (bội số trên EBITDA một quý
+        bị phóng đại ~4 lần). None nếu thiếu dòng EV hoặc EBITDA TTM.
+        """
+        is_ttm = self._flow_frame('INCOME STATEMENT')
+        ev_row = self._get_row(fi, r'^EV \(Enterprise Value\)')
+        ebitda_row = self._get_row(is_ttm, r'^EBITDA$') if is_ttm is not None else None
+        if ev_row is None or ebitda_row is None:
+            return None
+        years = self._get_years(fi)
+        ebitda = ebitda_row.reindex(years).astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return ev_row[years].astype(float) / ebitda.where(ebitda > 0)
 
     # =========================================================================
     # STL Decomposition
@@ -60,7 +101,8 @@ class Forecaster:
     def stl_decomposition(self, series_name='Doanh thu'):
         """
         Bóc tách chuỗi thời gian thành Trend / Seasonal / Residual.
-        Dùng STL nếu N >= 6, fallback sang seasonal_decompose nếu N < 6.
+        Số liệu năm: STL (period=2) nếu N >= 6, fallback sang seasonal_decompose nếu N < 6.
+        Số liệu quý: STL mùa vụ thật period=4 khi có đủ 2 chu kỳ (N >= 8).
         
         Trả về dict {'trend': Series, 'seasonal': Series, 'residual': Series, 'original': Series}
         """
@@ -91,7 +133,8 @@ class Forecaster:
         if row is None:
             return None
 
-        years = self._get_years(df_target)
+        axis = get_period_axis(df_target)
+        years = axis.periods
         values = row[years].astype(float).values
 
         # Loại bỏ NaN
@@ -106,7 +149,17 @@ class Forecaster:
         original = pd.Series(valid_values, index=valid_years)
 
         try:
-            if STATSMODELS_AVAILABLE and n >= 6:
+            if STATSMODELS_AVAILABLE and axis.is_quarterly and n >= 8:
+                # Số liệu quý: mùa vụ thật theo 4 quý/năm
+                result = STL(original, period=4, robust=True).fit()
+                return {
+                    'trend': result.trend,
+                    'seasonal': result.seasonal,
+                    'residual': result.resid,
+                    'original': original,
+                    'method': 'STL (period=4)'
+                }
+            elif STATSMODELS_AVAILABLE and not axis.is_quarterly and n >= 6:
                 # Dùng STL với period=1 cho dữ liệu năm (không có seasonality thực)
                 # period=2 là minimum; với dữ liệu năm, trend là phần quan trọng nhất
                 result = STL(original, period=2, robust=True).fit()
@@ -117,7 +170,7 @@ class Forecaster:
                     'original': original,
                     'method': 'STL'
                 }
-            elif STATSMODELS_AVAILABLE and n >= 4:
+            elif STATSMODELS_AVAILABLE and not axis.is_quarterly and n >= 4:
                 result = seasonal_decompose(original, model='additive', period=2, extrapolate_trend='freq')
                 return {
                     'trend': pd.Series(result.trend, index=valid_years),
@@ -173,11 +226,14 @@ class Forecaster:
             return None
 
         years = self._get_years(fi)
-        row = self._get_row(fi, series_name)
-        if row is None:
-            return None
-            
-        series = row[years].astype(float)
+        series = None
+        if series_name == 'EV/EBITDA' and get_period_axis(fi).is_quarterly:
+            series = self._ttm_ev_ebitda(fi)
+        if series is None:
+            row = self._get_row(fi, series_name)
+            if row is None:
+                return None
+            series = row[years].astype(float)
         # Bắt đầu với các năm có EV/EBITDA dương
         vals = series[series > 0].dropna()
         
@@ -217,14 +273,22 @@ class Forecaster:
     # =========================================================================
     # DCF Sensitivity Heatmap
     # =========================================================================
-    def dcf_sensitivity(self, fcff_base=None, ebitda_base=None, ev_ebitda_multiple=None,
-                        wacc_range=(0.08, 0.16, 0.005), ebitda_growth_range=(-0.02, 0.08, 0.005)):
+    @staticmethod
+    def _pct_labels(vals):
+        """Nhãn phần trăm 1 chữ số thập phân; thêm chữ số khi lưới dày làm nhãn bị trùng."""
+        for decimals in (1, 2, 3):
+            labels = [f'{v*100:.{decimals}f}%' for v in vals]
+            if len(set(labels)) == len(labels):
+                break
+        return labels
+
+    def _dcf_inputs(self, fcff_base=None, ebitda_base=None, ev_ebitda_multiple=None):
         """
-        Ma trận Terminal Value Integration DCF:
-        - Tích hợp dự phóng FCFF 5 năm và Terminal Value dựa trên EBITDA_n × Mean(EV/EBITDA).
+        FCFF năm gốc, EBITDA năm gốc và Mean(EV/EBITDA) lịch sử (dùng chung cho DCF & Monte Carlo).
+        Báo cáo quý: FCFF / EBITDA lấy từ bảng TTM tại quý gần nhất (NaN nếu 4 quý cuối không liên tục).
         """
-        is_df = self.dfs.get('INCOME STATEMENT')
-        cf_df = self.dfs.get('CASH FLOW STATEMENT')
+        is_df = self._flow_frame('INCOME STATEMENT')
+        cf_df = self._flow_frame('CASH FLOW STATEMENT')
         fi = self.dfs.get('FINANCIAL INDEX')
 
         if fcff_base is None:
@@ -253,10 +317,12 @@ class Forecaster:
         if ev_ebitda_multiple is None:
             if fi is not None:
                 ev_ebitda_row = self._get_row(fi, r'^EV/EBITDA$')
-                if ev_ebitda_row is not None:
+                ttm_multiples = self._ttm_ev_ebitda(fi) if get_period_axis(fi).is_quarterly else None
+                if ev_ebitda_row is not None or ttm_multiples is not None:
                     years = self._get_years(fi)
                     # Lọc EV/EBITDA dương
-                    hist_multiples = ev_ebitda_row[years].astype(float)
+                    hist_multiples = (ttm_multiples if ttm_multiples is not None
+                                      else ev_ebitda_row[years].astype(float))
                     valid_multiples = hist_multiples[hist_multiples > 0].dropna()
                     # Đồng nhất với valuation_bands(): lọc thêm các năm VCSH dương
                     # để loại bỏ các bội số bị méo (vd: 2023 = 24.94x khi VCSH âm)
@@ -274,34 +340,76 @@ class Forecaster:
             else:
                 ev_ebitda_multiple = 8.0
 
-        wacc_vals = np.arange(wacc_range[0], wacc_range[1] + wacc_range[2] / 2, wacc_range[2])
-        g_vals = np.arange(ebitda_growth_range[0], ebitda_growth_range[1] + ebitda_growth_range[2] / 2, ebitda_growth_range[2])
+        return fcff_base, ebitda_base, ev_ebitda_multiple
+
+    def dcf_sensitivity(self, fcff_base=None, ebitda_base=None, ev_ebitda_multiple=None,
+                        wacc_range=(0.08, 0.16, 0.005), ebitda_growth_range=(-0.02, 0.08, 0.005),
+                        wacc_vals=None, g_vals=None, fcff_path=None, n_years=5):
+        """
+        Ma trận Terminal Value Integration DCF:
+        - Tích hợp dự phóng FCFF 5 năm và Terminal Value dựa trên EBITDA_n × Mean(EV/EBITDA).
+        - Tính bằng broadcasting trên lưới (WACC × g × t) nên lưới dày (vd: 500×500) vẫn nhanh.
+        - wacc_vals / g_vals: truyền thẳng mảng giá trị thay cho (start, stop, step).
+        - fcff_path: FCFF từng năm dự phóng, shape (n_years,) hoặc (len(g), n_years);
+          khi có, FCFF không còn tăng theo g (g chỉ áp cho EBITDA terminal).
+        - singularity_map (0/1/2) + condition_number: dùng chung với Diagnostics (singularity.py).
+        """
+        fcff_base, ebitda_base, ev_ebitda_multiple = self._dcf_inputs(fcff_base, ebitda_base, ev_ebitda_multiple)
+        if not (np.isfinite(fcff_base) and np.isfinite(ebitda_base)):
+            # vd: báo cáo quý thiếu quý trong 4 quý gần nhất → không có gốc năm để định giá
+            return None
+
+        if wacc_vals is None:
+            wacc_vals = np.arange(wacc_range[0], wacc_range[1] + wacc_range[2] / 2, wacc_range[2])
+        if g_vals is None:
+            g_vals = np.arange(ebitda_growth_range[0], ebitda_growth_range[1] + ebitda_growth_range[2] / 2, ebitda_growth_range[2])
+        wacc_vals = np.asarray(wacc_vals, dtype=float)
+        g_vals = np.asarray(g_vals, dtype=float)
+
+        growth = 1 + g_vals[np.newaxis, :]           # (1, G)
+
+        if fcff_path is not None:
+            fcff_path = np.asarray(fcff_path, dtype=float)
+            n_years = fcff_path.shape[-1]
+            # (T, 1, 1) hoặc (T, 1, G) để broadcast với lưới (W, G)
+            flows = fcff_path.T.reshape(n_years, 1, -1)
+        else:
+            # FCFF_t = FCFF_0 × (1+g)^t, nhân dồn từng năm như dự phóng tuần tự
+            flows = np.empty((n_years, 1, len(g_vals)))
+            current = np.full((1, len(g_vals)), float(fcff_base))
+            for t in range(n_years):
+                current = current * growth
+                flows[t] = current
+
+        # Hệ số chiết khấu (1+WACC)^t chỉ phụ thuộc (W, T), không phụ thuộc g: tính bằng pow() vô hướng
+        # để khớp từng bit với công thức gốc (pow của mảng NumPy có thể lệch 1 ulp)
+        discount = np.array([[(1 + w) ** t for t in range(n_years + 1)] for w in wacc_vals.tolist()])
 
         matrix = np.zeros((len(wacc_vals), len(g_vals)))
-        n_years = 5
-        
-        for i, wacc in enumerate(wacc_vals):
-            for j, g in enumerate(g_vals):
-                ev = 0
-                current_fcff = fcff_base
-                for t in range(1, n_years + 1):
-                    current_fcff *= (1 + g)
-                    ev += current_fcff / ((1 + wacc) ** t)
-                
-                ebitda_terminal = ebitda_base * ((1 + g) ** n_years)
-                tv = ebitda_terminal * ev_ebitda_multiple
-                ev += tv / ((1 + wacc) ** n_years)
-                matrix[i, j] = round(ev, 1)
+        for t in range(1, n_years + 1):
+            matrix += flows[t - 1] / discount[:, t:t + 1]
+
+        growth_n = np.array([(1 + g_) ** n_years for g_ in g_vals.tolist()])[np.newaxis, :]
+        ebitda_terminal = ebitda_base * growth_n
+        tv = ebitda_terminal * ev_ebitda_multiple
+        matrix += tv / discount[:, n_years:n_years + 1]
+        matrix = np.round(matrix, 1)
+
+        # Ô WACC ≤ g (Gordon không xác định) / WACC - g < 0.5%: để heatmap che trực tiếp
+        smap = singularity_map(wacc_g_gap(wacc_vals, g_vals))
 
         return {
             'matrix': matrix,
-            'wacc_labels': [f'{w*100:.1f}%' for w in wacc_vals],
-            'g_labels': [f'{g_*100:.1f}%' for g_ in g_vals],
+            'singularity_map': smap,
+            'condition_number': condition_number(np.where(smap == SINGULAR, np.nan, matrix)),
+            'wacc_labels': self._pct_labels(wacc_vals),
+            'g_labels': self._pct_labels(g_vals),
             'wacc_vals': wacc_vals,
             'g_vals': g_vals,
             'fcff_base': fcff_base,
             'ebitda_base': ebitda_base,
-            'ev_ebitda_multiple': ev_ebitda_multiple
+            'ev_ebitda_multiple': ev_ebitda_multiple,
+            'n_years': n_years
         }
 
     # =========================================================================
@@ -309,14 +417,18 @@ class Forecaster:
     # =========================================================================
     def structural_sensitivity(self, base_oil=90.0, base_fx=25000.0, 
                                fuel_opex_ratio=0.375, usd_debt_ratio=0.8,
-                               oil_range=(70, 110, 5), fx_range=(24500, 26000, 100)):
+                               oil_range=(70, 110, 5), fx_range=(24500, 26000, 100),
+                               oil_vals=None, fx_vals=None):
         """
         Ma trận nhạy cảm dựa trên cấu trúc chi phí và nợ:
-        - Biến 1: Giá dầu Jet A1
-        - Biến 2: Tỷ giá USD/VND
-        - Output: EV/EBITDA
+        - Biến 1: Giá dầu Jet A1 (cột)
+        - Biến 2: Tỷ giá USD/VND (hàng)
+        - Output: EV/EBITDA, Lợi nhuận ròng + các bề mặt Chi phí nhiên liệu, Lãi vay, EBITDA
+
+        Toàn bộ lưới được tính một lần bằng broadcasting (tỷ giá theo trục 0, giá dầu theo trục 1)
+        nên trục nghìn điểm vẫn tức thì. oil_vals/fx_vals (tuỳ chọn) thay cho oil_range/fx_range.
         """
-        is_df = self.dfs.get('INCOME STATEMENT')
+        is_df = self._flow_frame('INCOME STATEMENT')
         bs_df = self.dfs.get('BALANCE SHEET')
         fi = self.dfs.get('FINANCIAL INDEX')
         
@@ -364,56 +476,59 @@ class Forecaster:
         interest_base = abs(float(interest_row[latest])) if interest_row is not None else 0.0
 
         # Ranges
-        oil_vals = np.arange(oil_range[0], oil_range[1] + oil_range[2] / 2, oil_range[2])
-        fx_vals = np.arange(fx_range[0], fx_range[1] + fx_range[2] / 2, fx_range[2])
-        
-        matrix_ev = np.zeros((len(fx_vals), len(oil_vals)))
-        matrix_ni = np.zeros((len(fx_vals), len(oil_vals)))
-        
-        # We also want to return the 'deltas' for the exact sliders provided
-        # (Though the heatmap covers the range, these components are useful for the 'Live Impact' UI)
-        
-        for i, fx in enumerate(fx_vals):
-            for j, oil in enumerate(oil_vals):
-                # A. EBITDA Impact (Impacts Operating Profit)
-                fuel_new = fuel_cost_base * (oil / base_oil) * (fx / base_fx)
-                non_fuel_new = non_fuel_opex_base * (fx / base_fx)
-                new_ebitda = rev_base - (fuel_new + non_fuel_new)
-                
-                # B. Financial / Net Profit Impact
-                # 1. Fuel cost delta
-                fuel_delta = fuel_new - fuel_cost_base
-                # 2. Interest cost delta (assume interest scales with FX if debt is USD)
-                interest_new = interest_base * (1 - usd_debt_ratio) + (interest_base * usd_debt_ratio * fx / base_fx)
-                int_delta = interest_new - interest_base
-                # 3. FX Revaluation Loss (Non-cash but hits NI)
-                debt_usd = (float(nnh[latest]) + float(ndh[latest])) * usd_debt_ratio
-                fx_reval_loss = debt_usd * (fx / base_fx - 1)
-                
-                new_ni = ni_base - fuel_delta - int_delta - fx_reval_loss
-                matrix_ni[i, j] = round(new_ni, 1)
+        if oil_vals is None:
+            oil_vals = np.arange(oil_range[0], oil_range[1] + oil_range[2] / 2, oil_range[2])
+        if fx_vals is None:
+            fx_vals = np.arange(fx_range[0], fx_range[1] + fx_range[2] / 2, fx_range[2])
+        oil_vals = np.asarray(oil_vals)
+        fx_vals = np.asarray(fx_vals)
 
-                # C. EV calculation
-                debt_total_base = float(nnh[latest]) + float(ndh[latest])
-                new_debt = (debt_total_base * (1 - usd_debt_ratio)) + (debt_total_base * usd_debt_ratio * fx / base_fx)
-                new_ev = mc_base + new_debt - cash_base
-                
-                if new_ebitda > 0:
-                    matrix_ev[i, j] = round(new_ev / new_ebitda, 2)
-                else:
-                    matrix_ev[i, j] = np.nan
-                    
+        # Hệ số biến động: fx theo hàng (F, 1), dầu theo cột (1, O)
+        oil_factor = (oil_vals / base_oil)[None, :]
+        fx_col = fx_vals[:, None]
+        fx_factor = fx_col / base_fx
+
+        # A. EBITDA Impact (Impacts Operating Profit)
+        fuel_new = fuel_cost_base * oil_factor * fx_factor
+        non_fuel_new = non_fuel_opex_base * fx_factor
+        new_ebitda = rev_base - (fuel_new + non_fuel_new)
+
+        # B. Financial / Net Profit Impact
+        # 1. Fuel cost delta
+        fuel_delta = fuel_new - fuel_cost_base
+        # 2. Interest cost delta (assume interest scales with FX if debt is USD) — chỉ phụ thuộc tỷ giá
+        interest_new = interest_base * (1 - usd_debt_ratio) + (interest_base * usd_debt_ratio * fx_col / base_fx)
+        int_delta = interest_new - interest_base
+        # 3. FX Revaluation Loss (Non-cash but hits NI)
+        debt_usd = debt_total_base * usd_debt_ratio
+        fx_reval_loss = debt_usd * (fx_factor - 1)
+
+        new_ni = ni_base - fuel_delta - int_delta - fx_reval_loss
+        matrix_ni = np.round(new_ni, 1)
+
+        # C. EV calculation (EV chỉ phụ thuộc tỷ giá qua nợ USD)
+        new_debt = (debt_total_base * (1 - usd_debt_ratio)) + (debt_total_base * usd_debt_ratio * fx_col / base_fx)
+        new_ev = mc_base + new_debt - cash_base
+
+        positive = new_ebitda > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            matrix_ev = np.where(positive, np.round(new_ev / new_ebitda, 2), np.nan)
+
+        shape = (len(fx_vals), len(oil_vals))
         return {
             'matrix': matrix_ev,
             'ni_matrix': matrix_ni,
-            'oil_labels': [f'${o}' for o in oil_vals],
+            'fuel_cost_matrix': fuel_new,
+            'interest_matrix': np.broadcast_to(interest_new, shape).copy(),
+            'ebitda_matrix': new_ebitda,
+            'oil_labels': [f'${o:g}' for o in oil_vals],
             'fx_labels': [f'{f:,.0f}' for f in fx_vals],
             'oil_vals': oil_vals,
             'fx_vals': fx_vals,
             'base_data': {
                 'ebitda': ebitda_base,
                 'revenue': rev_base,
-                'debt': float(nnh[latest]) + float(ndh[latest]),
+                'debt': debt_total_base,
                 'mc': mc_base,
                 'cash': cash_base,
                 'ni': ni_base,
@@ -425,40 +540,29 @@ class Forecaster:
     # =========================================================================
     # Scenario Analysis (Line Chart)
     # =========================================================================
-    def scenario_analysis(self, base_oil=90.0, base_fx=26300.0,
-                          fuel_opex_ratio=0.375, usd_debt_ratio=0.8):
-        """
-        Dự phóng 3 kịch bản EV/EBITDA tích hợp định lượng:
-        - Neo kịch bản từ Ma trận Nhạy cảm Cấu trúc (3b) để tính EBITDA Year-1
-        - Sử dụng độ co giãn Log-Log (MACRO_REGRESSION) để hiệu chỉnh tốc độ trôi chi phí dài hạn
-        - Giữ nguyên logic EV projection cho nợ/vốn hóa
-
-        3 kịch bản vĩ mô:
-          Base:     Oil ổn định ($base), FX ổn định, tăng trưởng EBITDA tự nhiên ~7%
-          Negative: Oil +$20 (sốc), FX +5% (mất giá VND), EBITDA bị ăn mòn theo cấu trúc
-          Positive: Oil -$15, FX -2% (VND tăng giá), cộng hiệu ứng Long Thành từ năm 3
-        """
-        is_df = self.dfs.get('INCOME STATEMENT')
+    def _scenario_base(self):
+        """Số liệu nền năm gần nhất cho kịch bản: Doanh thu, EBITDA, EV và độ co giãn Log-Log."""
+        is_df = self._flow_frame('INCOME STATEMENT')
         fi_df = self.dfs.get('FINANCIAL INDEX')
         bs_df = self.dfs.get('BALANCE SHEET')
         
         if is_df is None or fi_df is None or bs_df is None:
             return None
 
-        years_hist = self._get_years(is_df)
-        latest_year = int(years_hist[-1])
-        proj_years = [str(y) for y in range(latest_year, latest_year + 6)]
+        axis = get_period_axis(is_df)
+        if not axis:
+            return None
+        latest_year = axis.keys[-1][0]
+        # Nhãn kỳ mới nhất ('2025' hoặc 'Q4/2025' — số liệu TTM của quý đó)
+        latest = axis.latest
         
         # ── Lấy dữ liệu nền từ BCTC ──
         ebitda_row = self._get_row(is_df, r'^EBITDA$')
         rev_row = self._get_row(is_df, r'^Doanh số thuần$')
         if ebitda_row is None or rev_row is None: return None
         
-        ebitda_latest = float(ebitda_row[str(latest_year)])
-        rev_latest = float(rev_row[str(latest_year)])
-        opex_latest = rev_latest - ebitda_latest
-        fuel_cost_base = opex_latest * fuel_opex_ratio
-        non_fuel_opex_base = opex_latest * (1 - fuel_opex_ratio)
+        ebitda_latest = float(ebitda_row[latest])
+        rev_latest = float(rev_row[latest])
         
         ev_row = self._get_row(fi_df, r'^EV \(Enterprise Value\)')
         if ev_row is None:
@@ -469,12 +573,9 @@ class Forecaster:
              if any(r is None for r in [mc_row, nnh_row, ndh_row, cash_row]):
                  ev_latest = 0.0
              else:
-                 ev_latest = float(mc_row[str(latest_year)]) + float(nnh_row[str(latest_year)]) + float(ndh_row[str(latest_year)]) - float(cash_row[str(latest_year)])
+                 ev_latest = float(mc_row[latest]) + float(nnh_row[latest]) + float(ndh_row[latest]) - float(cash_row[latest])
         else:
-            ev_latest = float(ev_row[str(latest_year)])
-
-        if ebitda_latest <= 0:
-            ebitda_latest = 1000.0
+            ev_latest = float(ev_row[latest])
 
         # ── Lấy độ co giãn Log-Log từ pipeline (nếu có) ──
         macro_reg = self.dfs.get('MACRO_REGRESSION')
@@ -485,116 +586,162 @@ class Forecaster:
             e_oil = 0.04
             e_fx = 0.66
 
-        # ── Hàm tính EBITDA mới theo kịch bản Oil/FX (logic 3b) ──
-        def _compute_ebitda(oil_price, fx_rate):
-            fuel_new = fuel_cost_base * (oil_price / base_oil) * (fx_rate / base_fx)
-            non_fuel_new = non_fuel_opex_base * (fx_rate / base_fx)
-            return rev_latest - (fuel_new + non_fuel_new)
-
-        # ── Định nghĩa 3 đường dẫn vĩ mô (Oil, FX) qua 5 năm ──
-        # Mỗi năm: (oil_price, fx_rate)
-        paths = {
-            'base': [],      # Oil ổn định, FX ổn định
-            'negative': [],  # Oil tăng sốc rồi neo cao, FX mất giá dần
-            'positive': [],  # Oil giảm rồi ổn định, FX ổn định/tăng giá nhẹ
+        return {
+            'latest_year': latest_year,
+            'rev': rev_latest,
+            'ebitda': ebitda_latest,
+            'ev': ev_latest,
+            'e_oil': e_oil,
+            'e_fx': e_fx,
         }
-        
-        for i in range(6):  # year 0 (current) to year 5
-            # Base: Oil dao động nhẹ quanh base, FX trượt tự nhiên ~1%/năm
-            paths['base'].append((
-                base_oil + i * 1.0,                # Oil tăng nhẹ $1/năm
-                base_fx * (1 + 0.01 * i)           # FX trượt 1%/năm
-            ))
-            # Negative: Oil sốc +$20 năm 1, neo cao; FX trượt mạnh 3-5%/năm
-            if i == 0:
-                paths['negative'].append((base_oil, base_fx))
-            elif i == 1:
-                paths['negative'].append((base_oil + 20, base_fx * 1.05))  # Sốc năm 1
-            else:
-                prev_oil, prev_fx = paths['negative'][-1]
-                paths['negative'].append((prev_oil - 2, prev_fx * 1.02))   # Hồi phục chậm
-            # Positive: Oil giảm $15 năm 1, VND tăng giá nhẹ; Long Thành năm 3+
-            if i == 0:
-                paths['positive'].append((base_oil, base_fx))
-            elif i <= 2:
-                paths['positive'].append((base_oil - 15 + i * 3, base_fx * (1 - 0.01 * i)))
+
+    @staticmethod
+    def scenario_presets(base_oil=90.0, base_fx=26300.0, n_years=5):
+        """
+        3 kịch bản vĩ mô dựng sẵn, dạng đầu vào của scenario_engine:
+          Base:     Oil ổn định ($base), FX ổn định, tăng trưởng EBITDA tự nhiên ~7%
+          Negative: Oil +$20 (sốc), FX +5% (mất giá VND), EBITDA bị ăn mòn theo cấu trúc
+          Positive: Oil -$15, FX -2% (VND tăng giá), cộng hiệu ứng Long Thành từ năm 3
+        Trả về (names, paths (3, T, 3) = [oil, fx, chỉ số doanh thu], ev_growth (3, T), fx_ev_beta (3,));
+        dùng với rev_mode='index'.
+        """
+        t = np.arange(1, n_years + 1)
+
+        # Base: Oil tăng nhẹ $1/năm, FX trượt 1%/năm
+        base = (base_oil + t * 1.0, base_fx * (1 + 0.01 * t))
+
+        # Negative: Oil sốc +$20 năm 1 rồi hồi phục chậm -$2/năm; FX +5% năm 1 rồi trượt 2%/năm
+        neg_oil = [base_oil + 20]
+        neg_fx = [base_fx * 1.05]
+        # Positive: Oil giảm $15 năm 1, VND tăng giá nhẹ; từ năm 3 Oil +$2/năm, FX -1%/năm
+        pos_oil, pos_fx = [], []
+        for i in t:
+            if i > 1:
+                neg_oil.append(neg_oil[-1] - 2)
+                neg_fx.append(neg_fx[-1] * 1.02)
+            if i <= 2:
+                pos_oil.append(base_oil - 15 + i * 3)
+                pos_fx.append(base_fx * (1 - 0.01 * i))
             else:
-                prev_oil, prev_fx = paths['positive'][-1]
-                paths['positive'].append((prev_oil + 2, prev_fx * 0.99))
+                pos_oil.append(pos_oil[-1] + 2)
+                pos_fx.append(pos_fx[-1] * 0.99)
 
-        # ── Tính EBITDA trajectory cho từng kịch bản ──
-        ebitda_series = {'base': [], 'negative': [], 'positive': []}
-        ev_series = {'base': [], 'negative': [], 'positive': []}
+        # Doanh thu năm t = Doanh thu gốc × hệ số^t: Base 5%, Neg -2% (năm 1) / 2%, Pos 8% / 12% (năm 3+ Long Thành)
+        rev_index = np.array([
+            1.05 ** t,
+            np.where(t > 1, 1.02, 0.98) ** t,
+            np.where(t >= 3, 1.12, 1.08) ** t,
+        ])
+
+        paths = np.stack([
+            np.column_stack(base + (rev_index[0],)),
+            np.column_stack((neg_oil, neg_fx, rev_index[1])),
+            np.column_stack((pos_oil, pos_fx, rev_index[2])),
+        ])
+        # EV: Base +3%/năm, Neg +2%/năm cộng đánh giá lại nợ USD theo FX, Pos -2%/năm (giảm nợ ròng)
+        ev_growth = np.array([[1.03] * n_years, [1.02] * n_years, [0.98] * n_years])
+        fx_ev_beta = np.array([0.0, 0.3, 0.0])
+        return ['base', 'negative', 'positive'], paths, ev_growth, fx_ev_beta
+
+    def scenario_engine(self, paths, base_oil=90.0, base_fx=26300.0, fuel_opex_ratio=0.375,
+                        usd_debt_ratio=0.8, ev_growth=1.0, fx_ev_beta=0.3, rev_mode='growth', base=None):
+        """
+        Tính đồng thời EBITDA, EV và EV/EBITDA cho N kịch bản (vector hoá, không vòng lặp theo kịch bản).
+
+        paths: mảng (N, T, 3) cho các năm 1..T với 3 kênh [giá dầu, tỷ giá, doanh thu]:
+          rev_mode='growth' → kênh 3 là tăng trưởng doanh thu từng năm (0.05 = 5%), cộng dồn kép
+          rev_mode='index'  → kênh 3 là Doanh thu_t / Doanh thu năm gốc
+        ev_growth: hệ số tăng EV mỗi năm, vô hướng | (N,) | (N, T)
+        fx_ev_beta: độ nhạy EV theo mất giá VND qua nợ USD, vô hướng | (N,):
+          EV_t = EV_{t-1} × (ev_growth + (FX_t/FX_0 − 1) × tỷ lệ nợ USD × fx_ev_beta)
+        Cột 0 của kết quả là năm gốc (số liệu thực tế).
+        """
+        base = base or self._scenario_base()
+        if base is None:
+            return None
+
+        paths = np.asarray(paths, dtype=float)
+        if paths.ndim == 2:
+            paths = paths[np.newaxis]
+        n, n_years, _ = paths.shape
+        oil, fx, rev_channel = paths[..., 0], paths[..., 1], paths[..., 2]
+
+        rev_latest = base['rev']
+        ebitda_latest = base['ebitda'] if base['ebitda'] > 0 else 1000.0
+        ev_latest = base['ev']
+
+        rev_index = np.cumprod(1 + rev_channel, axis=1) if rev_mode == 'growth' else rev_channel
+
+        # ── EBITDA = Structural shock (3b formula) + Revenue growth assumption ──
+        rev_projected = rev_latest * rev_index
+        opex_projected = rev_projected - ebitda_latest  # Base opex structure
+        fuel_proj = opex_projected * fuel_opex_ratio
+        nonfuel_proj = opex_projected * (1 - fuel_opex_ratio)
+        fuel_shocked = fuel_proj * (oil / base_oil) * (fx / base_fx)
+        nonfuel_shocked = nonfuel_proj * (fx / base_fx)
+        # Floor EBITDA to avoid nonsensical negative infinity
+        ebitda = np.maximum(rev_projected - (fuel_shocked + nonfuel_shocked), ebitda_latest * 0.1)
+
+        # ── EV: tăng theo ev_growth, cộng đánh giá lại nợ USD khi FX mất giá ──
+        ev_growth = np.asarray(ev_growth, dtype=float)
+        if ev_growth.ndim == 1:
+            ev_growth = ev_growth[:, np.newaxis]
+        beta = np.asarray(fx_ev_beta, dtype=float)
+        if beta.ndim == 1:
+            beta = beta[:, np.newaxis]
+        fx_ev_impact = (fx / base_fx - 1) * usd_debt_ratio * beta
+        factors = np.broadcast_to(ev_growth + fx_ev_impact, (n, n_years))
+        # EV_t = EV_{t-1} × hệ số_t (nhân tuần tự từ EV năm gốc)
+        ev = np.cumprod(np.column_stack((np.full(n, ev_latest), factors)), axis=1)
+
+        ebitda = np.column_stack((np.full(n, ebitda_latest), ebitda))
+        latest_year = base['latest_year']
+        return {
+            'years': [str(y) for y in range(latest_year, latest_year + n_years + 1)],
+            'ebitda': ebitda,
+            'ev': ev,
+            'ev_ebitda': ev / np.maximum(ebitda, 1),
+        }
+
+    def scenario_analysis(self, base_oil=90.0, base_fx=26300.0,
+                          fuel_opex_ratio=0.375, usd_debt_ratio=0.8):
+        """
+        Dự phóng 3 kịch bản EV/EBITDA tích hợp định lượng:
+        - Neo kịch bản từ Ma trận Nhạy cảm Cấu trúc (3b) để tính EBITDA Year-1
+        - Sử dụng độ co giãn Log-Log (MACRO_REGRESSION) để hiệu chỉnh tốc độ trôi chi phí dài hạn
+        - Giữ nguyên logic EV projection cho nợ/vốn hóa
+
+        3 kịch bản vĩ mô là preset của scenario_engine (xem scenario_presets).
+        """
+        base = self._scenario_base()
+        if base is None:
+            return None
+
+        names, paths, ev_growth, fx_ev_beta = self.scenario_presets(base_oil, base_fx)
+        res = self.scenario_engine(paths, base_oil, base_fx, fuel_opex_ratio, usd_debt_ratio,
+                                   ev_growth=ev_growth, fx_ev_beta=fx_ev_beta, rev_mode='index', base=base)
+        ratios = dict(zip(names, np.round(res['ev_ebitda'], 2).tolist()))
+        ebitda_latest = res['ebitda'][0, 0]
+        ebitda_y1 = dict(zip(names, res['ebitda'][:, 1]))
 
-        for scenario in ['base', 'negative', 'positive']:
-            for i in range(6):
-                oil_i, fx_i = paths[scenario][i]
-                
-                if i == 0:
-                    ebitda_series[scenario].append(ebitda_latest)
-                    ev_series[scenario].append(ev_latest)
-                else:
-                    # EBITDA = Structural shock (3b formula) + Revenue growth assumption
-                    # Revenue growth: Base 5%, Neg 2%, Pos 8% (Year 1-2) / 12% (Year 3+ Long Thanh)
-                    if scenario == 'base':
-                        rev_growth = 1.05
-                    elif scenario == 'negative':
-                        rev_growth = 1.02 if i > 1 else 0.98
-                    else:
-                        rev_growth = 1.12 if i >= 3 else 1.08
-                    
-                    # Scale revenue for growth
-                    rev_projected = rev_latest * (rev_growth ** i)
-                    opex_projected = rev_projected - ebitda_latest  # Base opex structure
-                    fuel_proj = opex_projected * fuel_opex_ratio
-                    nonfuel_proj = opex_projected * (1 - fuel_opex_ratio)
-                    
-                    # Apply structural sensitivity shock from oil/fx
-                    fuel_shocked = fuel_proj * (oil_i / base_oil) * (fx_i / base_fx)
-                    nonfuel_shocked = nonfuel_proj * (fx_i / base_fx)
-                    ebitda_i = rev_projected - (fuel_shocked + nonfuel_shocked)
-                    
-                    # Floor EBITDA to avoid nonsensical negative infinity
-                    ebitda_i = max(ebitda_i, ebitda_latest * 0.1)
-                    ebitda_series[scenario].append(ebitda_i)
-
-                    # EV: Base stable, Neg increases (debt burden), Pos decreases (deleveraging)
-                    prev_ev = ev_series[scenario][-1]
-                    if scenario == 'base':
-                        ev_series[scenario].append(prev_ev * 1.03)
-                    elif scenario == 'negative':
-                        # Nợ USD tăng giá trị khi FX mất giá
-                        fx_ev_impact = (fx_i / base_fx - 1) * usd_debt_ratio * 0.3
-                        ev_series[scenario].append(prev_ev * (1.02 + fx_ev_impact))
-                    else:
-                        ev_series[scenario].append(prev_ev * 0.98)  # Giảm nợ ròng
-
-        # ── Tính EV/EBITDA ratios ──
-        ratio_base = [ev / max(eb, 1) for ev, eb in zip(ev_series['base'], ebitda_series['base'])]
-        ratio_neg = [ev / max(eb, 1) for ev, eb in zip(ev_series['negative'], ebitda_series['negative'])]
-        ratio_pos = [ev / max(eb, 1) for ev, eb in zip(ev_series['positive'], ebitda_series['positive'])]
-        
         # ── Build scenario descriptions dựa trên dữ liệu thực ──
-        neg_oil_y1 = paths['negative'][1][0]
-        neg_fx_y1 = paths['negative'][1][1]
-        pos_oil_y1 = paths['positive'][1][0]
-        neg_ebitda_y1_chg = (ebitda_series['negative'][1] / ebitda_latest - 1) * 100
-        pos_ebitda_y1_chg = (ebitda_series['positive'][1] / ebitda_latest - 1) * 100
+        neg_ebitda_y1_chg = (ebitda_y1['negative'] / ebitda_latest - 1) * 100
+        pos_ebitda_y1_chg = (ebitda_y1['positive'] / ebitda_latest - 1) * 100
 
         return {
-            'years': proj_years,
-            'base': [round(r, 2) for r in ratio_base],
-            'negative': [round(r, 2) for r in ratio_neg],
-            'positive': [round(r, 2) for r in ratio_pos],
+            'years': res['years'],
+            'base': ratios['base'],
+            'negative': ratios['negative'],
+            'positive': ratios['positive'],
             # Metadata cho UI
             'scenario_params': {
-                'neg_oil': neg_oil_y1,
-                'neg_fx': neg_fx_y1,
+                'neg_oil': float(paths[1, 0, 0]),
+                'neg_fx': float(paths[1, 0, 1]),
                 'neg_ebitda_chg': round(neg_ebitda_y1_chg, 1),
-                'pos_oil': pos_oil_y1,
+                'pos_oil': float(paths[2, 0, 0]),
                 'pos_ebitda_chg': round(pos_ebitda_y1_chg, 1),
-                'e_oil': round(e_oil * 100, 2),
-                'e_fx': round(e_fx * 100, 2),
+                'e_oil': round(base['e_oil'] * 100, 2),
+                'e_fx': round(base['e_fx'] * 100, 2),
             }
         }
 
@@ -624,11 +771,141 @@ class Forecaster:
         
         if shares <= 0: return 0.0
         
+        # ev_val có thể là mảng (vd: phân phối EV từ Monte Carlo) → tính vector hoá
+        if np.ndim(ev_val):
+            return np.round((np.asarray(ev_val, dtype=float) - net_debt - mi) / shares, 0)
+
         equity_value = ev_val - net_debt - mi
         target_price = equity_value / shares
         
         return round(target_price, 0)
 
+    # =========================================================================
+    # Monte Carlo Valuation
+    # =========================================================================
+    def _mc_distributions(self, distributional=None, multiple=8.0):
+        """
+        Phân phối mặc định cho Monte Carlo. Log-return Oil/FX lấy từ kết quả
+        test_distributional (Diagnostics) nếu có; phân phối đuôi dày → Student-t.
+        """
+        dists = {
+            'wacc': ('triangular', 0.08, 0.12, 0.16),
+            'g': ('triangular', -0.02, 0.03, 0.08),
+            'oil_return': ('normal', 0.0, 0.25),
+            'fx_return': ('normal', 0.01, 0.03),
+        }
+
+        vb = self.valuation_bands()
+        if vb and vb['mean'] > 0 and vb['upper_1s'] > vb['mean']:
+            # Lognormal quanh Mean(EV/EBITDA) với độ lệch chuẩn tương đối = σ/mean của dải lịch sử
+            rel_sd = (vb['upper_1s'] - vb['mean']) / vb['mean']
+            sigma = float(np.sqrt(np.log(1 + rel_sd ** 2)))
+            dists['multiple'] = ('lognormal', float(np.log(multiple)) - sigma ** 2 / 2, sigma)
+        else:
+            dists['multiple'] = ('normal', float(multiple), 0.0)
+
+        if distributional is None:
+            distributional = self.dfs.get('DIAG_DISTRIBUTIONAL')
+        tests = (distributional or {}).get('tests', {})
+        for name, key in [('Oil_Price', 'oil_return'), ('FX_Rate', 'fx_return')]:
+            fit = tests.get(name, {})
+            stats = fit.get('statistics')
+            if not stats:
+                continue
+            mu = stats['mean_return'] / 100
+            sd = stats['std_return'] / 100
+            if 'Fat-tailed' in fit.get('distribution_type', ''):
+                df = 4.0
+                # Chuẩn hoá scale để phương sai Student-t bằng phương sai mẫu
+                dists[key] = ('t', df, mu, sd * np.sqrt((df - 2) / df))
+            else:
+                dists[key] = ('normal', mu, sd)
+        return dists
+
+    def monte_carlo_valuation(self, n_paths=100_000, seed=42, chunk_size=20_000, n_years=5,
+                              distributions=None, distributional=None, fuel_opex_ratio=0.375,
+                              percentiles=(5, 25, 50, 75, 95)):
+        """
+        Định giá Monte Carlo: mỗi path rút (WACC, g, bội số EV/EBITDA terminal) và
+        đường Oil/FX n_years năm, rồi áp công thức của dcf_sensitivity + scenario_analysis:
+          EBITDA_t = Doanh thu_t − Opex_t × [tỷ trọng NL × (Oil_t/Oil_0)(FX_t/FX_0) + (1 − tỷ trọng NL) × FX_t/FX_0]
+          FCFF_t   = FCFF_0 (1+g)^t + (EBITDA_t − EBITDA_0 (1+g)^t)   (cú sốc vĩ mô đi thẳng vào dòng tiền)
+          EV       = Σ FCFF_t/(1+WACC)^t + EBITDA_n × Bội số/(1+WACC)^n
+        Khi Oil/FX đứng yên, EV trùng đúng ô tương ứng của ma trận DCF.
+
+        distributions: ghi đè phân phối theo tên ('wacc', 'g', 'multiple', 'oil_return', 'fx_return'),
+          dạng ('normal', mu, sd) | ('lognormal', mu, sd) | ('uniform', lo, hi)
+               | ('triangular', lo, mode, hi) | ('t', df, loc, scale) | ('fixed', value).
+        distributional: kết quả DiagnosticsEngine.results['DISTRIBUTIONAL'] (mặc định lấy DIAG_DISTRIBUTIONAL).
+        Tính theo từng khối chunk_size path để bộ nhớ trung gian không phụ thuộc n_paths;
+        cùng (seed, n_paths, chunk_size) cho cùng kết quả.
+        """
+        is_df = self._flow_frame('INCOME STATEMENT')
+        fcff_base, ebitda_base, ev_ebitda_multiple = self._dcf_inputs()
+        if not (np.isfinite(fcff_base) and np.isfinite(ebitda_base)):
+            return None
+        rev_row = self._get_row(is_df, r'^Doanh số thuần$') if is_df is not None else None
+        if rev_row is None:
+            return None
+        rev_latest = float(rev_row[self._get_years(is_df)[-1]])
+        opex_latest = rev_latest - ebitda_base
+        ebitda_floor = abs(ebitda_base) * 0.1
+
+        dists = self._mc_distributions(distributional, ev_ebitda_multiple)
+        dists.update(distributions or {})
+
+        t = np.arange(1, n_years + 1)
+        ev = np.empty(n_paths)
+        seeds = np.random.SeedSequence(seed).spawn(-(-n_paths // chunk_size))
+        for k, start in enumerate(range(0, n_paths, chunk_size)):
+            rng = np.random.default_rng(seeds[k])
+            n = min(chunk_size, n_paths - start)
+
+            wacc = _mc_draw(rng, dists['wacc'], (n, 1))
+            g = _mc_draw(rng, dists['g'], (n, 1))
+            multiple = _mc_draw(rng, dists['multiple'], n)
+            # Đường Oil/FX tương đối so với mức nền (Oil_t/Oil_0): bước ngẫu nhiên hình học
+            oil_rel = np.exp(np.cumsum(_mc_draw(rng, dists['oil_return'], (n, n_years)), axis=1))
+            fx_rel = np.exp(np.cumsum(_mc_draw(rng, dists['fx_return'], (n, n_years)), axis=1))
+
+            growth = (1 + g) ** t                                  # (n, T)
+            opex_shock = fuel_opex_ratio * oil_rel * fx_rel + (1 - fuel_opex_ratio) * fx_rel
+            ebitda_ref = ebitda_base * growth
+            ebitda = np.maximum(rev_latest * growth - opex_latest * growth * opex_shock, ebitda_floor)
+            fcff = fcff_base * growth + (ebitda - ebitda_ref)
+
+            discount = (1 + wacc) ** t
+            ev[start:start + n] = (fcff / discount).sum(axis=1) + ebitda[:, -1] * multiple / discount[:, -1]
+
+        fi = self.dfs.get('FINANCIAL INDEX')
+        latest = self._get_years(fi)[-1] if fi is not None else None
+        price = self.ev_to_target_price(ev, latest)
+        if np.ndim(price) == 0:
+            # Thiếu Nợ ròng / Số CP lưu hành → không quy đổi được EV sang giá; không báo phân phối giá giả
+            print("  → Cảnh báo: Monte Carlo thiếu Nợ ròng/Số CP lưu hành, chỉ có phân phối EV.")
+            price = None
+
+        def _summary(x):
+            out = {'mean': float(np.mean(x)), 'std': float(np.std(x))}
+            out.update({f'p{q}': float(v) for q, v in zip(percentiles, np.percentile(x, percentiles))})
+            return out
+
+        return {
+            'ev': ev,
+            'price': price,
+            'ev_summary': _summary(ev),
+            'price_summary': _summary(price) if price is not None else None,
+            'prob_negative_equity': float(np.mean(price < 0)) if price is not None else None,
+            'distributions': {k: list(v) for k, v in dists.items()},
+            'base': {
+                'fcff_base': fcff_base, 'ebitda_base': ebitda_base, 'rev_base': rev_latest,
+                'ev_ebitda_multiple': ev_ebitda_multiple, 'fuel_opex_ratio': fuel_opex_ratio,
+            },
+            'n_paths': n_paths,
+            'n_years': n_years,
+            'seed': seed,
+        }
+
     # =========================================================================
     # What-if ROE Simulator
     # =========================================================================
@@ -665,7 +942,7 @@ class Forecaster:
         ev_ebitda_min = 0.0
         ev_ebitda_max = 0.0
         
-        is_df = self.dfs.get('INCOME STATEMENT')
+        is_df = self._flow_frame('INCOME STATEMENT')
         if valuation_bands_res and is_df is not None:
             # Lấy EBITDA cơ sở năm cuối (thường là 2025) từ INCOME STATEMENT
             ebitda_row = self._get_row(is_df, r'^EBITDA$')
@@ -700,13 +977,10 @@ class Forecaster:
             'price_dcf_max': self.ev_to_target_price(dcf_max, latest)
         }
 
-    def save_outputs(self, results, out_dir="output/4_advanced"):
-        import os
-        import json
-        if not os.path.exists(out_dir):
-            os.makedirs(out_dir)
+    def save_outputs(self, results, out_dir="output/4_advanced", fmt=None, export_csv=False):
+        store = ArtifactStore(out_dir, fmt=fmt, export_csv=export_csv)
 
-        # Trích xuất và lưu riêng rẽ các components để đáp ứng yêu cầu CSV, JSON
+        # Trích xuất và lưu riêng rẽ các components (bảng → store, meta → JSON)
         if 'STL_REVENUE' in results:
             stl = results['STL_REVENUE']
             stl_df = pd.DataFrame({
@@ -716,9 +990,8 @@ class Forecaster:
                 'residual': stl['residual']
             })
             stl_df.index.name = 'Year'
-            stl_df.to_csv(os.path.join(out_dir, "stl_revenue.csv"))
-            with open(os.path.join(out_dir, "stl_method.json"), 'w') as f:
-                json.dump({'method': stl['method']}, f)
+            store.save_frame("stl_revenue", stl_df, index=True)
+            store.save_json("stl_method", {'method': stl['method']})
                 
         if 'VALUATION_BANDS' in results:
             vb = results['VALUATION_BANDS']
@@ -731,29 +1004,23 @@ class Forecaster:
                 'lower_2s': [vb['lower_2s']] * len(vb['years'])
             }, index=vb['years'])
             bands_df.index.name = 'Year'
-            bands_df.to_csv(os.path.join(out_dir, "valuation_bands.csv"))
-            with open(os.path.join(out_dir, "valuation_meta.json"), 'w') as f:
-                json.dump({'band_position': vb['band_position']}, f)
+            store.save_frame("valuation_bands", bands_df, index=True)
+            store.save_json("valuation_meta", {'band_position': vb['band_position']})
 
         if 'DCF_MATRIX' in results:
             dcf = results['DCF_MATRIX']
-            # Save matrix as CSV
             dcf_df = pd.DataFrame(dcf['matrix'], index=dcf['wacc_labels'], columns=dcf['g_labels'])
             dcf_df.index.name = 'WACC / g'
-            dcf_df.to_csv(os.path.join(out_dir, "dcf_matrix.csv"))
-            # Save meta as JSON
+            store.save_frame("dcf_matrix", dcf_df, index=True)
             meta = {
                 'wacc_vals': list(dcf['wacc_vals']),
                 'g_vals': list(dcf['g_vals']),
                 'fcff_base': dcf['fcff_base']
             }
-            with open(os.path.join(out_dir, "dcf_meta.json"), 'w') as f:
-                json.dump(meta, f)
+            store.save_json("dcf_meta", meta)
 
         if 'FOOTBALL_FIELD' in results:
-            ff = results['FOOTBALL_FIELD']
-            with open(os.path.join(out_dir, "football_field.json"), 'w', encoding='utf-8') as f:
-                json.dump(ff, f, ensure_ascii=False, indent=4)
+            store.save_json("football_field", results['FOOTBALL_FIELD'])
         print(f"Forecaster outputs saved to {out_dir}")
 
     # =========================================================================
@@ -0,0 +1,340 @@
+"""
+instrumentation.py — Đo đạc Pipeline: wall time, CPU time, bộ nhớ đỉnh, số dòng
+==============================================================================
+Mỗi phương thức public của Calculator, DiagnosticsEngine, Forecaster,
+BusinessClassifier, ReportGenerator (gắn @traced_class) và mỗi Stage được ghi
+thành một span lồng nhau:
+  - wall_ms  : perf_counter
+  - cpu_ms   : process_time (toàn tiến trình)
+  - peak_kb  : bộ nhớ đỉnh phát sinh trong span (tracemalloc, tính cả mảng numpy) — chỉ khi
+               bật riêng PHANTICH_TRACE_MEMORY, vì tracemalloc làm chậm đáng kể mọi cấp phát
+               (nhất là lúc import thư viện) và làm sai lệch wall time của span
+  - rows     : số dòng DataFrame trả về, hoặc tổng số dòng trong self.dfs nếu
+               phương thức chỉ cập nhật tại chỗ (rows_source = 'result' | 'dfs')
+Trace được ghi theo định dạng Chrome Trace (mở bằng chrome://tracing hoặc
+ui.perfetto.dev), kèm bảng tổng hợp theo tên span trong khoá 'summary'.
+Span sinh ra trong process con (Stage song song, nhóm kiểm định) được gửi về
+process chính và ghép vào cùng một trace (mỗi process một làn pid).
+
+Bật bằng biến môi trường (process con kế thừa):
+  PHANTICH_TRACE=output/trace.json   (hoặc =1 → output/.trace/trace_<thời điểm>.json)
+  PHANTICH_TRACE_MEMORY=1                    → thêm peak_kb / mem_delta_kb (tracemalloc)
+  PHANTICH_PROFILE=cprofile | pyinstrument   → hồ sơ cho từng Stage trong output/.trace/
+Khi tắt, mỗi phương thức chỉ tốn thêm một phép kiểm tra cờ.
+"""
+
+import functools
+import inspect
+import io
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+TRACE_ENV = 'PHANTICH_TRACE'
+PROFILE_ENV = 'PHANTICH_PROFILE'
+MEMORY_ENV = 'PHANTICH_TRACE_MEMORY'
+DEFAULT_DIR = os.path.join('output', '.trace')
+
+_STATE = {'enabled': False}
+_EVENTS = []
+_LOCAL = threading.local()
+
+
+def _stack():
+    if not hasattr(_LOCAL, 'stack'):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+def enabled():
+    return _STATE['enabled']
+
+
+def enable(path=None, memory=None):
+    """
+    Bật trace trong process này (và process con tạo sau đó qua biến môi trường).
+    memory=True (hoặc PHANTICH_TRACE_MEMORY) → đo thêm bộ nhớ bằng tracemalloc.
+    """
+    os.environ[TRACE_ENV] = path or os.environ.get(TRACE_ENV) or '1'
+    _STATE['enabled'] = True
+    if memory is None:
+        memory = os.environ.get(MEMORY_ENV, '') not in ('', '0')
+    if memory:
+        os.environ[MEMORY_ENV] = '1'
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def disable():
+    os.environ.pop(TRACE_ENV, None)
+    os.environ.pop(MEMORY_ENV, None)
+    _STATE['enabled'] = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def count_rows(obj):
+    """Tổng số dòng của các DataFrame trong obj (DataFrame / dict / list), None nếu không có."""
+    if isinstance(obj, pd.DataFrame):
+        return len(obj)
+    if isinstance(obj, dict):
+        values = obj.values()
+    elif isinstance(obj, (list, tuple)):
+        values = obj
+    else:
+        return None
+    total, found = 0, False
+    for v in values:
+        if isinstance(v, pd.DataFrame):
+            total += len(v)
+            found = True
+        elif isinstance(v, (dict, list, tuple)):
+            n = count_rows(v)
+            if n is not None:
+                total += n
+                found = True
+    return total if found else None
+
+
+# =============================================================================
+# SPAN
+# =============================================================================
+class span:
+    """Context manager đo một đoạn mã; không làm gì khi trace đang tắt."""
+
+    def __init__(self, name, cat='pipeline', **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.active = False
+
+    def set_rows(self, rows, source='result'):
+        if rows is not None:
+            self.args['rows'] = rows
+            self.args['rows_source'] = source
+
+    def __enter__(self):
+        if not _STATE['enabled']:
+            return self
+        self.active = True
+        self.mem0 = self.peak_seen = 0
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            stack = _stack()
+            if stack:
+                # reset_peak dưới đây xoá đỉnh của span cha → lưu lại trước
+                stack[-1].peak_seen = max(stack[-1].peak_seen, peak)
+            tracemalloc.reset_peak()
+            self.mem0 = self.peak_seen = current
+        _stack().append(self)
+        self.ts = time.time_ns() // 1000
+        self.cpu0 = time.process_time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.active:
+            return False
+        wall = time.perf_counter() - self.t0
+        cpu = time.process_time() - self.cpu0
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        args = dict(self.args, wall_ms=round(wall * 1000, 3), cpu_ms=round(cpu * 1000, 3))
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(self.peak_seen, peak)
+            if stack:
+                stack[-1].peak_seen = max(stack[-1].peak_seen, peak)
+            args['peak_kb'] = round((peak - self.mem0) / 1024, 1)
+            args['mem_delta_kb'] = round((current - self.mem0) / 1024, 1)
+        if exc_type is not None:
+            args['error'] = f"{exc_type.__name__}: {exc}"
+        _EVENTS.append({
+            'name': self.name, 'cat': self.cat, 'ph': 'X',
+            'ts': self.ts, 'dur': round(wall * 1e6, 1),
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+            'args': args,
+        })
+        return False
+
+
+def _wrap(func, cat, qualname):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _STATE['enabled']:
+            return func(*args, **kwargs)
+        with span(qualname, cat) as sp:
+            result = func(*args, **kwargs)
+            rows = count_rows(result)
+            if rows is not None:
+                sp.set_rows(rows, 'result')
+            elif args and isinstance(getattr(args[0], 'dfs', None), dict):
+                sp.set_rows(count_rows(args[0].dfs), 'dfs')
+            return result
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def traced(cat='pipeline', name=None):
+    """Decorator cho hàm đơn lẻ."""
+    def deco(func):
+        return _wrap(func, cat, name or func.__qualname__)
+    return deco
+
+
+def traced_class(cat):
+    """Gắn span cho mọi phương thức public (không gồm staticmethod/classmethod) của lớp."""
+    def deco(cls):
+        for name, attr in list(vars(cls).items()):
+            if name.startswith('_') or not inspect.isfunction(attr) or getattr(attr, '__traced__', False):
+                continue
+            setattr(cls, name, _wrap(attr, cat, f"{cls.__name__}.{name}"))
+        return cls
+    return deco
+
+
+# =============================================================================
+# GHÉP SPAN GIỮA CÁC PROCESS
+# =============================================================================
+def drain():
+    """Lấy và xoá các span đã ghi trong process này (gửi kèm kết quả về process chính)."""
+    events = list(_EVENTS)
+    del _EVENTS[:len(events)]
+    return events
+
+
+def _reset_after_fork():
+    # Process con (fork) kế thừa bản sao các span của process cha: xoá đi để drain() không gửi
+    # trả chúng về cha lần nữa (trace bị đếm trùng). Với spawn, module được nạp lại nên buffer vốn rỗng.
+    del _EVENTS[:]
+    _LOCAL.stack = []
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def merge(events):
+    if events:
+        _EVENTS.extend(events)
+
+
+def events():
+    return list(_EVENTS)
+
+
+def clear():
+    del _EVENTS[:]
+
+
+# =============================================================================
+# XUẤT TRACE
+# =============================================================================
+def summary(evts=None):
+    """Tổng hợp theo tên span: số lần gọi, tổng wall/cpu (ms), bộ nhớ đỉnh lớn nhất, số dòng gần nhất."""
+    out = {}
+    for ev in evts if evts is not None else _EVENTS:
+        a = ev['args']
+        s = out.setdefault(ev['name'], {'cat': ev['cat'], 'calls': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0,
+                                        'peak_kb': 0.0, 'rows': None})
+        s['calls'] += 1
+        s['wall_ms'] = round(s['wall_ms'] + a.get('wall_ms', 0.0), 3)
+        s['cpu_ms'] = round(s['cpu_ms'] + a.get('cpu_ms', 0.0), 3)
+        s['peak_kb'] = max(s['peak_kb'], a.get('peak_kb', 0.0))
+        if a.get('rows') is not None:
+            s['rows'] = a['rows']
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]['wall_ms']))
+
+
+def trace_path():
+    """Đường dẫn file trace theo biến môi trường PHANTICH_TRACE."""
+    value = os.environ.get(TRACE_ENV, '')
+    if value and value not in ('1', 'true', 'True'):
+        return value
+    return os.path.join(DEFAULT_DIR, f"trace_{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+
+def write_trace(path=None, metadata=None):
+    """Ghi Chrome Trace JSON (traceEvents + summary + metadata). Trả về đường dẫn."""
+    path = path or trace_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    evts = sorted(_EVENTS, key=lambda e: e['ts'])
+    names = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': f'pid {pid}'}}
+             for pid in sorted({e['pid'] for e in evts})]
+    payload = {
+        'traceEvents': names + evts,
+        'displayTimeUnit': 'ms',
+        'summary': summary(evts),
+        'metadata': metadata or {},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=1, default=str)
+    return path
+
+
+def print_summary(limit=15):
+    rows = list(summary().items())[:limit]
+    if not rows:
+        return
+    print(f" {'Span':<52} {'calls':>5} {'wall ms':>10} {'cpu ms':>10} {'peak KB':>10} {'rows':>7}")
+    for name, s in rows:
+        rows_txt = '' if s['rows'] is None else str(s['rows'])
+        print(f" {name[:52]:<52} {s['calls']:>5} {s['wall_ms']:>10.1f} {s['cpu_ms']:>10.1f} "
+              f"{s['peak_kb']:>10.1f} {rows_txt:>7}")
+
+
+# =============================================================================
+# PROFILER (cProfile / pyinstrument)
+# =============================================================================
+@contextmanager
+def profiled(name):
+    """Hồ sơ chi tiết cho một khối mã nếu PHANTICH_PROFILE được đặt; ngược lại không làm gì."""
+    kind = os.environ.get(PROFILE_ENV, '').strip().lower()
+    if not kind:
+        yield
+        return
+    os.makedirs(DEFAULT_DIR, exist_ok=True)
+    base = os.path.join(DEFAULT_DIR, f"profile_{name}_{os.getpid()}")
+
+    if kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("Lưu ý: Chưa cài pyinstrument, chuyển sang cProfile.")
+            kind = 'cprofile'
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(base + ".html", 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+                with open(base + ".txt", 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_text(unicode=True))
+            return
+
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(base + ".prof")
+        buf = io.StringIO()
+        pstats.Stats(profiler, stream=buf).sort_stats('cumulative').print_stats(40)
+        with open(base + ".txt", 'w', encoding='utf-8') as f:
+            f.write(buf.getvalue())
+
+
+if os.environ.get(TRACE_ENV):
+    enable()
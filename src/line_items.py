@@ -0,0 +1,103 @@
+"""
+line_items.py — Chỉ mục Khoản mục dùng chung cho toàn bộ Pipeline
+==================================================================
+Mỗi sheet (DataFrame có cột 'Khoản mục') được lập chỉ mục MỘT lần:
+  - Tên chuẩn hoá (strip + lower) → vị trí dòng đầu tiên
+  - Bộ nhớ đệm pattern regex → vị trí dòng (hoặc None)
+
+Nhờ vậy `_get_row(df, pattern)` ở mọi stage chỉ quét chuỗi lần đầu gặp
+pattern; các lần sau tra cứu O(1). Ngữ nghĩa giữ nguyên như
+`df['Khoản mục'].str.contains(pattern, case=False, na=False, regex=True)`
+rồi lấy dòng khớp đầu tiên.
+"""
+
+import re
+import weakref
+
+ITEM_COL = 'Khoản mục'
+
+# Pattern dạng '^literal$' (không có ký tự regex đặc biệt) được tra thẳng qua dict
+_EXACT_RE = re.compile(r'^\^((?:[^\\^$.|?*+()\[\]{}]|\\[\\^$.|?*+()\[\]{}/])*)\$$')
+_UNESCAPE_RE = re.compile(r'\\(.)')
+
+
+def _normalize(name):
+    return name.strip().lower()
+
+
+class LineItemIndex:
+    """Chỉ mục tên Khoản mục → vị trí dòng cho một DataFrame."""
+
+    def __init__(self, df):
+        self._df_ref = weakref.ref(df)
+        self._n_rows = len(df)
+        names = df[ITEM_COL].tolist() if ITEM_COL in df.columns else []
+        # Giữ nguyên tên gốc cho các pattern regex tổng quát; None cho ô không phải chuỗi (na=False)
+        self._names = [n if isinstance(n, str) else None for n in names]
+        self._positions = {}
+        for pos, name in enumerate(self._names):
+            if name is not None:
+                self._positions.setdefault(_normalize(name), pos)
+        self._pattern_cache = {}
+
+    def is_valid_for(self, df):
+        """Chỉ mục còn hiệu lực nếu cùng đối tượng và số dòng chưa đổi (drop/append đều đổi số dòng)."""
+        return self._df_ref() is df and len(df) == self._n_rows
+
+    def find(self, pattern, case=False):
+        """Vị trí dòng đầu tiên khớp pattern (re.search), hoặc None."""
+        key = (pattern, case)
+        if key in self._pattern_cache:
+            return self._pattern_cache[key]
+
+        pos = None
+        exact = _EXACT_RE.match(pattern) if not case else None
+        if exact is not None:
+            literal = _UNESCAPE_RE.sub(r'\1', exact.group(1))
+            pos = self._positions.get(literal.lower())
+            # Tên đã strip khi nạp; nếu còn khoảng trắng đầu/cuối thì không khớp '^...$'
+            if pos is not None and self._names[pos].lower() != literal.lower():
+                pos = self._scan(pattern, case)
+        else:
+            pos = self._scan(pattern, case)
+
+        self._pattern_cache[key] = pos
+        return pos
+
+    def _scan(self, pattern, case):
+        regex = re.compile(pattern, 0 if case else re.IGNORECASE)
+        for pos, name in enumerate(self._names):
+            if name is not None and regex.search(name):
+                return pos
+        return None
+
+
+_INDEX_REGISTRY = {}
+
+
+def get_line_index(df):
+    """Lấy (hoặc lập mới) chỉ mục cho df. Tự lập lại khi df bị drop/append dòng."""
+    key = id(df)
+    index = _INDEX_REGISTRY.get(key)
+    if index is None or not index.is_valid_for(df):
+        is_new_object = index is None or index._df_ref() is not df
+        index = LineItemIndex(df)
+        _INDEX_REGISTRY[key] = index
+        if is_new_object:
+            weakref.finalize(df, _INDEX_REGISTRY.pop, key, None)
+    return index
+
+
+def invalidate_line_index(df):
+    """Huỷ chỉ mục của df — dùng khi sửa tên Khoản mục tại chỗ mà không đổi số dòng."""
+    _INDEX_REGISTRY.pop(id(df), None)
+
+
+def find_row(df, pattern, case=False):
+    """Dòng đầu tiên có 'Khoản mục' khớp pattern, hoặc None."""
+    if df is None or df.empty or ITEM_COL not in df.columns:
+        return None
+    pos = get_line_index(df).find(pattern, case=case)
+    if pos is None:
+        return None
+    return df.iloc[pos]
@@ -0,0 +1,201 @@
+"""
+loglog_model.py — Mô hình chi phí Log-Log (FWL) dùng chung
+==========================================================
+ln(TC) = α + β_Q·ln(Q) + ε_oil·resid(Oil|Q) + ε_fx·resid(FX|Q) [+ γ·Covid]
+
+Calculator.calculate_macro_regression_leverage và các kiểm định của DiagnosticsEngine
+(ADF, Breusch-Pagan, Durbin-Watson, Jarque-Bera, Backtest, Granger...) cùng dùng một
+bộ dữ liệu log + hồi quy phụ FWL + hồi quy chính. Kết quả được ghi nhớ theo nội dung
+đầu vào (năm, Doanh thu, EBIT, Oil, FX) và cờ Covid dummy, nên trong một tiến trình
+mô hình chỉ được fit đúng một lần.
+
+Các mảng trả về là read-only: nơi dùng phải copy trước khi sửa tại chỗ.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from line_items import find_row
+from period_axis import get_period_axis
+from ttm import ttm_frame
+
+try:
+    from sklearn.linear_model import LinearRegression
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+COVID_YEARS = ('2020', '2021', '2022')
+DEFAULT_OIL = 90
+DEFAULT_FX = 24000
+
+_CACHE = OrderedDict()
+_CACHE_SIZE = 16
+
+
+def macro_series(df_macro, years):
+    """
+    Giá dầu & tỷ giá theo từng năm từ MACRO_DATA; năm thiếu dùng giá trị mặc định.
+    `years` là năm dương lịch của từng kỳ (kỳ quý dùng số liệu vĩ mô của năm chứa nó).
+    """
+    macro_fx, macro_oil = {}, {}
+    if df_macro is not None and not df_macro.empty:
+        for _, row in df_macro.iterrows():
+            try:
+                yr = str(int(row['Year']))
+                if pd.notna(row.get('Oil_Price')):
+                    macro_oil[yr] = float(row['Oil_Price'])
+                if pd.notna(row.get('FX_Rate')):
+                    macro_fx[yr] = float(row['FX_Rate'])
+            except Exception:
+                pass
+    oil_arr = np.array([macro_oil.get(str(y), DEFAULT_OIL) for y in years])
+    fx_arr = np.array([macro_fx.get(str(y), DEFAULT_FX) for y in years])
+    return oil_arr, fx_arr
+
+
+def loglog_frame(is_df):
+    """
+    (bảng, kỳ) dùng cho mô hình Log-Log. Báo cáo quý → bảng TTM (tổng 4 quý) và chỉ giữ
+    các kỳ đủ 4 quý liên tiếp, để không hồi quy trên dòng chảy của một quý đơn lẻ;
+    báo cáo năm → giữ nguyên bảng và mọi kỳ.
+    """
+    axis = get_period_axis(is_df)
+    if is_df is None or not axis.is_quarterly:
+        return is_df, axis.periods
+    frame = ttm_frame(is_df, 'sum')
+    filled = frame[axis.periods].notna().any(axis=0)
+    return frame, [p for p in axis.periods if filled[p]]
+
+
+def period_years(df, periods):
+    """Năm dương lịch của từng kỳ (theo trục kỳ của df): 'Q1/2014' → 2014, '2014' → 2014."""
+    axis = get_period_axis(df)
+    year_of = dict(zip(axis.periods, axis.years))
+    return [year_of.get(p, p) for p in periods]
+
+
+def _cache_key(years, arrays, use_covid_dummy):
+    h = hashlib.sha256()
+    h.update(repr([str(y) for y in years]).encode('utf-8'))
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        h.update(str(arr.dtype).encode('ascii'))
+        h.update(arr.tobytes())
+    h.update(b'covid' if use_covid_dummy else b'no-covid')
+    return h.hexdigest()
+
+
+def _freeze(arr):
+    arr.setflags(write=False)
+    return arr
+
+
+def fit_loglog(years, rev_vals, ebit_vals, oil_arr, fx_arr, use_covid_dummy=True, calendar_years=None):
+    """
+    Log-transform + trực giao hoá FWL + hồi quy chính (ghi nhớ theo nội dung đầu vào).
+    `calendar_years`: năm dương lịch của từng kỳ cho Covid dummy (mặc định = `years`).
+    Trả về dict mảng + các mô hình đã fit (reg_main, reg_fx_aux, reg_oil_aux),
+    hoặc None nếu thiếu sklearn.
+    """
+    if not SKLEARN_AVAILABLE:
+        return None
+
+    rev_vals = np.asarray(rev_vals, dtype=float)
+    ebit_vals = np.asarray(ebit_vals, dtype=float)
+    key = _cache_key(years, (rev_vals, ebit_vals, oil_arr, fx_arr), use_covid_dummy)
+    if key in _CACHE:
+        _CACHE.move_to_end(key)
+        return dict(_CACHE[key])
+
+    tc_vals = rev_vals - ebit_vals
+
+    # Chống log(số âm) - Ép giá trị dương trước khi tính Logarit
+    tc_vals_safe = np.maximum(tc_vals, 1.0)
+    rev_vals_safe = np.maximum(rev_vals, 1.0)
+
+    # Dummy Covid (2020-2022 = 1, else 0)
+    calendar_years = years if calendar_years is None else calendar_years
+    covid_dummy = np.array([1 if str(y) in COVID_YEARS else 0 for y in calendar_years])
+
+    ln_TC = np.log(tc_vals_safe)
+    ln_Q = np.log(rev_vals_safe)
+    ln_oil = np.log(oil_arr)
+    ln_fx = np.log(fx_arr)
+
+    # FWL: hồi quy phụ FX ~ Q, Oil ~ Q → phần dư = cú sốc thuần tuý
+    reg_fx_aux = LinearRegression().fit(ln_Q.reshape(-1, 1), ln_fx)
+    resid_fx = ln_fx - reg_fx_aux.predict(ln_Q.reshape(-1, 1))
+
+    reg_oil_aux = LinearRegression().fit(ln_Q.reshape(-1, 1), ln_oil)
+    resid_oil = ln_oil - reg_oil_aux.predict(ln_Q.reshape(-1, 1))
+
+    if use_covid_dummy:
+        X_fwl = np.column_stack((ln_Q, resid_oil, resid_fx, covid_dummy))
+    else:
+        X_fwl = np.column_stack((ln_Q, resid_oil, resid_fx))
+    y_fwl = ln_TC
+
+    reg_main = LinearRegression(fit_intercept=True).fit(X_fwl, y_fwl)
+    residuals = y_fwl - reg_main.predict(X_fwl)
+
+    result = {
+        'X_fwl': X_fwl,
+        'y_fwl': y_fwl,
+        'residuals': residuals,
+        'ln_Q': ln_Q,
+        'ln_TC': ln_TC,
+        'ln_oil': ln_oil,
+        'ln_fx': ln_fx,
+        'resid_oil': resid_oil,
+        'resid_fx': resid_fx,
+        'oil_arr': np.array(oil_arr),
+        'fx_arr': np.array(fx_arr),
+        'covid_dummy': covid_dummy,
+        'rev_vals': rev_vals.copy(),
+        'ebit_vals': ebit_vals.copy(),
+        'tc_vals': tc_vals,
+    }
+    for v in result.values():
+        _freeze(v)
+    result.update({
+        'years': list(years),
+        'use_covid_dummy': use_covid_dummy,
+        'reg_main': reg_main,
+        'reg_fx_aux': reg_fx_aux,
+        'reg_oil_aux': reg_oil_aux,
+    })
+
+    _CACHE[key] = result
+    while len(_CACHE) > _CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return dict(result)
+
+
+def build_loglog_data(is_df, df_macro, years, use_covid_dummy=True):
+    """
+    Dựng mô hình Log-Log từ bảng KQKD + MACRO_DATA. Trả về None nếu thiếu dữ liệu.
+    Báo cáo quý: truyền bảng/kỳ từ `loglog_frame` (TTM); kỳ được quy về năm dương lịch
+    trước khi ghép số liệu vĩ mô và Covid dummy.
+    """
+    if not SKLEARN_AVAILABLE or is_df is None or len(years) < 5:
+        return None
+
+    rev_row = find_row(is_df, r'^Doanh số thuần$')
+    ebit_row = find_row(is_df, r'^EBIT$')
+    if rev_row is None or ebit_row is None:
+        return None
+
+    rev_vals = rev_row[years].astype(float).values
+    ebit_vals = ebit_row[years].astype(float).values
+    calendar_years = period_years(is_df, years)
+    oil_arr, fx_arr = macro_series(df_macro, calendar_years)
+    return fit_loglog(years, rev_vals, ebit_vals, oil_arr, fx_arr, use_covid_dummy=use_covid_dummy,
+                      calendar_years=calendar_years)
+
+
+def clear_cache():
+    _CACHE.clear()
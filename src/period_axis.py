@@ -0,0 +1,188 @@
+"""
+period_axis.py — Trục kỳ báo cáo (năm / quý) dùng chung cho toàn bộ Pipeline
+=============================================================================
+DataProcessor phân tích tiêu đề cột MỘT lần khi nạp sheet và gắn kết quả vào
+`df.attrs['period_axis']` (dict thuần → đi theo DataFrame qua pickle/parquet
+sang các stage khác). Các stage chỉ đọc lại trục qua `get_period_axis(df)`:
+  - Nhãn kỳ theo thứ tự thời gian (năm '2011' hoặc quý 'Q1/2020', '2020Q1'...)
+  - Khoá sắp xếp (năm, quý) — quý = 0 cho số liệu năm
+  - Cắt nhanh theo khoảng: `last(5)`, `last(5, skip=5)`, `between(2015, 2020)`
+
+Trục được ghi nhớ theo đối tượng DataFrame (giống line_items), tự lập lại khi
+tập cột thay đổi (thêm/xoá/đổi tên cột đều tạo đối tượng Index mới).
+"""
+
+import bisect
+import re
+import weakref
+
+ITEM_COL = 'Khoản mục'
+PERIOD_ATTR = 'period_axis'
+
+ANNUAL = 'A'
+QUARTERLY = 'Q'
+
+# 'Q1/2020', 'Q1 2020', 'Quý 1/2020', '2020Q1', '2020-Q1', '2020 Q1'
+_QUARTER_FIRST_RE = re.compile(r'^(?:Q|Quý\s*)([1-4])[\s/\-_.]*(\d{4})$', re.IGNORECASE)
+_YEAR_FIRST_RE = re.compile(r'^(\d{4})[\s/\-_.]*(?:Q|Quý\s*)([1-4])$', re.IGNORECASE)
+
+
+def parse_period(label):
+    """(năm, quý) của nhãn cột; quý = 0 với cột năm ('2011', '2011.0'). None nếu không phải kỳ."""
+    text = str(label).strip()
+    m = _QUARTER_FIRST_RE.match(text)
+    if m:
+        return int(m.group(2)), int(m.group(1))
+    m = _YEAR_FIRST_RE.match(text)
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    try:
+        return int(text.split('.')[0]), 0
+    except ValueError:
+        return None
+
+
+def period_label(year, quarter=0):
+    """Nhãn chuẩn của kỳ: '2020' (năm) hoặc 'Q1/2020' (quý)."""
+    return f'Q{quarter}/{year}' if quarter else str(year)
+
+
+class PeriodAxis:
+    """Danh sách kỳ đã sắp theo thời gian của một bảng báo cáo."""
+
+    def __init__(self, labels=(), keys=()):
+        self._labels = tuple(labels)
+        self._keys = tuple(tuple(k) for k in keys)
+        if any(q for _, q in self._keys):
+            self.freq = QUARTERLY if all(q for _, q in self._keys) else 'mixed'
+        else:
+            self.freq = ANNUAL
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Lọc các cột là kỳ báo cáo và sắp theo (năm, quý); thứ tự gốc giữ nguyên khi trùng khoá."""
+        parsed = []
+        for col in columns:
+            if col == ITEM_COL:
+                continue
+            key = parse_period(col)
+            if key is not None:
+                parsed.append((key, col))
+        parsed.sort(key=lambda kc: kc[0])
+        return cls([c for _, c in parsed], [k for k, _ in parsed])
+
+    @classmethod
+    def from_attr(cls, attr):
+        return cls(attr['periods'], attr['keys'])
+
+    def to_attr(self):
+        """Dạng dict thuần để gắn vào df.attrs (ghi được ra parquet)."""
+        return {'freq': self.freq, 'periods': list(self._labels), 'keys': [list(k) for k in self._keys]}
+
+    # =========================================================================
+    # TRUY VẤN
+    # =========================================================================
+    @property
+    def periods(self):
+        """Nhãn cột kỳ theo thứ tự thời gian (list mới, nơi gọi được sửa tuỳ ý)."""
+        return list(self._labels)
+
+    @property
+    def keys(self):
+        return list(self._keys)
+
+    @property
+    def years(self):
+        return [y for y, _ in self._keys]
+
+    @property
+    def is_quarterly(self):
+        return self.freq == QUARTERLY
+
+    @property
+    def periods_per_year(self):
+        return 4 if self.is_quarterly else 1
+
+    @property
+    def latest(self):
+        return self._labels[-1] if self._labels else None
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __iter__(self):
+        return iter(self._labels)
+
+    def __bool__(self):
+        return bool(self._labels)
+
+    def __repr__(self):
+        span = f'{self._labels[0]}..{self._labels[-1]}' if self._labels else 'rỗng'
+        return f'PeriodAxis({self.freq}, {len(self)} kỳ: {span})'
+
+    # =========================================================================
+    # CẮT THEO KHOẢNG
+    # =========================================================================
+    def last(self, n, skip=0):
+        """n kỳ gần nhất, bỏ qua `skip` kỳ cuối (vd: last(5, skip=5) = 5 kỳ liền trước)."""
+        end = max(len(self._labels) - skip, 0)
+        return list(self._labels[max(end - n, 0):end])
+
+    def between(self, start_year=None, end_year=None):
+        """Các kỳ có năm trong [start_year, end_year] (tra nhị phân trên khoá đã sắp)."""
+        lo = 0 if start_year is None else bisect.bisect_left(self._keys, (int(start_year), -1))
+        hi = len(self._keys) if end_year is None else bisect.bisect_right(self._keys, (int(end_year), 5))
+        return list(self._labels[lo:hi])
+
+    def position(self, label):
+        """Vị trí của nhãn kỳ trên trục, hoặc None."""
+        try:
+            return self._labels.index(label)
+        except ValueError:
+            return None
+
+
+# =============================================================================
+# GẮN TRỤC VÀO DATAFRAME
+# =============================================================================
+_AXIS_REGISTRY = {}
+
+
+def _register(df, axis):
+    key = id(df)
+    entry = _AXIS_REGISTRY.get(key)
+    if entry is None or entry[0]() is not df:
+        weakref.finalize(df, _AXIS_REGISTRY.pop, key, None)
+    _AXIS_REGISTRY[key] = (weakref.ref(df), df.columns, axis)
+    return axis
+
+
+def attach_period_axis(df):
+    """Phân tích tiêu đề cột của df, gắn vào df.attrs và ghi nhớ. Gọi một lần khi nạp sheet."""
+    axis = PeriodAxis.from_columns(df.columns)
+    df.attrs[PERIOD_ATTR] = axis.to_attr()
+    return _register(df, axis)
+
+
+def get_period_axis(df):
+    """
+    Trục kỳ của df: lấy từ bộ nhớ đệm, hoặc từ df.attrs do DataProcessor gắn lúc nạp,
+    hoặc (bảng dựng giữa chừng) phân tích tiêu đề cột một lần rồi ghi nhớ.
+    """
+    if df is None:
+        return PeriodAxis()
+    entry = _AXIS_REGISTRY.get(id(df))
+    if entry is not None and entry[0]() is df and entry[1] is df.columns:
+        return entry[2]
+
+    attr = df.attrs.get(PERIOD_ATTR)
+    axis = None
+    if attr:
+        # attrs đi theo các bảng con/phái sinh; chỉ dùng khi khớp đúng tập cột kỳ hiện có
+        candidate = PeriodAxis.from_attr(attr)
+        cols = [c for c in df.columns if c != ITEM_COL]
+        if len(cols) == len(candidate) and set(cols) == set(candidate.periods):
+            axis = candidate
+    if axis is None:
+        axis = PeriodAxis.from_columns(df.columns)
+    return _register(df, axis)
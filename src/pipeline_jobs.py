@@ -0,0 +1,320 @@
+"""
+pipeline_jobs.py — Chạy Pipeline nền cho Dashboard (job id, tiến độ, hoán đổi dữ liệu)
+=====================================================================================
+Dashboard không còn chạy pipeline_runner đồng bộ trong st.spinner:
+  - launch()  : tạo job (id theo thời điểm + ngẫu nhiên) và chạy tiến trình nền
+                `python pipeline_jobs.py --run <job_id>`. Nếu đã có job đang chạy thì trả
+                về job đó (chống chạy trùng giữa các session / nhiều lần bấm nút).
+  - Tiến trình nền gọi run_pipeline(on_event=...) ghi từng sự kiện stage ra
+    output/.jobs/<job_id>/events.jsonl; status(job_id) đọc lại để hiển thị.
+  - Pipeline ghi vào thư mục tạm output/.jobs/<job_id>/staging; chỉ khi chạy xong
+    mới hoán đổi từng thư mục stage vào output/ (và bao_cao/), nên Dashboard luôn
+    đọc một bộ dữ liệu trọn vẹn. Stage nào lỗi (kể cả stage không bắt buộc 2.5 / 4.1 / 5)
+    → job thất bại, không hoán đổi gì: tránh 4_advanced cũ nằm cạnh 2_calculated mới.
+    Stage cache vẫn dùng chung output/.cache.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+import uuid
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SRC_DIR)
+
+JOBS_DIR = os.path.join("output", ".jobs")
+ACTIVE_LOCK = "active.lock"
+# Không có pid để kiểm tra (Windows): job im lặng quá lâu coi như đã chết
+STALE_AFTER = 30 * 60
+
+_PROCS = {}   # job_id → Popen của các job do tiến trình này khởi chạy
+
+
+def _jobs_root(project_root):
+    return os.path.join(project_root, JOBS_DIR)
+
+
+def _job_dir(project_root, job_id):
+    return os.path.join(_jobs_root(project_root), job_id)
+
+
+def _append_event(path, event, **fields):
+    record = {'event': event, 't': time.time(), **fields}
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# =============================================================================
+# PHÍA DASHBOARD
+# =============================================================================
+def read_events(project_root, job_id):
+    path = os.path.join(_job_dir(project_root, job_id), "events.jsonl")
+    if not os.path.exists(path):
+        return []
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    pass   # dòng cuối đang được ghi dở
+    return events
+
+
+def status(project_root, job_id):
+    """
+    Trạng thái job từ luồng sự kiện:
+    {'job_id', 'state' ('starting'|'running'|'succeeded'|'failed'), 'stages': [...],
+     'done', 'total', 'current', 'elapsed', 'error', 'log'}.
+    """
+    events = read_events(project_root, job_id)
+    stages, order = {}, []
+    state, error, current, elapsed = 'starting', None, None, None
+    started = events[0]['t'] if events else None
+    for ev in events:
+        kind = ev['event']
+        if kind == 'plan':
+            state = 'running'
+            for s in ev['stages']:
+                order.append(s['name'])
+                stages[s['name']] = {'name': s['name'], 'title': s['title'], 'state': 'pending',
+                                     'duration': None, 'cached': False, 'error': None}
+        elif kind == 'stage_start' and ev['stage'] in stages:
+            stages[ev['stage']]['state'] = 'running'
+            current = ev['stage']
+        elif kind == 'stage_done' and ev['stage'] in stages:
+            stages[ev['stage']].update(state='failed' if ev.get('error') else 'done',
+                                       duration=ev.get('duration'), cached=ev.get('cached', False),
+                                       error=ev.get('error'))
+        elif kind == 'job_done':
+            state = 'succeeded' if ev.get('ok') else 'failed'
+            error = ev.get('error')
+            elapsed = ev['t'] - started if started else None
+
+    if state in ('starting', 'running') and not _is_alive(project_root, job_id, events):
+        state, error = 'failed', error or "Tiến trình pipeline đã dừng bất thường"
+    done = sum(1 for s in stages.values() if s['state'] in ('done', 'failed'))
+    return {
+        'job_id': job_id,
+        'state': state,
+        'stages': [stages[n] for n in order],
+        'done': done,
+        'total': len(order),
+        'current': current,
+        'elapsed': elapsed if elapsed is not None else (time.time() - started if started else 0.0),
+        'error': error,
+        'log': os.path.join(_job_dir(project_root, job_id), "log.txt"),
+    }
+
+
+def _read_job(project_root, job_id):
+    try:
+        with open(os.path.join(_job_dir(project_root, job_id), "job.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_alive(project_root, job_id, events=None):
+    proc = _PROCS.get(job_id)
+    if proc is not None:
+        # poll() đồng thời thu dọn tiến trình con đã thoát (tránh zombie vẫn "còn sống" với os.kill)
+        return proc.poll() is None
+    job = _read_job(project_root, job_id)
+    if job is None:
+        return False
+    alive = _pid_alive(job['pid']) if job.get('pid') else None
+    if alive is not None:
+        return alive
+    events = events if events is not None else read_events(project_root, job_id)
+    last = events[-1]['t'] if events else job.get('created', 0)
+    return time.time() - last < STALE_AFTER
+
+
+def active_job(project_root=PROJECT_ROOT):
+    """Job đang chạy (job_id) hoặc None; tự dọn khoá của job đã chết."""
+    lock = os.path.join(_jobs_root(project_root), ACTIVE_LOCK)
+    try:
+        with open(lock, 'r', encoding='utf-8') as f:
+            job_id = f.read().strip()
+    except OSError:
+        return None
+    if job_id:
+        if _read_job(project_root, job_id) is None:
+            # Khoá vừa được tạo, launcher chưa kịp ghi job.json (hoặc launcher đã chết giữa chừng)
+            try:
+                fresh = time.time() - os.path.getmtime(lock) < 60
+            except OSError:
+                fresh = False
+            if fresh:
+                return job_id
+        elif status(project_root, job_id)['state'] in ('starting', 'running'):
+            return job_id
+    try:
+        os.remove(lock)
+    except OSError:
+        pass
+    return None
+
+
+def launch(project_root=PROJECT_ROOT, args=()):
+    """
+    Khởi chạy pipeline nền và trả về (job_id, created). created=False nghĩa là đã có
+    job đang chạy — trả về chính job đó thay vì chạy trùng.
+    """
+    root = _jobs_root(project_root)
+    os.makedirs(root, exist_ok=True)
+    lock = os.path.join(root, ACTIVE_LOCK)
+
+    for _ in range(2):
+        job_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        try:
+            # O_EXCL: chỉ một launcher giành được khoá kể cả khi nhiều session bấm cùng lúc
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            existing = active_job(project_root)
+            if existing is not None:
+                return existing, False
+            continue   # khoá cũ đã được dọn → thử lại
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(job_id)
+        break
+    else:
+        raise RuntimeError("Không giành được khoá chạy pipeline")
+
+    job_dir = _job_dir(project_root, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    log = open(os.path.join(job_dir, "log.txt"), 'w', encoding='utf-8')
+    popen_kwargs = {}
+    if os.name == 'nt':
+        popen_kwargs['creationflags'] = getattr(subprocess, 'CREATE_NEW_PROCESS_GROUP', 0)
+    else:
+        popen_kwargs['start_new_session'] = True
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(SRC_DIR, "pipeline_jobs.py"), "--run", job_id, *args],
+            cwd=project_root, stdout=log, stderr=subprocess.STDOUT,
+            env={**os.environ, 'PYTHONIOENCODING': 'utf-8'}, **popen_kwargs,
+        )
+    except Exception:
+        os.remove(lock)
+        raise
+    finally:
+        log.close()
+    _PROCS[job_id] = proc
+    with open(os.path.join(job_dir, "job.json"), 'w', encoding='utf-8') as f:
+        json.dump({'job_id': job_id, 'pid': proc.pid, 'created': time.time(), 'args': list(args)}, f)
+    prune(project_root)
+    return job_id, True
+
+
+def latest_job(project_root=PROJECT_ROOT):
+    """job_id mới nhất (tên thư mục sắp theo thời điểm tạo) hoặc None."""
+    root = _jobs_root(project_root)
+    if not os.path.isdir(root):
+        return None
+    jobs = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    return jobs[-1] if jobs else None
+
+
+def prune(project_root=PROJECT_ROOT, keep=5):
+    """Xoá thư mục của các job cũ đã kết thúc, giữ lại `keep` job gần nhất."""
+    root = _jobs_root(project_root)
+    if not os.path.isdir(root):
+        return
+    active = active_job(project_root)
+    jobs = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    for job_id in jobs[:-keep] if keep else jobs:
+        if job_id != active:
+            shutil.rmtree(os.path.join(root, job_id), ignore_errors=True)
+
+
+# =============================================================================
+# PHÍA TIẾN TRÌNH NỀN
+# =============================================================================
+def _swap_into(staging, target):
+    """Thay từng thư mục con của target bằng bản trong staging (os.replace từng thư mục)."""
+    os.makedirs(target, exist_ok=True)
+    for name in sorted(os.listdir(staging)):
+        src = os.path.join(staging, name)
+        dst = os.path.join(target, name)
+        if not os.path.isdir(src):
+            os.replace(src, dst)
+            continue
+        old = f"{dst}.old-{os.getpid()}"
+        if os.path.exists(dst):
+            os.replace(dst, old)
+        os.replace(src, dst)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def run_job(job_id, argv=(), project_root=PROJECT_ROOT):
+    """Thân của tiến trình nền: chạy pipeline vào staging, hoán đổi khi xong, ghi sự kiện."""
+    sys.path.insert(0, SRC_DIR)
+    from pipeline_runner import PipelineContext, run_pipeline
+
+    job_dir = _job_dir(project_root, job_id)
+    events_path = os.path.join(job_dir, "events.jsonl")
+    staging_out = os.path.join(job_dir, "staging", "output")
+    staging_report = os.path.join(job_dir, "staging", "bao_cao")
+    out_root = os.path.join(project_root, "output")
+
+    _append_event(events_path, 'job_start', job_id=job_id, pid=os.getpid())
+    ok, error = False, None
+    try:
+        ctx = PipelineContext(out_root=staging_out, report_dir=staging_report)
+        run_pipeline(context=ctx, parallel="--parallel" in argv, use_cache="--no-cache" not in argv,
+                     cache_root=os.path.join(out_root, ".cache"),
+                     on_event=lambda event, **f: _append_event(events_path, event, **f))
+        failed = [f"Stage {name}: {st['error']}" for name, st in ctx.schedule.items() if st['error'] is not None]
+        if failed:
+            # Stage lỗi không có thư mục trong staging → hoán đổi sẽ trộn artifact cũ và mới
+            raise RuntimeError("; ".join(failed) + " — giữ nguyên dữ liệu hiện có")
+        if "--csv" in argv:
+            ctx.export_csv()
+        # Hoán đổi dữ liệu chỉ sau khi toàn bộ pipeline xong
+        _swap_into(staging_out, out_root)
+        if os.path.isdir(staging_report):
+            _swap_into(staging_report, os.path.join(project_root, "bao_cao"))
+        ok = True
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+    finally:
+        shutil.rmtree(os.path.join(job_dir, "staging"), ignore_errors=True)
+        _append_event(events_path, 'job_done', ok=ok, error=error)
+        lock = os.path.join(_jobs_root(project_root), ACTIVE_LOCK)
+        try:
+            with open(lock, 'r', encoding='utf-8') as f:
+                owned = f.read().strip() == job_id
+            if owned:
+                os.remove(lock)
+        except OSError:
+            pass
+    return ok
+
+
+if __name__ == "__main__":
+    if "--run" in sys.argv:
+        job = sys.argv[sys.argv.index("--run") + 1]
+        sys.exit(0 if run_job(job, sys.argv) else 1)
+    job, created = launch()
+    print(f"{'Đã khởi chạy' if created else 'Đang có'} job {job}")
@@ -1,3 +1,4 @@
+import importlib
 import time
 import sys
 import os
@@ -9,95 +10,385 @@ os.chdir(PROJECT_ROOT)
 # Thêm thư mục src vào sys.path để đảm bảo các module local được import đúng
 sys.path.append(os.path.join(PROJECT_ROOT, "src"))
 
-def run_pipeline():
-    print("=" * 40)
-    print(" BẮT ĐẦU CHẠY PIPELINE TỪ DỮ LIỆU THÔ ")
-    print("=" * 40)
-    
-    start_total = time.time()
-    
-    # STAGE 1
-    print("\n[Stage 1] Processor - Đọc file hvn.xlsx")
-    start = time.time()
+from artifact_store import ArtifactStore
+import instrumentation
+from stage_graph import Stage, StageGraph
+from stage_cache import StageCache
+
+
+def _frames_only(dfs):
+    """Bản sao nông chỉ gồm DataFrame — đúng những gì stage sau nhận được khi đọc lại từ in_dir."""
+    return {k: v for k, v in dfs.items() if hasattr(v, 'to_csv')}
+
+
+class PipelineContext:
+    """
+    Trạng thái sống truyền từ stage này sang stage khác trong cùng một tiến trình.
+    Các stage đọc trực tiếp `dfs` của stage trước thay vì đọc lại output/ từ đĩa;
+    việc ghi ra đĩa chỉ còn là sink tuỳ chọn (persist_stage / persist).
+    """
+
+    def __init__(self, excel_path="data/hvn.xlsx", macro_path="data/oil&exchange_rate.xlsx",
+                 out_root="output", report_dir="bao_cao", discount=0.4, alpha=0.05, fmt=None,
+                 ticker='HVN', diag_workers=1):
+        # excel_path: workbook gộp (bs/cf/is/fi) hoặc dict sheet → file export SSI gốc
+        self.excel_path = excel_path
+        self.ticker = ticker
+        self.macro_path = macro_path
+        self.out_root = out_root
+        self.report_dir = report_dir
+        self.discount = discount
+        self.alpha = alpha
+        self.fmt = fmt
+        # Stage 2.5: số process cho các nhóm kiểm định (1 = tuần tự, None = tự chọn).
+        # Mặc định tuần tự: với dữ liệu năm cỡ HVN chi phí khởi tạo pool lớn hơn thời gian kiểm định.
+        self.diag_workers = diag_workers
+
+        self.processed = {}        # Stage 1: BS/IS/CF/FI
+        self.macro = None          # Stage 1.1: MACRO_DATA (Oil & FX)
+        self.calculated = {}       # Stage 2: dfs của Calculator (+ DIAG_* sau Stage 2.5)
+        self.diagnostics = {}      # Stage 2.5: DiagnosticsEngine.results
+        self.diag_timings = {}     # Stage 2.5: thời gian từng nhóm kiểm định (không ghi ra đĩa)
+        self.business_model = {}   # Stage 3: BUSINESS_MODEL
+        self.forecast = {}         # Stage 4.1: Forecaster.run_all()
+        self.report = None         # Stage 5: nội dung Markdown
+        self.timings = {}          # Stage → giây; nhóm kiểm định của 2.5 có khoá '2.5/<test>'
+        self.schedule = {}         # Stage → start/end/duration (giây, từ lúc bắt đầu)
+        self.critical_path = []
+        self.trace_path = None     # file Chrome Trace nếu bật PHANTICH_TRACE
+
+    def stage_dir(self, name):
+        return os.path.join(self.out_root, name)
+
+    def persist_stage(self, stage):
+        """Ghi artifact của một stage ra output/ (cùng bố cục thư mục như trước)."""
+        if stage == '1':
+            store = ArtifactStore(self.stage_dir("1_processed"), fmt=self.fmt)
+            store.save_all(self.processed)
+        elif stage == '1.1' and self.macro is not None:
+            ArtifactStore(self.stage_dir("1_processed"), fmt=self.fmt).save_frame("MACRO_DATA", self.macro)
+        elif stage == '2':
+            store = ArtifactStore(self.stage_dir("2_calculated"), fmt=self.fmt)
+            store.save_all({k: v for k, v in self.calculated.items() if not k.startswith('DIAG_')})
+        elif stage == '2.5':
+            diag_store = ArtifactStore(self.stage_dir("2.5_diagnostics"))
+            for key, data in self.diagnostics.items():
+                diag_store.save_json(key, data, default=str)
+            diag_store.save_json("ALL_DIAGNOSTICS", self.diagnostics, default=str)
+            # Dashboard đọc DIAG_* từ 2_calculated
+            calc_store = ArtifactStore(self.stage_dir("2_calculated"))
+            for key, data in self.diagnostics.items():
+                calc_store.save_json(f"DIAG_{key}", data, default=str)
+        elif stage == '3' and self.business_model:
+            from business_classifier import BusinessClassifier
+            BusinessClassifier({'BUSINESS_MODEL': self.business_model}).save_outputs(self.stage_dir("3_classification"))
+        elif stage == '4.1':
+            from forecaster import Forecaster
+            Forecaster({}).save_outputs(self.forecast, self.stage_dir("4_advanced"), fmt=self.fmt)
+        elif stage == '5':
+            os.makedirs(self.report_dir, exist_ok=True)
+            filepath = self.report_path()
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(self.report)
+            print(f"Report generated: {filepath}")
+
+    def report_path(self):
+        return os.path.join(self.report_dir, "BaoCao_PhanTich_HVN.md")
+
+    def has_artifacts(self, stage):
+        """
+        Artifact của stage đã có trong out_root hiện tại chưa. Cờ 'persisted' của StageCache
+        không đủ: người dùng có thể xoá output/ trong khi output/.cache vẫn còn.
+        """
+        if stage == '1':
+            checks = [(self.stage_dir("1_processed"), list(self.processed))]
+        elif stage == '1.1':
+            checks = [(self.stage_dir("1_processed"), ['MACRO_DATA'] if self.macro is not None else [])]
+        elif stage == '2':
+            names = [k for k, v in self.calculated.items()
+                     if not k.startswith('DIAG_') and (hasattr(v, 'to_csv') or isinstance(v, dict))]
+            checks = [(self.stage_dir("2_calculated"), names)]
+        elif stage == '2.5':
+            checks = [(self.stage_dir("2.5_diagnostics"), ['ALL_DIAGNOSTICS'] if self.diagnostics else []),
+                      (self.stage_dir("2_calculated"), [f"DIAG_{k}" for k in self.diagnostics])]
+        elif stage == '3':
+            checks = [(self.stage_dir("3_classification"), ['business_model'] if self.business_model else [])]
+        elif stage == '4.1':
+            out_dir = self.stage_dir("4_advanced")
+            return not self.forecast or (os.path.isdir(out_dir) and bool(os.listdir(out_dir)))
+        elif stage == '5':
+            return self.report is None or os.path.exists(self.report_path())
+        else:
+            return True
+        return all(ArtifactStore(root).exists(name) for root, names in checks for name in names)
+
+    def export_csv(self, out_dir=None):
+        """
+        Xuất bản CSV của mọi bảng đã ghi (1_processed, 2_calculated, 4_advanced) ra <out_root>/csv/,
+        tách khỏi thư mục artifact để CSV cũ không lẫn với Parquet/Feather của lần chạy sau.
+        """
+        out_dir = out_dir or os.path.join(self.out_root, "csv")
+        for name in ("1_processed", "2_calculated", "4_advanced"):
+            store = ArtifactStore(self.stage_dir(name))
+            if store.names(include_json=False):
+                store.export_csv_all(os.path.join(out_dir, name))
+        print(f"Đã xuất CSV: {out_dir}")
+        return out_dir
+
+    def persist(self):
+        """Sink cuối: ghi toàn bộ những stage đã có kết quả."""
+        completed = [
+            ('1', self.processed), ('1.1', self.macro), ('2', self.calculated), ('2.5', self.diagnostics),
+            ('3', self.business_model), ('4.1', self.forecast), ('5', self.report),
+        ]
+        for stage, data in completed:
+            if data is not None and len(data):
+                self.persist_stage(stage)
+
+
+# =====================================================================
+# STAGE FUNCTIONS (cấp module để chạy được trong process con)
+# =====================================================================
+def stage_process(excel_path, ticker):
     from data_processor import DataProcessor
-    processor = DataProcessor("data/hvn.xlsx")
+    processor = DataProcessor(excel_path, ticker=ticker)
     processor.load_and_normalize()
-    # Nạp dữ liệu Giá dầu & Tỷ giá từ file Excel bổ sung
+    return {'processed': processor.dataframes}
+
+
+def stage_load_macro(macro_path):
+    # Nạp dữ liệu Giá dầu & Tỷ giá từ file Excel bổ sung (stage riêng để sửa file macro
+    # không làm Stage 1 phải đọc lại hvn.xlsx)
+    from data_processor import DataProcessor
+    processor = DataProcessor(None)
     try:
-        processor.load_macro_data("data/oil&exchange_rate.xlsx")
+        processor.load_macro_data(macro_path)
         print("  → Đã nạp dữ liệu Macro (Oil & FX) thành công.")
     except Exception as e:
         print(f"  → Cảnh báo: Không thể nạp dữ liệu Macro: {e}")
-    processor.save_outputs("output/1_processed")
-    print(f"Hoàn thành Stage 1 ({time.time()-start:.2f}s)")
+    return {'macro': processor.dataframes.get('MACRO_DATA')}
+
 
-    # STAGE 2
-    print("\n[Stage 2] Calculator - Chạy công thức rà soát & tính toán")
-    start = time.time()
+def stage_calculate(processed, macro):
     from calculator import Calculator
-    calc = Calculator(in_dir="output/1_processed")
-    # Inject MACRO_DATA vào Calculator nếu có
-    if 'MACRO_DATA' in processor.dataframes:
-        calc.dfs['MACRO_DATA'] = processor.dataframes['MACRO_DATA']
+    # Calculator sửa dfs tại chỗ → làm việc trên bản sao để ctx.processed giữ nguyên dữ liệu Stage 1
+    dfs = {k: v.copy() for k, v in processed.items()}
+    if macro is not None:
+        dfs['MACRO_DATA'] = macro.copy()
+    calc = Calculator(dfs)
     calc.run_all()
-    calc.save_outputs("output/2_calculated")
-    print(f"Hoàn thành Stage 2 ({time.time()-start:.2f}s)")
-    
-    # STAGE 2.5
-    print("\n[Stage 2.5] Diagnostics - Kiểm định Thống kê Toàn diện")
-    start = time.time()
-    try:
-        from diagnostics import DiagnosticsEngine
-        diag = DiagnosticsEngine(calc.dfs)
-        diag.run_all()
-        diag.save_outputs("output/2.5_diagnostics")
-        # Inject kết quả kiểm định vào dfs để Dashboard có thể đọc
-        for key, val in diag.results.items():
-            calc.dfs[f'DIAG_{key}'] = val
-        # Lưu lại calculated outputs có thêm diagnostics
-        calc.save_outputs("output/2_calculated")
-        print(f"Hoàn thành Stage 2.5 ({time.time()-start:.2f}s)")
-    except Exception as e:
-        print(f"Lỗi Stage 2.5: {e}")
+    return {'calculated': calc.dfs}
+
 
-    # STAGE 3
-    print("\n[Stage 3] Classifier - Phân loại Mô hình Doanh nghiệp")
-    start = time.time()
+def stage_diagnose(calculated, alpha, diag_workers):
+    from diagnostics import DiagnosticsEngine
+    diag = DiagnosticsEngine(calculated, alpha=alpha)
+    diag.run_all(parallel=diag_workers != 1, max_workers=diag_workers)
+    # Thời gian từng nhóm kiểm định: output riêng, không ghi vào artifact 2.5_diagnostics
+    return {'diagnostics': diag.results, 'diag_timings': diag.timings}
+
+
+def stage_classify(calculated):
     from business_classifier import BusinessClassifier
-    classifier = BusinessClassifier(in_dir="output/2_calculated")
+    classifier = BusinessClassifier(_frames_only(calculated))
     classifier.run_all()
-    classifier.save_outputs("output/3_classification")
-    print(f"Hoàn thành Stage 3 ({time.time()-start:.2f}s)")
-    
-    # STAGE 4.1
-    print("\n[Stage 4.1] Forecaster - Dự báo & Bóc tách")
-    start = time.time()
-    try:
-        from forecaster import Forecaster
-        forecaster = Forecaster(in_dir="output/2_calculated")
-        # Áp dụng Chiết khấu rủi ro tái cấu trúc 40% mặc định theo đề xuất của người dùng
-        fore_results = forecaster.run_all(discount=0.4)
-        forecaster.save_outputs(fore_results, "output/4_advanced")
-        print(f"Hoàn thành Stage 4.1 ({time.time()-start:.2f}s)")
-    except Exception as e:
-        print(f"Lỗi Stage 4.1: {e}")
-        
-    # STAGE 5
-    print("\n[Stage 5] Report Generator - Sinh Báo cáo Tự động (.md)")
-    start = time.time()
-    try:
-        from report_generator import ReportGenerator
-        reporter = ReportGenerator(calc_dir="output/2_calculated", class_dir="output/3_classification", out_dir="bao_cao")
-        reporter.run_all()
-        print(f"Hoàn thành Stage 5 ({time.time()-start:.2f}s)")
-    except Exception as e:
-        print(f"Lỗi Stage 5: {e}")
-        
+    return {'business_model': classifier.dfs.get('BUSINESS_MODEL', {})}
+
+
+def stage_forecast(calculated, discount):
+    from forecaster import Forecaster
+    forecaster = Forecaster(_frames_only(calculated))
+    return {'forecast': forecaster.run_all(discount=discount)}
+
+
+def stage_report(calculated, business_model, forecast, diagnostics, report_dir):
+    # diagnostics: chỉ để Stage 5 chờ Stage 2.5 (DIAG_* đã được gộp vào calculated khi 2.5 xong)
+    from report_generator import ReportGenerator
+    reporter = ReportGenerator(out_dir=report_dir)
+    reporter.load_data_from(calculated, business_model, forecast)
+    return {'report': reporter.generate_report()}
+
+
+PIPELINE_STAGES = [
+    Stage('1', "Processor - Đọc dữ liệu thô", stage_process,
+          inputs=('excel_path', 'ticker'), outputs=('processed',)),
+    Stage('1.1', "Processor - Nạp dữ liệu Macro (Oil & FX)", stage_load_macro,
+          inputs=('macro_path',), outputs=('macro',)),
+    Stage('2', "Calculator - Chạy công thức rà soát & tính toán", stage_calculate,
+          inputs=('processed', 'macro'), outputs=('calculated',)),
+    Stage('2.5', "Diagnostics - Kiểm định Thống kê Toàn diện", stage_diagnose,
+          inputs=('calculated', 'alpha', 'diag_workers'), outputs=('diagnostics', 'diag_timings'), required=False,
+          untracked=('diag_workers',)),
+    Stage('3', "Classifier - Phân loại Mô hình Doanh nghiệp", stage_classify,
+          inputs=('calculated',), outputs=('business_model',)),
+    # Áp dụng Chiết khấu rủi ro tái cấu trúc 40% mặc định theo đề xuất của người dùng
+    Stage('4.1', "Forecaster - Dự báo & Bóc tách", stage_forecast,
+          inputs=('calculated', 'discount'), outputs=('forecast',), required=False),
+    Stage('5', "Report Generator - Sinh Báo cáo Tự động (.md)", stage_report,
+          inputs=('calculated', 'business_model', 'forecast', 'diagnostics', 'report_dir'), outputs=('report',),
+          required=False),
+]
+
+# Module của các stage: nạp trước ở process chính khi chạy song song để process con (fork)
+# không phải import lại statsmodels / sklearn, và khi bật trace để thời gian import không
+# bị tính vào span của stage
+STAGE_MODULES = ('data_processor', 'calculator', 'diagnostics', 'business_classifier',
+                 'forecaster', 'report_generator')
+
+
+def _preload_stage_modules():
+    for name in STAGE_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"  → Cảnh báo: Không nạp trước được module {name}: {e}")
+
+
+def run_pipeline(persist=True, context=None, parallel=False, max_workers=None, use_cache=True,
+                 stages=None, cache_root=None, on_event=None):
+    """
+    Chạy toàn bộ pipeline trong bộ nhớ và trả về PipelineContext.
+    persist=True: ghi output/ + bao_cao/ ngay sau mỗi stage (hành vi mặc định của runner).
+    persist=False: không chạm đĩa; gọi context.persist() sau nếu cần.
+    parallel=True: các stage độc lập (2.5 / 3 / 4.1) chạy đồng thời trên process pool. Mặc định
+        tuần tự: với dữ liệu cỡ HVN chi phí khởi tạo pool lớn hơn phần thời gian song song tiết kiệm được.
+    use_cache=True: stage có fingerprint đầu vào (hash file Excel, discount, alpha, ...)
+        khớp với lần chạy trước được nạp lại từ output/.cache thay vì chạy lại.
+    stages: chỉ chạy các stage này (cùng các stage phía trên), vd: ['2.5', '3', '4.1'].
+    cache_root: thư mục StageCache (mặc định <out_root>/.cache). Khi khác thư mục đó (vd: job nền
+        ghi vào thư mục tạm rồi mới hoán đổi), stage cache hit luôn được ghi lại vào out_root.
+    on_event(event, **fields): nhận tiến độ từng stage ('plan', 'stage_start', 'stage_done', 'done')
+        để hiển thị trực tiếp (vd: Dashboard qua pipeline_jobs).
+    Đặt PHANTICH_TRACE (hoặc --trace) để ghi span từng stage/phương thức ra Chrome Trace JSON
+    (thêm PHANTICH_TRACE_MEMORY=1 / --trace-memory để đo bộ nhớ bằng tracemalloc);
+    PHANTICH_PROFILE=cprofile|pyinstrument để lấy hồ sơ chi tiết từng stage (xem instrumentation.py).
+    """
+    ctx = context or PipelineContext()
+    graph = StageGraph(PIPELINE_STAGES)
+    if stages:
+        graph = graph.subgraph(stages)
+    own_cache_root = os.path.join(ctx.out_root, ".cache")
+    cache_root = cache_root or own_cache_root
+    # Cache dùng chung với thư mục output khác: cờ 'persisted' không nói gì về out_root hiện tại
+    shared_cache = os.path.abspath(cache_root) != os.path.abspath(own_cache_root)
+    cache = StageCache(cache_root) if use_cache else None
+
+    def emit(event, **fields):
+        if on_event is not None:
+            on_event(event, **fields)
+
+    print("=" * 40)
+    print(f" BẮT ĐẦU CHẠY PIPELINE TỪ DỮ LIỆU THÔ ({ctx.ticker})")
+    print("=" * 40)
+
+    start_total = time.time()
+    emit('plan', stages=[{'name': n, 'title': graph.stages[n].title} for n in graph.order])
+
+    def on_start(stage):
+        print(f"\n[Stage {stage.name}] {stage.title}")
+        emit('stage_start', stage=stage.name, title=stage.title)
+
+    def on_done(stage, outputs, info):
+        if info['error'] is not None:
+            print(f"Lỗi Stage {stage.name}: {info['error']}")
+            emit('stage_done', stage=stage.name, duration=info['duration'], cached=False,
+                 error=str(info['error']))
+            return
+        for key, val in outputs.items():
+            setattr(ctx, key, val)
+        if stage.name == '2.5':
+            # Inject kết quả kiểm định vào dfs để Dashboard có thể đọc. Tạo dict MỚI: dict cũ đã được
+            # giao cho executor (Stage 3 / 4.1) và có thể đang được pickle ở luồng nền của pool.
+            ctx.calculated = {**ctx.calculated, **{f'DIAG_{k}': v for k, v in ctx.diagnostics.items()}}
+            values['calculated'] = ctx.calculated
+        fp = info['fingerprint']
+        if info['cached']:
+            print(f"  → Cache hit Stage {stage.name} (fingerprint {fp[:12]}) — bỏ qua, dùng kết quả lần chạy trước.")
+            # Artifact ở output/ có thể chưa được ghi (lần trước chạy persist=False) hoặc đã bị xoá
+            if persist and (shared_cache or not cache.meta(stage.name).get('persisted')
+                            or not ctx.has_artifacts(stage.name)):
+                ctx.persist_stage(stage.name)
+                cache.mark(stage.name, fp, persisted=not shared_cache)
+        elif persist:
+            ctx.persist_stage(stage.name)
+            if fp is not None:
+                cache.mark(stage.name, fp, persisted=not shared_cache)
+        ctx.timings[stage.name] = info['duration']
+        if stage.name == '2.5' and not info['cached']:
+            ctx.timings.update({f"2.5/{test}": sec for test, sec in ctx.diag_timings.items()})
+        print(f"Hoàn thành Stage {stage.name} ({info['duration']:.2f}s)")
+        emit('stage_done', stage=stage.name, duration=info['duration'], cached=info['cached'], error=None)
+
+    values = {
+        'excel_path': ctx.excel_path, 'macro_path': ctx.macro_path, 'ticker': ctx.ticker,
+        'discount': ctx.discount, 'alpha': ctx.alpha, 'report_dir': ctx.report_dir,
+        'diag_workers': ctx.diag_workers,
+        # Giá trị mặc định nếu stage không bắt buộc bị lỗi
+        'diagnostics': {}, 'diag_timings': {}, 'business_model': {}, 'forecast': {}, 'report': None,
+    }
+    if parallel or instrumentation.enabled():
+        _preload_stage_modules()
+    with instrumentation.span('run_pipeline', cat='pipeline', ticker=ctx.ticker, parallel=parallel):
+        ctx.schedule = graph.run(values, max_workers=max_workers, parallel=parallel,
+                                 on_start=on_start, on_done=on_done, cache=cache)
+    elapsed = time.time() - start_total
+
+    print("\n" + "-" * 40)
+    print(" THỜI GIAN TỪNG STAGE (wall time)")
+    for name in graph.order:
+        st = ctx.schedule.get(name)
+        if st is None:
+            continue
+        if st['error'] is not None:
+            status = "LỖI"
+        elif st['cached']:
+            status = "cache hit"
+        else:
+            status = f"{st['duration']:.2f}s"
+        print(f"  Stage {name:<4} {st['start']:7.2f}s → {st['end']:7.2f}s  {status}")
+        for key, sec in ctx.timings.items():
+            if key.startswith(f"{name}/"):
+                print(f"      {key.split('/', 1)[1]:<24} {sec:.2f}s")
+    path, length = graph.critical_path(ctx.timings)
+    ctx.critical_path = path
+    print(f" Đường găng: {' → '.join(path)} ({length:.2f}s)")
+    emit('done', elapsed=elapsed, critical_path=path)
+
+    if instrumentation.enabled():
+        ctx.trace_path = instrumentation.write_trace(metadata={
+            'ticker': ctx.ticker, 'elapsed': elapsed, 'critical_path': path, 'schedule': ctx.schedule,
+        })
+        print("\n SPAN TỐN THỜI GIAN NHẤT (instrumentation)")
+        instrumentation.print_summary()
+        print(f" Trace: {ctx.trace_path} (mở bằng chrome://tracing hoặc ui.perfetto.dev)")
+        instrumentation.clear()
+
     print("\n" + "=" * 40)
-    print(f" PIPELINE HOÀN TẤT THÀNH CÔNG ({time.time()-start_total:.2f}s)")
-    print(" Dữ liệu đã sẵn sàng cho Streamlit tại thư mục output/")
-    print(" Báo cáo phân tích đã được tạo tại thư mục bao_cao/")
+    print(f" PIPELINE HOÀN TẤT THÀNH CÔNG ({elapsed:.2f}s)")
+    if persist:
+        print(" Dữ liệu đã sẵn sàng cho Streamlit tại thư mục output/")
+        print(" Báo cáo phân tích đã được tạo tại thư mục bao_cao/")
+    else:
+        print(" Chế độ in-memory: chưa ghi đĩa (gọi context.persist() nếu cần)")
     print("=" * 40)
+    return ctx
 
 if __name__ == "__main__":
-    run_pipeline()
+    # --diag-workers N: chạy song song các nhóm kiểm định Stage 2.5 (0 = tự chọn số process)
+    diag_workers = 1
+    # --trace [path]: ghi Chrome Trace (tương đương PHANTICH_TRACE); --trace-memory: thêm tracemalloc
+    if "--trace" in sys.argv:
+        pos = sys.argv.index("--trace") + 1
+        has_path = pos < len(sys.argv) and not sys.argv[pos].startswith("--")
+        instrumentation.enable(sys.argv[pos] if has_path else None,
+                               memory=True if "--trace-memory" in sys.argv else None)
+    if "--diag-workers" in sys.argv:
+        diag_workers = int(sys.argv[sys.argv.index("--diag-workers") + 1]) or None
+    # --parallel: chạy song song các stage độc lập (mặc định tuần tự)
+    # --csv: xuất thêm bản CSV của các bảng ra output/csv/ sau khi chạy xong
+    persist = "--no-persist" not in sys.argv
+    ctx = run_pipeline(persist=persist, parallel="--parallel" in sys.argv,
+                       use_cache="--no-cache" not in sys.argv,
+                       context=PipelineContext(diag_workers=diag_workers))
+    if "--csv" in sys.argv and persist:
+        ctx.export_csv()
@@ -1,8 +1,10 @@
 import os
-import json
-import pandas as pd
 from datetime import datetime
 
+from artifact_store import ArtifactStore
+from instrumentation import traced_class
+
+@traced_class('report')
 class ReportGenerator:
     def __init__(self, calc_dir="output/2_calculated", class_dir="output/3_classification",
                  adv_dir="output/4_advanced", out_dir="bao_cao"):
@@ -11,30 +13,47 @@ class ReportGenerator:
         self.adv_dir = adv_dir
         self.out_dir = out_dir
         self.data = {}
-        os.makedirs(self.out_dir, exist_ok=True)
 
-    def _read_json(self, filepath):
-        if os.path.exists(filepath):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+    def _read_json(self, store, name):
+        return store.load_json(name) or {}
 
-    def _read_csv(self, filepath):
-        if os.path.exists(filepath):
-            return pd.read_csv(filepath, index_col=0)
-        return None
+    def _read_frame(self, store, name):
+        # Dùng 'Khoản mục' làm index để _get_metric tra theo tên dòng
+        return store.load_frame(name, index_col=0)
 
     def load_data(self):
-        self.data['BUSINESS_MODEL'] = self._read_json(os.path.join(self.class_dir, "business_model.json"))
-        self.data['ANOMALY_NUMERIC'] = self._read_json(os.path.join(self.calc_dir, "ANOMALY_NUMERIC.json"))
-        self.data['DATA_WARNINGS'] = self._read_json(os.path.join(self.calc_dir, "data_warnings.json"))
-        self.data['FINANCIAL_INDEX'] = self._read_csv(os.path.join(self.calc_dir, "FINANCIAL INDEX.csv"))
-        self.data['CASH_FLOW'] = self._read_csv(os.path.join(self.calc_dir, "CASH FLOW STATEMENT.csv"))
-        self.data['INCOME_STMT'] = self._read_csv(os.path.join(self.calc_dir, "INCOME STATEMENT.csv"))
-        self.data['BALANCE_SHEET'] = self._read_csv(os.path.join(self.calc_dir, "BALANCE SHEET.csv"))
-        self.data['LIQUIDITY'] = self._read_csv(os.path.join(self.calc_dir, "LIQUIDITY_CASHFLOW.csv"))
-        self.data['FOOTBALL_FIELD'] = self._read_json(os.path.join(self.adv_dir, "football_field.json"))
-        self.data['VALUATION_META'] = self._read_json(os.path.join(self.adv_dir, "valuation_meta.json"))
+        calc = ArtifactStore(self.calc_dir)
+        cls = ArtifactStore(self.class_dir)
+        adv = ArtifactStore(self.adv_dir)
+        self.data['BUSINESS_MODEL'] = self._read_json(cls, "business_model")
+        self.data['ANOMALY_NUMERIC'] = self._read_json(calc, "ANOMALY_NUMERIC")
+        self.data['DATA_WARNINGS'] = self._read_json(calc, "data_warnings")
+        self.data['FINANCIAL_INDEX'] = self._read_frame(calc, "FINANCIAL INDEX")
+        self.data['CASH_FLOW'] = self._read_frame(calc, "CASH FLOW STATEMENT")
+        self.data['INCOME_STMT'] = self._read_frame(calc, "INCOME STATEMENT")
+        self.data['BALANCE_SHEET'] = self._read_frame(calc, "BALANCE SHEET")
+        self.data['LIQUIDITY'] = self._read_frame(calc, "LIQUIDITY_CASHFLOW")
+        self.data['FOOTBALL_FIELD'] = self._read_json(adv, "football_field")
+        self.data['VALUATION_META'] = self._read_json(adv, "valuation_meta")
+        return self.data
+
+    def load_data_from(self, calc_dfs, business_model, forecast_results):
+        """Nạp cùng bộ dữ liệu như load_data() nhưng từ kết quả in-memory của các stage trước."""
+        def _frame(name):
+            df = calc_dfs.get(name)
+            return df.set_index('Khoản mục') if df is not None else None
+
+        vb = forecast_results.get('VALUATION_BANDS')
+        self.data['BUSINESS_MODEL'] = business_model or {}
+        self.data['ANOMALY_NUMERIC'] = calc_dfs.get('ANOMALY_NUMERIC') or {}
+        self.data['DATA_WARNINGS'] = calc_dfs.get('data_warnings') or {}
+        self.data['FINANCIAL_INDEX'] = _frame('FINANCIAL INDEX')
+        self.data['CASH_FLOW'] = _frame('CASH FLOW STATEMENT')
+        self.data['INCOME_STMT'] = _frame('INCOME STATEMENT')
+        self.data['BALANCE_SHEET'] = _frame('BALANCE SHEET')
+        self.data['LIQUIDITY'] = _frame('LIQUIDITY_CASHFLOW')
+        self.data['FOOTBALL_FIELD'] = forecast_results.get('FOOTBALL_FIELD') or {}
+        self.data['VALUATION_META'] = {'band_position': vb['band_position']} if vb else {}
         return self.data
 
     def _get_metric(self, df, pattern, year):
@@ -198,6 +217,7 @@ class ReportGenerator:
 
     def save_report(self):
         report_content = self.generate_report()
+        os.makedirs(self.out_dir, exist_ok=True)
         filepath = os.path.join(self.out_dir, "BaoCao_PhanTich_HVN.md")
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(report_content)
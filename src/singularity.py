@@ -0,0 +1,71 @@
+"""
+singularity.py — Điểm kỳ dị WACC-g và Condition Number của lưới DCF
+====================================================================
+Dùng chung cho DiagnosticsEngine.test_singularity (kiểm định) và
+Forecaster.dcf_sensitivity (che ô kỳ dị trực tiếp trên heatmap DCF).
+Mọi bản đồ được tính bằng broadcasting trên lưới (WACC × g), ô kỳ dị
+được trích bằng np.argwhere nên lưới bước 0.1% vẫn tức thì.
+"""
+
+import numpy as np
+
+NEAR_GAP = 0.005   # WACC - g < 0.5% → gần kỳ dị
+
+SINGULAR = 2       # WACC ≤ g: Gordon Growth không xác định
+NEAR_SINGULAR = 1
+
+
+def wacc_g_gap(wacc_vals, g_vals):
+    """Khoảng cách WACC - g trên lưới, shape (W, G)."""
+    return np.asarray(wacc_vals, dtype=float)[:, None] - np.asarray(g_vals, dtype=float)[None, :]
+
+
+def singularity_map(gap, near=NEAR_GAP):
+    """0 = ổn định, 1 = gần kỳ dị (0 < gap < near), 2 = kỳ dị (gap ≤ 0)."""
+    smap = np.zeros(gap.shape, dtype=int)
+    smap[(gap > 0) & (gap < near)] = NEAR_SINGULAR
+    smap[gap <= 0] = SINGULAR
+    return smap
+
+
+def singular_cells(wacc_vals, g_vals, smap, gap_pp, limit=None):
+    """Danh sách ô (gần) kỳ dị theo thứ tự hàng WACC → cột g; gap_pp = khoảng cách (điểm %)."""
+    cells = []
+    for i, j in np.argwhere(smap > 0)[:limit]:
+        cells.append({
+            'wacc': f'{wacc_vals[i]*100:.1f}%',
+            'g': f'{g_vals[j]*100:.1f}%',
+            'type': 'Kỳ dị (WACC ≤ g)' if smap[i, j] == SINGULAR else 'Gần kỳ dị (WACC - g < 0.5%)',
+            'gap': gap_pp[i, j],
+        })
+    return cells
+
+
+def gordon_matrix(wacc_vals, g_vals, fcff_base):
+    """Ma trận DCF đại diện FCFF·(1+g)/(WACC-g); ô WACC ≤ g = NaN."""
+    gap = wacc_g_gap(wacc_vals, g_vals)
+    growth = 1 + np.asarray(g_vals, dtype=float)[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(gap > 0, fcff_base * growth / gap, np.nan)
+
+
+def condition_number(matrix, max_size=10):
+    """
+    Condition number của khối max_size × max_size đầu tiên trong các hàng không có NaN.
+    inf nếu không đủ hàng hợp lệ hoặc không tính được.
+    """
+    try:
+        valid = matrix[~np.isnan(matrix).any(axis=1)]
+        if len(valid) > 1:
+            return float(np.linalg.cond(valid[:min(len(valid), max_size), :min(valid.shape[1], max_size)]))
+        return float('inf')
+    except Exception:
+        return float('inf')
+
+
+def stability_label(cond_number):
+    if cond_number < 100:
+        return 'Ổn định (Well-conditioned)'
+    if cond_number < 1000:
+        return 'Chấp nhận được (Moderate conditioning)'
+    return 'Không ổn định (Ill-conditioned)'
@@ -0,0 +1,123 @@
+"""
+stage_cache.py — Bộ nhớ đệm kết quả Stage theo dấu vân tay (fingerprint) nội dung
+==================================================================================
+Fingerprint của một stage = SHA-256 của:
+  - tên stage + phiên bản mã nguồn (hash toàn bộ src/*.py)
+  - các tham số đầu vào; tham số là đường dẫn file (vd: data/hvn.xlsx) được băm theo NỘI DUNG file
+  - fingerprint của các stage phía trên (kiểu cây Merkle)
+
+Vì vậy chỉ các stage nằm dưới một đầu vào thay đổi mới phải chạy lại
+(vd: sửa file macro → Stage 1.1 trở xuống; Stage 1 đọc hvn.xlsx vẫn cache hit).
+Kết quả được lưu nguyên dạng Python (pickle) trong output/.cache/ nên
+stage sau nhận đúng những gì nó nhận được khi stage trước chạy thật.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def code_version(src_dir=SRC_DIR):
+    """Hash mã nguồn pipeline: sửa bất kỳ module nào trong src/ đều làm mất hiệu lực cache."""
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(src_dir, "*.py"))):
+        h.update(os.path.basename(path).encode('utf-8'))
+        h.update(_file_digest(path).encode('ascii'))
+    return h.hexdigest()
+
+
+def _param_token(value):
+    if isinstance(value, str) and os.path.isfile(value):
+        return {'file': value, 'sha256': _file_digest(value)}
+    return repr(value)
+
+
+class StageCache:
+    """Cache kết quả stage trong một thư mục (mặc định output/.cache)."""
+
+    def __init__(self, root="output/.cache"):
+        self.root = root
+        self.version = code_version()
+        self._file_tokens = {}
+
+    def _meta_path(self, name):
+        return os.path.join(self.root, f"stage_{name}.json")
+
+    def _data_path(self, name):
+        return os.path.join(self.root, f"stage_{name}.pkl")
+
+    def _token(self, value):
+        # Bộ file export SSI: dict sheet → đường dẫn
+        if isinstance(value, dict):
+            return {str(k): self._token(v) for k, v in sorted(value.items())}
+        if isinstance(value, (list, tuple)):
+            return [self._token(v) for v in value]
+        # Mỗi file chỉ băm một lần cho mỗi lượt chạy (hvn.xlsx dùng chung cho nhiều stage)
+        if isinstance(value, str) and os.path.isfile(value):
+            if value not in self._file_tokens:
+                self._file_tokens[value] = _param_token(value)
+            return self._file_tokens[value]
+        return _param_token(value)
+
+    def fingerprint(self, name, params, upstream):
+        payload = {
+            'stage': name,
+            'code': self.version,
+            'params': {k: self._token(v) for k, v in sorted(params.items())},
+            'upstream': list(upstream),
+        }
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def meta(self, name):
+        path = self._meta_path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, name, fingerprint):
+        """Kết quả đã lưu nếu fingerprint khớp, ngược lại None."""
+        meta = self.meta(name)
+        if not meta or meta.get('fingerprint') != fingerprint or not os.path.exists(self._data_path(name)):
+            return None
+        try:
+            with open(self._data_path(name), 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"  → Cảnh báo: Cache Stage {name} hỏng ({e}), chạy lại.")
+            return None
+
+    def save(self, name, fingerprint, outputs, persisted=False):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._data_path(name), 'wb') as f:
+            pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.mark(name, fingerprint, persisted)
+
+    def mark(self, name, fingerprint, persisted):
+        """Ghi meta; persisted cho biết artifact ở output/ đã khớp với fingerprint này chưa."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._meta_path(name), 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'persisted': persisted}, f, indent=4)
+
+    def clear(self):
+        if not os.path.exists(self.root):
+            return
+        for f in os.listdir(self.root):
+            if f.startswith("stage_"):
+                os.remove(os.path.join(self.root, f))
@@ -0,0 +1,246 @@
+"""
+stage_graph.py — Khai báo Pipeline dưới dạng DAG và bộ lập lịch song song
+=========================================================================
+Mỗi Stage khai báo rõ:
+  - inputs  : tên các giá trị nó cần (output của stage khác hoặc tham số ban đầu)
+  - outputs : tên các giá trị nó sinh ra (hàm stage trả về dict đúng các khoá này)
+
+Quan hệ phụ thuộc được suy ra từ inputs/outputs. Bộ lập lịch chạy mọi stage
+đã đủ đầu vào cùng lúc trên một process pool (vd: 2.5 / 3 / 4.1 cùng chờ Stage 2),
+rồi đồng bộ trước các stage cần kết quả của chúng (Stage 5).
+Sau khi chạy: thời gian từng stage + đường găng (critical path).
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import instrumentation
+
+
+class Stage:
+    """Một nút của DAG. func phải là hàm cấp module (để pickle sang process con)."""
+
+    def __init__(self, name, title, func, inputs=(), outputs=(), required=True, untracked=()):
+        self.name = name
+        self.title = title
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        # Đầu vào không ảnh hưởng kết quả (vd: số process) → không đưa vào fingerprint cache
+        self.untracked = tuple(untracked)
+        # required=False: lỗi chỉ được ghi log, các stage sau vẫn chạy với giá trị mặc định
+        self.required = required
+
+
+def _call_stage(func, kwargs, name=None):
+    """
+    Chạy trong process con: trả về (outputs, thời gian chạy thực của riêng hàm stage,
+    các span đo đạc sinh ra trong lúc chạy — process chính ghép lại vào trace).
+    """
+    label = f"Stage {name}" if name else func.__name__
+    start = time.time()
+    with instrumentation.span(label, cat='stage'), instrumentation.profiled(f"stage_{name or func.__name__}"):
+        outputs = func(**kwargs)
+    return outputs or {}, time.time() - start, instrumentation.drain()
+
+
+class StageGraph:
+    def __init__(self, stages):
+        self.stages = {s.name: s for s in stages}
+        self.order = [s.name for s in stages]
+        producers = {}
+        for s in stages:
+            for out in s.outputs:
+                if out in producers:
+                    raise ValueError(f"Output '{out}' được sinh bởi cả Stage {producers[out]} và Stage {s.name}")
+                producers[out] = s.name
+        self.producers = producers
+        self.deps = {
+            s.name: sorted({producers[i] for i in s.inputs if i in producers}, key=self.order.index)
+            for s in stages
+        }
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        """Thứ tự topo, giữ nguyên thứ tự khai báo khi không có ràng buộc."""
+        seen, visiting, order = set(), set(), []
+
+        def visit(name):
+            if name in seen:
+                return
+            if name in visiting:
+                raise ValueError(f"DAG có chu trình tại Stage {name}")
+            visiting.add(name)
+            for dep in self.deps[name]:
+                visit(dep)
+            visiting.discard(name)
+            seen.add(name)
+            order.append(name)
+
+        for name in self.order:
+            visit(name)
+        return order
+
+    def subgraph(self, targets):
+        """DAG con gồm các stage trong targets và toàn bộ stage phía trên chúng."""
+        keep = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in self.stages:
+                raise ValueError(f"Không có Stage {name}")
+            if name not in keep:
+                keep.add(name)
+                stack.extend(self.deps[name])
+        return StageGraph([self.stages[n] for n in self.order if n in keep])
+
+    # =====================================================================
+    # SCHEDULER
+    # =====================================================================
+    def run(self, values, max_workers=None, parallel=True, on_start=None, on_done=None, cache=None):
+        """
+        Chạy toàn bộ DAG. `values` chứa tham số ban đầu + giá trị mặc định của các output;
+        được cập nhật tại chỗ khi từng stage hoàn thành.
+        cache (StageCache, tuỳ chọn): stage có fingerprint khớp được nạp lại thay vì chạy.
+        on_done(stage, outputs, info) nhận info = stats của stage đó.
+        Trả về dict name → {'start', 'end', 'duration', 'error', 'cached', 'fingerprint'}
+        (giây, tính từ lúc bắt đầu).
+        """
+        t0 = time.time()
+        pending = list(self.order)
+        finished = set()
+        running = {}   # future → (stage name, thời điểm submit)
+        stats = {}
+        fingerprints = {}
+        uncacheable = set()   # stage lỗi và mọi stage phía dưới nó
+        executor = None
+
+        def fingerprint(stage):
+            if cache is None or any(d in uncacheable for d in self.deps[stage.name]):
+                return None
+            params = {i: values.get(i) for i in stage.inputs
+                      if i not in self.producers and i not in stage.untracked}
+            return cache.fingerprint(stage.name, params, [fingerprints[d] for d in self.deps[stage.name]])
+
+        def complete(name, outputs, started, duration, error, cached=False):
+            stage = self.stages[name]
+            fp = fingerprints.get(name)
+            stats[name] = {
+                'start': started - t0, 'end': time.time() - t0,
+                'duration': duration, 'error': error,
+                'cached': cached, 'fingerprint': fp,
+            }
+            if error is None:
+                values.update({k: v for k, v in outputs.items() if k in stage.outputs})
+                if fp is not None and not cached:
+                    cache.save(name, fp, outputs)
+            else:
+                uncacheable.add(name)
+            finished.add(name)
+            if on_done:
+                on_done(stage, outputs if error is None else {}, stats[name])
+            if error is not None and stage.required:
+                raise error
+
+        def run_inline(name):
+            stage = self.stages[name]
+            kwargs = {i: values.get(i) for i in stage.inputs}
+            started = time.time()
+            try:
+                outputs, duration, spans = _call_stage(stage.func, kwargs, name)
+                instrumentation.merge(spans)
+            except Exception as e:
+                complete(name, {}, started, time.time() - started, e)
+                return
+            complete(name, outputs, started, duration, None)
+
+        try:
+            while pending or running:
+                batch = [n for n in pending if all(d in finished for d in self.deps[n])]
+                for name in batch:
+                    pending.remove(name)
+                    if on_start:
+                        on_start(self.stages[name])
+
+                # Stage có fingerprint khớp cache → nạp lại kết quả, không chạy
+                misses = []
+                for name in batch:
+                    fp = fingerprints[name] = fingerprint(self.stages[name])
+                    if fp is None:
+                        if cache is not None:
+                            uncacheable.add(name)
+                        misses.append(name)
+                        continue
+                    cached = cache.load(name, fp)
+                    if cached is None:
+                        misses.append(name)
+                        continue
+                    complete(name, cached, time.time(), 0.0, None, cached=True)
+                batch = misses
+                if not batch and not running:
+                    continue
+
+                # Chỉ một stage sẵn sàng và không có gì đang chạy → chạy ngay trong process chính
+                if not parallel or (len(batch) == 1 and not running):
+                    for name in batch:
+                        run_inline(name)
+                    continue
+
+                if batch and executor is None:
+                    executor = _make_executor(max_workers)
+                    if executor is None:
+                        parallel = False
+                        for name in batch:
+                            run_inline(name)
+                        continue
+                for name in batch:
+                    stage = self.stages[name]
+                    kwargs = {i: values.get(i) for i in stage.inputs}
+                    running[executor.submit(_call_stage, stage.func, kwargs, name)] = (name, time.time())
+
+                if not running:
+                    continue
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name, started = running.pop(fut)
+                    try:
+                        outputs, duration, spans = fut.result()
+                        instrumentation.merge(spans)
+                    except Exception as e:
+                        complete(name, {}, started, time.time() - started, e)
+                        continue
+                    complete(name, outputs, started, duration, None)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        return stats
+
+    # =====================================================================
+    # CRITICAL PATH
+    # =====================================================================
+    def critical_path(self, durations):
+        """Đường dài nhất (theo tổng thời gian) qua DAG. Trả về (danh sách stage, tổng giây)."""
+        best = {}   # name → (tổng thời gian tới hết stage, stage liền trước)
+        for name in self.order:
+            d = durations.get(name, 0.0)
+            prev = max(self.deps[name], key=lambda p: best[p][0], default=None)
+            best[name] = ((best[prev][0] if prev else 0.0) + d, prev)
+
+        if not best:
+            return [], 0.0
+        last = max(self.order, key=lambda n: best[n][0])
+        total = best[last][0]
+        path = []
+        while last is not None:
+            path.append(last)
+            last = best[last][1]
+        return path[::-1], total
+
+
+def _make_executor(max_workers):
+    try:
+        return ProcessPoolExecutor(max_workers=max_workers)
+    except (OSError, NotImplementedError, ImportError) as e:
+        print(f"  → Cảnh báo: Không tạo được process pool ({e}), chạy tuần tự.")
+        return None
@@ -0,0 +1,163 @@
+"""
+ttm.py — Số liệu quý: luỹ kế 12 tháng gần nhất (TTM) bằng kernel cửa sổ trượt
+===========================================================================
+Với báo cáo quý (trục kỳ QUARTERLY), mỗi bảng được biến đổi MỘT lần trên cả ma
+trận (mọi Khoản mục × mọi quý) bằng cửa sổ trượt 4 quý:
+  - Bảng dòng chảy (KQKD, LCTT): TTM = tổng 4 quý liên tiếp
+  - Bảng số dư (CĐKT)         : bình quân 4 quý (mẫu số cho ROA/ROE TTM)
+Quý thiếu trong cửa sổ (chuỗi không liên tục) → NaN thay vì cộng nhầm 4 quý rời.
+
+Kết quả được ghi nhớ theo nội dung bảng (nhãn kỳ, Khoản mục, giá trị) nên các chỉ số
+TTM chỉ tra dòng trên bảng đã tính sẵn, không chạy lại cửa sổ trượt cho từng chỉ số.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from line_items import find_row
+from period_axis import ITEM_COL, attach_period_axis, get_period_axis
+
+TTM_WINDOW = 4
+
+# Bảng nguồn → (tên bảng TTM, cách gộp)
+TTM_SHEETS = {
+    'INCOME STATEMENT': ('IS_TTM', 'sum'),
+    'CASH FLOW STATEMENT': ('CF_TTM', 'sum'),
+    'BALANCE SHEET': ('BS_TTM_AVG', 'mean'),
+}
+
+# Chỉ số TTM: (tên, (bảng TTM, pattern tử số), (bảng TTM, pattern mẫu số), hệ số)
+TTM_RATIOS = [
+    ('Biên lãi gộp TTM (%)', ('IS_TTM', r'^Lãi gộp$'), ('IS_TTM', r'^Doanh số thuần$'), 100),
+    ('Biên EBIT TTM (%)', ('IS_TTM', r'^EBIT$'), ('IS_TTM', r'^Doanh số thuần$'), 100),
+    ('Biên LN ròng TTM (%)', ('IS_TTM', r'^Lãi/\(lỗ\) thuần sau thuế$'), ('IS_TTM', r'^Doanh số thuần$'), 100),
+    ('ROA TTM (%)', ('IS_TTM', r'^Lãi/\(lỗ\) thuần sau thuế$'), ('BS_TTM_AVG', r'^TỔNG TÀI SẢN$'), 100),
+    ('ROE TTM (%)', ('IS_TTM', r'^Lãi/\(lỗ\) thuần sau thuế$'), ('BS_TTM_AVG', r'^VỐN CHỦ SỞ HỮU$'), 100),
+    ('Vòng quay tài sản TTM (x)', ('IS_TTM', r'^Doanh số thuần$'), ('BS_TTM_AVG', r'^TỔNG TÀI SẢN$'), 1),
+    ('OCF / Doanh thu TTM (%)', ('CF_TTM', r'^Lưu chuyển tiền thuần từ các hoạt động sản xuất kinh doanh$'),
+     ('IS_TTM', r'^Doanh số thuần$'), 100),
+]
+
+_CACHE = OrderedDict()
+_CACHE_SIZE = 32
+
+
+# =============================================================================
+# KERNEL CỬA SỔ TRƯỢT
+# =============================================================================
+def _rolling(values, window, reducer):
+    """Gộp `window` kỳ liên tiếp theo trục cuối; `window - 1` kỳ đầu = NaN."""
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    if values.shape[-1] >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=-1)
+        out[..., window - 1:] = reducer(windows, axis=-1)
+    return out
+
+
+def rolling_sum(values, window=TTM_WINDOW):
+    return _rolling(values, window, np.sum)
+
+
+def rolling_mean(values, window=TTM_WINDOW):
+    return _rolling(values, window, np.mean)
+
+
+def contiguous_windows(keys, window=TTM_WINDOW):
+    """Mask (T,): True nếu cửa sổ kết thúc tại kỳ t gồm đúng `window` quý liên tiếp."""
+    ordinal = np.array([y * 4 + q - 1 for y, q in keys], dtype=int)
+    ok = np.zeros(len(ordinal), dtype=bool)
+    if len(ordinal) >= window:
+        ok[window - 1:] = (ordinal[window - 1:] - ordinal[:len(ordinal) - window + 1]) == window - 1
+    return ok
+
+
+# =============================================================================
+# BẢNG TTM
+# =============================================================================
+def _cache_key(periods, items, vals, how):
+    h = hashlib.sha256()
+    h.update(repr((list(periods), how)).encode('utf-8'))
+    h.update('\x1f'.join(map(str, items)).encode('utf-8'))
+    h.update(np.ascontiguousarray(vals).tobytes())
+    return h.hexdigest()
+
+
+def ttm_frame(df, how='sum'):
+    """
+    Bảng TTM của một báo cáo quý ('sum' cho dòng chảy, 'mean' cho số dư).
+    None nếu df không phải số liệu quý. Bảng trả về dùng chung — nơi gọi không sửa tại chỗ.
+    """
+    axis = get_period_axis(df)
+    if df is None or not axis.is_quarterly:
+        return None
+    periods = axis.periods
+    vals = df[periods].to_numpy(dtype=float)
+    items = df[ITEM_COL].to_numpy() if ITEM_COL in df.columns else np.arange(len(df))
+
+    key = _cache_key(periods, items, vals, how)
+    if key in _CACHE:
+        _CACHE.move_to_end(key)
+        return _CACHE[key]
+
+    reducer = rolling_sum if how == 'sum' else rolling_mean
+    out = reducer(vals)
+    out[:, ~contiguous_windows(axis.keys)] = np.nan
+
+    result = pd.DataFrame(out, columns=periods)
+    result.insert(0, ITEM_COL, items)
+    attach_period_axis(result)
+
+    _CACHE[key] = result
+    while len(_CACHE) > _CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return result
+
+
+def ttm_frames(dfs):
+    """{tên bảng TTM: DataFrame} cho mọi báo cáo quý có trong dfs."""
+    out = {}
+    for sheet, (name, how) in TTM_SHEETS.items():
+        frame = ttm_frame(dfs.get(sheet), how)
+        if frame is not None:
+            out[name] = frame
+    return out
+
+
+def ttm_ratios(ttm):
+    """Các chỉ số TTM tính một lượt trên ma trận tử số / mẫu số (tra dòng từ bảng TTM có sẵn)."""
+    frames = [f for f in ttm.values() if f is not None]
+    if not frames:
+        return None
+    # Kỳ có mặt ở mọi bảng TTM (CĐKT và KQKD có thể lệch quý đầu/cuối)
+    shared = set.intersection(*(set(get_period_axis(f).periods) for f in frames))
+    periods = [p for p in get_period_axis(frames[0]).periods if p in shared]
+
+    names, num, den, scale = [], [], [], []
+    for name, (num_sheet, num_pat), (den_sheet, den_pat), factor in TTM_RATIOS:
+        num_row = find_row(ttm.get(num_sheet), num_pat)
+        den_row = find_row(ttm.get(den_sheet), den_pat)
+        if num_row is None or den_row is None:
+            continue
+        names.append(name)
+        num.append(num_row[periods].to_numpy(dtype=float))
+        den.append(den_row[periods].to_numpy(dtype=float))
+        scale.append(factor)
+    if not names:
+        return None
+
+    num, den = np.array(num), np.array(den)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.where(den != 0, num / den, np.nan) * np.array(scale, dtype=float)[:, None]
+
+    result = pd.DataFrame(np.round(ratios, 2), columns=periods)
+    result.insert(0, ITEM_COL, names)
+    attach_period_axis(result)
+    return result
+
+
+def clear_cache():
+    _CACHE.clear()
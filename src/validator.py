@@ -1,13 +1,15 @@
 import pandas as pd
+from line_items import find_row
+from period_axis import get_period_axis
 
 class Validator:
     def __init__(self, dfs_dict):
         self.dfs = dfs_dict
         
     def _get_row_vals(self, df, pattern, years):
-        row = df[df['Khoản mục'].str.contains(pattern, case=False, na=False, regex=True)]
-        if not row.empty:
-            return row.iloc[0][years].fillna(0)
+        row = find_row(df, pattern)
+        if row is not None:
+            return row[years].fillna(0)
         return pd.Series(0, index=years)
 
     def run_checks(self):
@@ -18,7 +20,7 @@ class Validator:
             print("Missing files for validation.")
             return
             
-        years = [col for col in bs.columns if col != 'Khoản mục']
+        years = get_period_axis(bs).periods
         
         print("\n--- KẾT QUẢ KIỂM ĐỊNH (INTEGRITY VALIDATION) ---")
         